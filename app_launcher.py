@@ -6,6 +6,7 @@ import threading
 import webbrowser
 import signal
 import atexit
+import urllib.request
 from pathlib import Path
 
 # 设置工作目录和模块路径
@@ -126,7 +127,14 @@ def main():
         server_thread.start()
         
         print("等待服务启动...")
-        time.sleep(5)
+        # 知识库组件延迟初始化，服务启动后即可响应健康检查
+        deadline = time.time() + 30
+        while time.time() < deadline and server_thread.is_alive():
+            try:
+                with urllib.request.urlopen("http://127.0.0.1:8000/health", timeout=1):
+                    break
+            except Exception:
+                time.sleep(0.2)
         
         def open_browser():
             if not server_should_stop:
@@ -6,6 +6,9 @@ except ImportError:
 from typing import Optional
 import os
 
+# 后端数据目录（backend/data）
+DEFAULT_DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+
 
 class Settings(BaseSettings):
     """应用设置"""
@@ -31,16 +34,110 @@ class Settings(BaseSettings):
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     upload_dir: str = "uploads"
     
+    # 本地数据目录（知识库分组、嵌入缓存等）
+    data_dir: str = DEFAULT_DATA_DIR
+    
     # OpenAI默认设置
     default_model: str = "gpt-3.5-turbo"
     
-    # Milvus配置
+    # 知识库后端: "milvus" 或 "local"（进程内向量存储，数据保存在 data_dir 下）
+    knowledge_base_backend: str = "milvus"
+    
+    # Milvus配置（enable_milvus 为 False 时使用本地向量存储）
     enable_milvus: bool = True
     milvus_uri: str = "tcp://192.168.1.134:19530"  # 使用Milvus Standalone服务器
     milvus_collection_name: str = "bid_knowledge_base"
     milvus_index_type: str = "IVF_FLAT"
     milvus_index_params: dict = {"nlist": 128}
     milvus_search_params: dict = {"nprobe": 10}
+    milvus_health_check_interval: float = 15.0  # 连接健康检查间隔（秒）
+    milvus_reconnect_max_backoff: float = 30.0  # 重连最大退避时间（秒）
+    milvus_expr_batch_size: int = 256  # 批量删除/查询时每个 doc_id in [...] 表达式包含的ID数
+    milvus_search_batch_size: int = 64  # 多向量检索时每次 search 请求包含的查询向量数
+    milvus_strong_consistency_seconds: float = 10.0  # 写入后该时间（秒）内的检索使用 Strong 一致性
+    milvus_lazy_partition_load: bool = False  # 分组分区按需加载（只加载被检索的分区）
+    milvus_max_loaded_partitions: int = 16  # 按需加载模式下同时加载的分区数上限
+    milvus_auto_migrate: bool = True  # 嵌入模型或维度变化时自动在后台迁移到新的版本化集合
+    milvus_migration_batch_size: int = 512  # 迁移时每批读取并重新嵌入的条目数
+    milvus_migration_rows_per_second: float = 0  # 迁移限速（行/秒），0 表示不限速
+    milvus_keep_old_collection: bool = True  # 迁移完成后保留旧集合（便于回退）
+    
+    # 知识库导入配置
+    kb_chunk_max_tokens: int = 240  # 分块最大token数（all-MiniLM-L6-v2 最多编码256个token）
+    kb_chunk_overlap_tokens: int = 40  # 相邻分块重叠token数
+    kb_insert_batch_size: int = 256  # 每次嵌入并插入的条目数
+    kb_ingest_concurrency: int = 2  # 后台导入任务并发数
+    kb_warmup_on_startup: bool = False  # 启动后在后台预热知识库、嵌入模型、词法索引和重排序模型
+    kb_executor_workers: int = 8  # 知识库异步接口专用线程池大小
+    kb_search_concurrency: int = 8  # 同时执行的检索数
+    kb_read_concurrency: int = 4  # 同时执行的查询（按ID查询、计数等）数
+    kb_write_concurrency: int = 2  # 同时执行的写入（插入、删除、清空）数
+    kb_ready_timeout: float = 30.0  # 知识库接口等待组件就绪的最长时间（秒），超时返回503
+    kb_hybrid_candidates: int = 20  # 混合检索每路召回的候选数
+    kb_hybrid_budget_ms: float = 150.0  # 混合检索延迟预算，词法检索超时则仅用向量结果
+    kb_rrf_k: int = 60  # 倒数排名融合常数
+    
+    # 章节生成参考资料打包配置（MMR 去冗余 + token 预算）
+    kb_reference_candidates: int = 10  # 参与打包的检索候选数（启用重排序时为重排序后保留的候选数）
+    kb_reference_token_budget: int = 800  # 提示词中知识库参考内容的估算 token 上限
+    kb_reference_max_items: int = 5  # 最多选取的参考条目数
+    kb_reference_mmr_lambda: float = 0.7  # MMR 相关性权重，越小越偏向多样性
+    kb_reference_redundancy_threshold: float = 0.95  # 与已选条目的余弦相似度达到该值时视为冗余直接丢弃
+    
+    # 相似章节检索配置（使用已存储的向量，不经过嵌入模型）
+    kb_similar_cache_entries: int = 512  # 缓存已读取向量的文档数
+    kb_similar_max_candidates: int = 1000  # 检索深度上限（需多取文档自身分块数量的结果再过滤）
+    
+    # 导入去重配置（内容哈希精确去重 + MinHash 近重复检测，重复分块链接到已有条目）
+    kb_dedup_enabled: bool = True
+    kb_dedup_scope: str = "group"  # "group" 只在同一分组内去重；"global" 跨分组去重（按分组检索时检索不到链接到其他分组的分块）
+    kb_dedup_threshold: float = 0.9  # 估计的 Jaccard 相似度达到该值视为近重复
+    kb_dedup_num_perm: int = 64  # MinHash 签名长度
+    kb_dedup_bands: int = 16  # LSH 分段数（需整除签名长度）
+    kb_dedup_shingle_size: int = 5  # 字符 shingle 长度
+    
+    # 知识库分组存储配置（SQLite，WAL 模式）
+    kb_groups_db: str = ""  # 分组数据库文件，为空时使用 data/knowledge_groups.db（首次启动时导入 knowledge_groups.json）
+    kb_groups_db_timeout: float = 30.0  # 等待其他进程释放写锁的最长时间（秒）
+    
+    # 知识库快照配置（导出/恢复向量与元数据，恢复时不重新嵌入）
+    kb_snapshot_dir: str = ""  # 快照目录，为空时使用 data_dir/snapshots
+    kb_snapshot_batch_size: int = 2048  # 导出时每批读取、恢复时每批插入的条目数
+    kb_snapshot_dtype: str = "float32"  # 默认向量精度："float32" 或 "float16"（文件减半，恢复后精度略有损失）
+    
+    # 本地向量存储配置
+    local_store_index: str = "flat"  # "flat" 精确检索，或 "ivf" 倒排索引
+    local_store_ivf_min_rows: int = 20000  # 行数达到该值后才启用IVF索引
+    local_store_nlist: int = 0  # IVF聚类数，0 表示按 4*sqrt(行数) 自动选择
+    local_store_nprobe: int = 8  # IVF检索的聚类数
+    
+    # 嵌入模型配置
+    embedding_model_name: str = "all-MiniLM-L6-v2"
+    embedding_max_batch_size: int = 32  # 微批次最大文本数
+    embedding_max_wait_ms: float = 5.0  # 微批次最长等待时间（毫秒）
+    embedding_runtime: str = "torch"  # "torch" 全精度，"int8" PyTorch 动态量化，"onnx" ONNX Runtime
+    embedding_model_path: str = ""  # 本地模型目录（int8 / onnx 运行时使用），为空时使用模型名称
+    embedding_onnx_file: str = "model.onnx"  # 模型目录中的 ONNX 文件，如量化后的 model_quantized.onnx
+    embedding_max_seq_length: int = 256  # ONNX 运行时的最大序列长度
+    embedding_num_threads: int = 0  # 推理线程数，0 表示使用运行时默认值
+    
+    # 嵌入缓存配置（进程内LRU + 磁盘内存映射存储）
+    embedding_cache_enabled: bool = True
+    embedding_cache_memory_entries: int = 10000  # 内存LRU最大条目数
+    embedding_cache_disk_entries: int = 200000  # 磁盘存储最大条目数，超出后淘汰最早写入的条目
+    
+    # 检索结果缓存配置（知识库写入后自动失效）
+    search_cache_enabled: bool = True
+    search_cache_max_entries: int = 2048  # 最大缓存条目数，超出后淘汰最久未使用的条目
+    search_cache_ttl_seconds: float = 300.0  # 条目有效期（秒）
+    
+    # 重排序配置（CPU 交叉编码器，用于章节生成的参考资料检索）
+    reranker_enabled: bool = False
+    reranker_model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # 支持中文的多语言小模型
+    reranker_candidates: int = 20  # 重排序前召回的候选数
+    reranker_batch_size: int = 8  # 每批打分的候选数
+    reranker_max_length: int = 256  # 查询+候选的最大token数
+    reranker_budget_ms: float = 300.0  # 单次查询的重排序时间预算，超时回退到向量检索顺序
     
     class Config:
         env_file = ".env"
@@ -1,20 +1,35 @@
 """FastAPI应用主入口"""
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 import os
 import fastapi.middleware.cors
 import starlette.middleware.cors
 
 from .config import settings
 from .routers import config, document, outline, content, search, expand, knowledge_base
+from .services.ingestion_jobs import ingestion_job_manager
+from .services.warmup import warmup_manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动和停止知识库后台导入任务，按配置在后台预热知识库组件"""
+    if settings.kb_warmup_on_startup:
+        warmup_manager.start()
+    await ingestion_job_manager.start()
+    yield
+    await ingestion_job_manager.stop()
+
 
 # 创建FastAPI应用实例
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
-    description="基于FastAPI的AI写标书助手后端API"
+    description="基于FastAPI的AI写标书助手后端API",
+    lifespan=lifespan
 )
 
 # 添加CORS中间件
@@ -45,6 +60,16 @@ async def health_check():
         "version": settings.app_version
     }
 
+# 就绪检查端点
+@app.get("/ready")
+async def readiness_check():
+    """知识库组件就绪状态，全部就绪返回200，否则返回503
+
+    未启用启动预热时，尚未使用的组件标记为 lazy（首次使用时初始化），不影响就绪状态。
+    """
+    status = warmup_manager.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 # 静态文件服务（用于服务前端构建文件）
 if os.path.exists("static"):
     # 挂载静态资源文件夹
@@ -61,7 +86,7 @@ if os.path.exists("static"):
     async def serve_react_app(full_path: str):
         """处理React路由，所有非API路径都返回index.html"""
         # 排除API路径
-        if full_path.startswith("api/") or full_path.startswith("docs") or full_path.startswith("health"):
+        if full_path.startswith("api/") or full_path.startswith("docs") or full_path.startswith("health") or full_path.startswith("ready"):
             # 这些路径应该由FastAPI处理，如果到这里说明404
             from fastapi import HTTPException
             raise HTTPException(status_code=404, detail="API endpoint not found")
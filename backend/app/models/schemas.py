@@ -87,6 +87,16 @@ class ChapterContentRequest(BaseModel):
     prompt: Optional[str] = Field(None, description="章节自定义提示词")
 
 
+class BatchSearchRequest(BaseModel):
+    """知识库批量检索请求"""
+    queries: List[str] = Field(..., description="查询文本列表（如提纲全部叶子章节的检索文本）", max_length=1000)
+    top_k: int = Field(5, description="每个查询返回结果数量", ge=1, le=50)
+    keyword: Optional[str] = Field(None, description="标题关键词过滤条件，作用于全部查询")
+    groups: Optional[List[str]] = Field(None, description="只检索这些分组中的文档")
+    level: str = Field("fine", description="检索粒度: fine 检索分块与长文本窗口，coarse 检索分块与长文本整体",
+                       pattern="^(fine|coarse)$")
+
+
 class ErrorResponse(BaseModel):
     """错误响应"""
     error: str
@@ -2,13 +2,22 @@
 # -*- coding: utf-8 -*-
 """知识库管理API路由"""
 
-import uuid
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
-from typing import List, Dict, Any
+import json
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Depends
+from typing import List, Dict, Any, Optional
 
-from ..services.milvus_service import knowledge_base
+from ..models.schemas import BatchSearchRequest
+from ..services.knowledge_base import knowledge_base
+from ..services.knowledge_base_async import async_knowledge_base, OP_READ, OP_WRITE
+from ..services.embedding_service import embedding_service
 from ..services.knowledge_group_manager import KnowledgeGroupManager
-from ..services.file_service import FileService
+from ..services.ingestion_jobs import ingestion_job_manager, MODE_UPSERT
+from ..services.reranker_service import reranker_service
+from ..services.reference_packer import reference_packer
+from ..services.kb_snapshot import kb_snapshots
+from ..services.warmup import warmup_manager
+from ..config import settings
+from ..utils.sse import sse_response
 
 router = APIRouter(prefix="/api/knowledge-base", tags=["知识库管理"])
 
@@ -16,7 +25,20 @@ router = APIRouter(prefix="/api/knowledge-base", tags=["知识库管理"])
 group_manager = KnowledgeGroupManager()
 
 
-@router.post("/documents")
+async def require_knowledge_base():
+    """等待知识库后端就绪（首次访问时触发初始化），超时返回503"""
+    if not await warmup_manager.wait_async("knowledge_base", settings.kb_ready_timeout):
+        raise HTTPException(status_code=503, detail="知识库正在初始化，请稍后重试")
+
+
+async def require_search_components():
+    """检索还需要嵌入模型就绪"""
+    await require_knowledge_base()
+    if not await warmup_manager.wait_async("embedding_model", settings.kb_ready_timeout):
+        raise HTTPException(status_code=503, detail="嵌入模型正在加载，请稍后重试")
+
+
+@router.post("/documents", dependencies=[Depends(require_knowledge_base)])
 async def add_documents(documents: List[Dict[str, Any]]):
     """向知识库添加文档
     
@@ -27,13 +49,17 @@ async def add_documents(documents: List[Dict[str, Any]]):
         操作结果
     """
     try:
-        knowledge_base.add_documents(documents)
-        return {"success": True, "message": f"成功添加 {len(documents)} 个文档到知识库"}
+        result = await async_knowledge_base.add_documents(documents)
+        return {
+            "success": True,
+            "message": f"成功添加 {len(documents)} 个文档到知识库",
+            "deduplicated": result["deduplicated"]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"添加文档失败: {str(e)}")
 
 
-@router.delete("/documents")
+@router.delete("/documents", dependencies=[Depends(require_knowledge_base)])
 async def delete_document(doc_id: str = Query(..., description="文档ID")):
     """删除指定ID的文档
     
@@ -45,47 +71,129 @@ async def delete_document(doc_id: str = Query(..., description="文档ID")):
     """
     try:
         # 删除Milvus中的文档
-        knowledge_base.delete_document(doc_id)
+        await async_knowledge_base.delete_document(doc_id)
         
         # 从分组管理中移除文档
-        group_manager.remove_document_from_group(doc_id)
+        await async_knowledge_base.run(OP_WRITE, group_manager.remove_document_from_group, doc_id)
         
         return {"success": True, "message": f"成功删除文档: {doc_id}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"删除文档失败: {str(e)}")
 
 
-@router.get("/search")
+@router.get("/documents/{doc_id}/similar", dependencies=[Depends(require_knowledge_base)])
+async def get_similar_documents(
+    doc_id: str,
+    top_k: int = Query(5, description="返回结果数量", ge=1, le=50),
+    groups: Optional[List[str]] = Query(None, description="只检索这些分组中的文档"),
+    chunk_id: Optional[str] = Query(None, description="以文档中指定分块的向量检索，默认使用整个文档")
+):
+    """查找与已入库文档（或其中某个分块）相似的章节
+    
+    直接使用已存储的向量检索，不经过嵌入模型，结果不包含文档自身。
+    
+    Returns:
+        搜索结果列表，字段同 /search
+    """
+    try:
+        results = await async_knowledge_base.similar_documents(doc_id, top_k, groups, chunk_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"检索相似章节失败: {str(e)}")
+    if results is None:
+        raise HTTPException(status_code=404, detail="文档或分块不存在")
+    return {"success": True, "doc_id": doc_id, "results": results}
+
+
+@router.get("/search", dependencies=[Depends(require_search_components)])
 async def search_knowledge_base(
     query: str = Query(..., description="搜索查询"),
-    top_k: int = Query(5, description="返回结果数量", ge=1, le=20)
+    top_k: int = Query(5, description="返回结果数量", ge=1, le=20),
+    mode: str = Query("vector", description="检索模式: vector / lexical / hybrid", pattern="^(vector|lexical|hybrid)$"),
+    keyword: Optional[str] = Query(None, description="标题关键词（vector 模式为过滤条件，hybrid 模式为加权词项）"),
+    rerank: bool = Query(False, description="是否使用交叉编码器重排序"),
+    groups: Optional[List[str]] = Query(None, description="只检索这些分组中的文档"),
+    level: str = Query("fine", description="检索粒度: fine / coarse", pattern="^(fine|coarse)$")
 ):
     """搜索知识库
     
     Args:
         query: 搜索查询
         top_k: 返回结果数量
+        mode: 检索模式，vector 为向量检索，lexical 为 BM25 词法检索，hybrid 为两者的倒数排名融合
+        keyword: 标题关键词
+        rerank: 是否多召回候选并用交叉编码器重排序（未启用重排序时按检索顺序返回）
+        groups: 分组名称列表，只检索这些分组对应的分区
+        level: 检索粒度，fine 命中长文本中最相关的窗口，coarse 按长文本整体（池化向量）匹配
     
     Returns:
         搜索结果列表
     """
     try:
-        results = knowledge_base.search(query, top_k)
-        return {"success": True, "results": results}
+        final_top_k = top_k
+        if rerank and reranker_service.available:
+            top_k = max(top_k, settings.reranker_candidates)
+        
+        if mode == "hybrid":
+            results = await async_knowledge_base.hybrid_search(query, top_k, keyword=keyword, groups=groups, level=level)
+        elif mode == "lexical":
+            lexical_query = f"{query} {keyword}" if keyword else query
+            results = await async_knowledge_base.lexical_search(lexical_query, top_k, wait=True, groups=groups, level=level)
+        else:
+            results = await async_knowledge_base.search(query, top_k, keyword=keyword, groups=groups, level=level)
+        
+        if rerank:
+            results = await reranker_service.rerank_async(query, results, final_top_k)
+        return {"success": True, "mode": mode, "results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"搜索知识库失败: {str(e)}")
 
 
+@router.post("/search/batch", dependencies=[Depends(require_search_components)])
+async def batch_search_knowledge_base(request: BatchSearchRequest):
+    """批量向量检索
+    
+    全部查询一次生成嵌入，并以多向量检索提交，适用于为提纲的全部章节预取参考资料。
+    
+    Returns:
+        与 queries 一一对应的搜索结果列表
+    """
+    try:
+        results = await async_knowledge_base.batch_search(
+            request.queries, request.top_k, keyword=request.keyword, groups=request.groups, level=request.level
+        )
+        return {"success": True, "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量搜索知识库失败: {str(e)}")
+
+
 @router.get("/stats")
 async def get_knowledge_base_stats():
     """获取知识库统计信息
     
+    知识库尚未初始化时只返回预热状态，不触发初始化。
+    
     Returns:
         知识库统计信息
     """
     try:
-        count = knowledge_base.get_document_count()
-        return {"success": True, "stats": {"document_count": count}}
+        stats = {
+            "warmup": warmup_manager.status(),
+            "embedding": embedding_service.stats(),
+            "executor": async_knowledge_base.stats(),
+            "reranker": reranker_service.stats(),
+            "reference_packing": reference_packer.stats()
+        }
+        if warmup_manager.is_ready("knowledge_base"):
+            stats.update({
+                "document_count": await async_knowledge_base.get_document_count(),
+                "milvus": await async_knowledge_base.status(),
+                "lexical": knowledge_base.lexical_index.status(),
+                "search_cache": knowledge_base.search_cache.stats(),
+                "dedup": knowledge_base.dedup_index.status()
+            })
+        else:
+            stats["document_count"] = None
+        return {"success": True, "stats": stats}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取知识库统计失败: {str(e)}")
 
@@ -98,7 +206,7 @@ async def get_knowledge_base_groups():
         分组列表
     """
     try:
-        groups = group_manager.get_all_groups()
+        groups = await async_knowledge_base.run(OP_READ, group_manager.get_all_groups)
         return {"success": True, "groups": groups}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取知识库分组失败: {str(e)}")
@@ -115,13 +223,29 @@ async def add_knowledge_base_group(group_name: str = Query(..., description="分
         操作结果
     """
     try:
-        group_manager.add_group(group_name)
+        await async_knowledge_base.run(OP_WRITE, group_manager.add_group, group_name)
         return {"success": True, "message": f"成功添加分组: {group_name}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"添加分组失败: {str(e)}")
 
 
-@router.delete("/groups/{group_name}")
+@router.post("/groups/sync", dependencies=[Depends(require_knowledge_base)])
+async def sync_knowledge_base_groups():
+    """把已有文档归入所属分组的分区（分组检索功能上线前导入的文档需要同步一次）
+    
+    Returns:
+        更新的条目数
+    """
+    try:
+        updated = await async_knowledge_base.run(OP_WRITE, group_manager.sync_storage_groups)
+        return {"success": True, "updated": updated}
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"同步分组失败: {str(e)}")
+
+
+@router.delete("/groups/{group_name}", dependencies=[Depends(require_knowledge_base)])
 async def delete_knowledge_base_group(group_name: str):
     """删除指定的知识库分组及其所有文档
     
@@ -134,7 +258,7 @@ async def delete_knowledge_base_group(group_name: str):
     try:
         # 直接调用分组管理器的delete_group方法
         # delete_group方法已经包含了删除文档和分组的完整逻辑
-        success = group_manager.delete_group(group_name)
+        success = await async_knowledge_base.run(OP_WRITE, group_manager.delete_group, group_name)
         if success:
             return {"success": True, "message": f"成功删除分组: {group_name}"}
         else:
@@ -143,23 +267,35 @@ async def delete_knowledge_base_group(group_name: str):
         raise HTTPException(status_code=500, detail=f"删除分组失败: {str(e)}")
 
 
-@router.get("/groups/{group_name}/documents")
+@router.get("/groups/{group_name}/documents", dependencies=[Depends(require_knowledge_base)])
 async def get_documents_by_group(
-    group_name: str
+    group_name: str,
+    limit: int = Query(100, description="返回文档数量", ge=1, le=1000),
+    offset: int = Query(0, description="分页起始位置", ge=0)
 ):
     """获取指定分组的文档
     
     Args:
         group_name: 分组名称
+        limit: 返回文档数量
+        offset: 分页起始位置
     
     Returns:
-        文档列表
+        文档列表及分组文档总数
     """
     try:
-        group_info = group_manager.get_group(group_name)
+        group_info = await async_knowledge_base.run(OP_READ, group_manager.get_group, group_name, offset=offset, limit=limit)
         if not group_info:
             raise HTTPException(status_code=404, detail=f"分组 '{group_name}' 不存在")
-        return {"success": True, "documents": group_info.get("documents", [])}
+        return {
+            "success": True,
+            "documents": group_info.get("documents", []),
+            "total": group_info.get("total", 0),
+            "offset": offset,
+            "limit": limit
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取分组文档失败: {str(e)}")
 
@@ -167,54 +303,120 @@ async def get_documents_by_group(
 @router.post("/upload/{group_name}")
 async def upload_document_to_group(
     group_name: str,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    doc_id: Optional[str] = Query(None, description="要增量更新的已有文档ID"),
+    replace_existing: bool = Query(True, description="分组中已有同名文件时增量更新该文档")
 ):
     """上传文件到指定分组
     
+    文件保存后立即返回任务ID，提取、分块、嵌入和插入在后台任务中执行，
+    通过 /jobs/{job_id} 或 /jobs/{job_id}/events 查询进度。
+    重新上传修订后的文件时只嵌入变化的分块（任务 mode 为 upsert）。
+    
     Args:
         group_name: 分组名称
         file: 上传的文件
+        doc_id: 要增量更新的已有文档ID
+        replace_existing: 分组中已有同名文件时是否增量更新该文档
     
     Returns:
-        操作结果
+        导入任务信息
     """
     try:
-        # 使用FileService根据文件类型解析文件并提取内容
-        extracted_text = await FileService.process_uploaded_file(file)
-        
-        # 生成唯一文档ID - 使用UUID确保唯一性和有效性
-        doc_id = f"doc_{str(uuid.uuid4()).replace('-', '_')}"
-        
-        # 截断摘要以符合Milvus的8192字符限制
-        summary = extracted_text[:8192] if len(extracted_text) > 8192 else extracted_text
-        
-        # 创建文档对象 - 不包含group_name字段
-        document = {
-            "doc_id": doc_id,
-            "section_title": file.filename,
-            "summary": summary,
-            "title_path": file.filename
-        }
-        
-        # 添加到Milvus知识库
-        knowledge_base.add_documents([document])
-        
-        # 将文档信息添加到分组管理
-        group_manager.add_document_to_group(
-            group_name=group_name,
-            doc_id=doc_id
-        )
-        
+        job = await ingestion_job_manager.submit(file, group_name, doc_id, replace_existing)
+        action = "增量更新" if job["mode"] == MODE_UPSERT else "导入"
         return {
             "success": True,
-            "message": f"成功上传文件 '{file.filename}' 到分组 '{group_name}'",
-            "document": document
+            "message": f"文件 '{file.filename}' 已加入{action}队列",
+            "job_id": job["job_id"],
+            "doc_id": job["doc_id"],
+            "job": job
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 
-@router.delete("/clear")
+@router.post("/upload-batch/{group_name}")
+async def upload_documents_to_group(
+    group_name: str,
+    files: List[UploadFile] = File(...),
+    replace_existing: bool = Query(True, description="分组中已有同名文件时增量更新该文档")
+):
+    """批量上传文件到指定分组，每个文件对应一个后台导入任务
+    
+    Args:
+        group_name: 分组名称
+        files: 上传的文件列表
+        replace_existing: 分组中已有同名文件时是否增量更新该文档
+    
+    Returns:
+        导入任务列表，以及未通过校验的文件
+    """
+    jobs = []
+    errors = []
+    for file in files:
+        try:
+            jobs.append(await ingestion_job_manager.submit(file, group_name, replace_existing=replace_existing))
+        except ValueError as e:
+            errors.append({"filename": file.filename, "error": str(e)})
+        except Exception as e:
+            errors.append({"filename": file.filename, "error": f"文件上传失败: {str(e)}"})
+    return {
+        "success": bool(jobs),
+        "message": f"已加入导入队列 {len(jobs)} 个文件，失败 {len(errors)} 个",
+        "jobs": jobs,
+        "errors": errors
+    }
+
+
+@router.get("/jobs")
+async def list_ingestion_jobs(limit: int = Query(50, description="返回任务数量", ge=1, le=500)):
+    """获取最近的导入任务
+    
+    Returns:
+        任务列表（按创建时间倒序）
+    """
+    return {"success": True, "jobs": ingestion_job_manager.list_jobs(limit)}
+
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """获取导入任务状态
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        任务状态、当前阶段、各阶段耗时和已插入分块数
+    """
+    job = ingestion_job_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"导入任务 '{job_id}' 不存在")
+    return {"success": True, "job": job}
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_ingestion_job(job_id: str):
+    """以 SSE 推送导入任务进度，任务完成或失败后结束
+    
+    Args:
+        job_id: 任务ID
+    """
+    if ingestion_job_manager.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"导入任务 '{job_id}' 不存在")
+
+    async def generate():
+        async for job in ingestion_job_manager.watch(job_id):
+            yield f"data: {json.dumps(job, ensure_ascii=False)}\n\n"
+        # 发送结束信号
+        yield "data: [DONE]\n\n"
+
+    return sse_response(generate())
+
+
+@router.delete("/clear", dependencies=[Depends(require_knowledge_base)])
 async def clear_knowledge_base():
     """清空知识库
     
@@ -222,7 +424,92 @@ async def clear_knowledge_base():
         操作结果
     """
     try:
-        knowledge_base.clear_all_documents()
+        await async_knowledge_base.clear_all_documents()
         return {"success": True, "message": "成功清空知识库"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"清空知识库失败: {str(e)}")
+
+
+async def _migration_backend():
+    """支持集合迁移的知识库后端（Milvus），尚未初始化时在线程池中创建"""
+    backend = await async_knowledge_base.run(OP_READ, knowledge_base.get)
+    if not hasattr(backend, "start_migration"):
+        raise HTTPException(status_code=400, detail="当前知识库后端不支持集合迁移")
+    return backend
+
+
+@router.get("/migration", dependencies=[Depends(require_knowledge_base)])
+async def get_collection_migration():
+    """获取集合迁移进度（总数、已复制、速率、预计剩余时间等）"""
+    backend = await _migration_backend()
+    return {"success": True, "migration": await async_knowledge_base.run(OP_READ, backend.migration_status)}
+
+
+@router.post("/migration", dependencies=[Depends(require_knowledge_base)])
+async def start_collection_migration(
+    batch_size: Optional[int] = Query(None, description="每批重新嵌入的条目数", ge=1, le=16384),
+    rows_per_second: Optional[float] = Query(None, description="限速（行/秒），0 表示不限速", ge=0)
+):
+    """把已有条目重新嵌入到当前嵌入模型对应的版本化集合，完成后自动切换"""
+    backend = await _migration_backend()
+    try:
+        migration = await async_knowledge_base.run(OP_WRITE, backend.start_migration, batch_size, rows_per_second)
+        return {"success": True, "migration": migration}
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"启动集合迁移失败: {str(e)}")
+
+
+@router.delete("/migration", dependencies=[Depends(require_knowledge_base)])
+async def cancel_collection_migration():
+    """取消进行中的集合迁移，旧集合继续提供服务"""
+    backend = await _migration_backend()
+    return {"success": True, "migration": await async_knowledge_base.run(OP_WRITE, backend.cancel_migration)}
+
+
+@router.get("/snapshots")
+async def list_knowledge_base_snapshots():
+    """列出知识库快照（manifest：行数、维度、嵌入模型、向量精度、文件校验和等）"""
+    return {"success": True, "snapshots": kb_snapshots.list_snapshots()}
+
+
+@router.post("/snapshots", dependencies=[Depends(require_knowledge_base)])
+async def export_knowledge_base_snapshot(
+    name: Optional[str] = Query(None, description="快照名称，默认按时间生成"),
+    dtype: Optional[str] = Query(None, description="向量精度: float32 或 float16")
+):
+    """导出知识库快照（向量、列式元数据、分组映射和去重链接），恢复时无需重新嵌入"""
+    try:
+        snapshot = await async_knowledge_base.run(OP_READ, kb_snapshots.export, name, dtype)
+        return {"success": True, "snapshot": snapshot}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导出知识库快照失败: {str(e)}")
+
+
+@router.post("/snapshots/{name}/restore", dependencies=[Depends(require_knowledge_base)])
+async def restore_knowledge_base_snapshot(name: str):
+    """校验快照后用其替换当前知识库的全部内容（批量插入已有向量，不重新嵌入）"""
+    try:
+        result = await async_knowledge_base.run(OP_WRITE, kb_snapshots.restore, name)
+        return {"success": True, "message": f"成功恢复 {result['rows']} 个条目", "restore": result}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"恢复知识库快照失败: {str(e)}")
+
+
+@router.delete("/snapshots/{name}")
+async def delete_knowledge_base_snapshot(name: str):
+    """删除快照"""
+    try:
+        await async_knowledge_base.run(OP_WRITE, kb_snapshots.delete, name)
+        return {"success": True, "message": f"成功删除快照: {name}"}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库导入去重 - 内容哈希精确去重 + MinHash/LSH 近重复检测"""
+
+import os
+import re
+import json
+import zlib
+import shutil
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple, Set
+
+import numpy as np
+
+from ..config import settings
+from .lexical_index import entry_key
+
+# 只保留文字和数字参与比较，忽略空白、标点和大小写差异
+_IGNORED_CHARS = re.compile(r"[\W_]+", re.UNICODE)
+
+# MinHash 使用的梅森素数与哈希系数上限（a*x+b 不超过 uint64）
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_COEFFICIENT = 1 << 31
+
+# 重复类型
+DUPLICATE_EXACT = "exact"
+DUPLICATE_NEAR = "near"
+
+# 池化文档条目的粒度标记（见 knowledge_base_backend.GRANULARITY_DOCUMENT）
+_POOLED_GRANULARITY = "document"
+
+
+def normalize_text(text: str) -> str:
+    return _IGNORED_CHARS.sub("", str(text or "").lower())
+
+
+def _digest(normalized: str) -> str:
+    """规范化文本的内容哈希"""
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class MinHasher:
+    """字符 shingle 的 MinHash 签名"""
+
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, _MAX_COEFFICIENT, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_COEFFICIENT, num_perm, dtype=np.uint64)
+
+    def signature(self, normalized: str) -> np.ndarray:
+        size = self.shingle_size
+        shingles = {normalized[i:i + size] for i in range(max(len(normalized) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        values = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        # 低 32 位足以估计相似度，签名内存减半
+        return (values.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+class DedupIndex:
+    """导入去重索引
+
+    每个分块按规范化正文计算内容哈希和 MinHash 签名，签名按 LSH 分段分桶。
+    新分块先按内容哈希精确匹配，再在同桶候选中估计 Jaccard 相似度，达到阈值
+    视为近重复。重复分块不再插入，而是作为链接记录到 links_file（追加写日志），
+    指向已有条目（entry_key）；被链接的条目所属文档删除时，由知识库把第一个
+    链接分块重新插入，其余链接改为指向它。
+
+    哈希与签名只保存在内存中，首次导入时从存储全量构建。scope 为 "group" 时
+    只在同一分组（作用域由知识库决定，如 Milvus 分区）内去重。
+    """
+
+    def __init__(self, links_file: str = None, enabled: bool = None, scope: str = None,
+                 threshold: float = None, num_perm: int = None, bands: int = None, shingle_size: int = None):
+        self.links_file = links_file or os.path.join(settings.data_dir, "dedup_links.jsonl")
+        self.enabled = settings.kb_dedup_enabled if enabled is None else enabled
+        self.scope = scope or settings.kb_dedup_scope
+        self.threshold = settings.kb_dedup_threshold if threshold is None else threshold
+        self.bands = bands or settings.kb_dedup_bands
+        self.hasher = MinHasher(num_perm or settings.kb_dedup_num_perm, shingle_size or settings.kb_dedup_shingle_size)
+        if self.hasher.num_perm % self.bands:
+            raise ValueError("kb_dedup_num_perm 必须能被 kb_dedup_bands 整除")
+
+        self.built = False
+        self._lock = threading.RLock()
+        self._reset_entries()
+
+        # 链接：被链接条目 -> [(重复分块, 重复类型)]，以及条目与文档之间的索引
+        self._links_loaded = False
+        self._reset_links()
+
+    def _reset_links(self):
+        self._links: Dict[str, List[Tuple[Dict[str, Any], str]]] = {}
+        self._canonical_of: Dict[str, str] = {}
+        self._canonical_docs: Dict[str, Set[str]] = {}
+        self._linking_docs: Dict[str, Set[str]] = {}
+        self._dead_records = 0
+
+    def _reset_entries(self):
+        self._hashes: Dict[Tuple[str, str], str] = {}
+        self._buckets: Dict[Tuple[str, int, bytes], Set[str]] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._doc_entries: Dict[str, Set[str]] = {}
+
+    # ---------------- 构建 ----------------
+    def ensure_built(self, iter_rows: Callable[[], Iterable[List[Dict[str, Any]]]],
+                     scope_of: Callable[[Dict[str, Any]], str]):
+        """首次使用时从存储全量构建哈希与签名"""
+        with self._lock:
+            self._ensure_links_loaded()
+            if self.built:
+                return
+            self._reset_entries()
+            for batch in iter_rows():
+                for document in batch:
+                    self._add_entry(document, scope_of)
+            self.built = True
+            print(f"去重索引构建完成: {len(self._entries)} 个条目")
+
+    def reset(self):
+        """存储中的条目作用域变化后（如旧数据归入分组分区）在下次使用时重新构建"""
+        with self._lock:
+            self.built = False
+            self._reset_entries()
+
+    def _scope(self, document: Dict[str, Any], scope_of) -> str:
+        scope = scope_of(document) if self.scope == "group" else ""
+        # 长文本的池化文档条目包含其各窗口的正文，只与池化文档条目比较
+        if document.get("granularity") == _POOLED_GRANULARITY:
+            scope += "\x1f" + _POOLED_GRANULARITY
+        return scope
+
+    def _band_keys(self, scope: str, signature: np.ndarray) -> List[Tuple[str, int, bytes]]:
+        rows = len(signature) // self.bands
+        return [(scope, band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def _add_entry(self, document: Dict[str, Any], scope_of,
+                   normalized: str = None, signature: np.ndarray = None) -> Optional[str]:
+        key = entry_key(document)
+        if key in self._entries:
+            return key
+        normalized = normalize_text(document.get("summary")) if normalized is None else normalized
+        if not normalized:
+            return None
+        scope = self._scope(document, scope_of)
+        digest = _digest(normalized)
+        signature = self.hasher.signature(normalized) if signature is None else signature
+
+        self._hashes.setdefault((scope, digest), key)
+        for band_key in self._band_keys(scope, signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+        self._entries[key] = {"doc_id": document.get("doc_id"), "scope": scope, "hash": digest, "signature": signature}
+        self._doc_entries.setdefault(document.get("doc_id"), set()).add(key)
+        return key
+
+    def _remove_entry(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if self._hashes.get((entry["scope"], entry["hash"])) == key:
+            del self._hashes[(entry["scope"], entry["hash"])]
+        for band_key in self._band_keys(entry["scope"], entry["signature"]):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    # ---------------- 去重 ----------------
+    def check(self, documents: List[Dict[str, Any]], scope_of: Callable[[Dict[str, Any]], str]
+              ) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str, str]]]:
+        """区分新分块与重复分块，并记录重复分块的链接
+
+        新分块立即登记，同一批或并发导入中的后续重复分块也会被识别。
+
+        Returns:
+            (新分块列表, [(重复分块, 被链接条目, 重复类型)])
+        """
+        kept, duplicates = [], []
+        with self._lock:
+            for document in documents:
+                normalized = normalize_text(document.get("summary"))
+                if not normalized:
+                    kept.append(document)
+                    continue
+                scope = self._scope(document, scope_of)
+                digest = _digest(normalized)
+                canonical = self._hashes.get((scope, digest))
+                if canonical is not None:
+                    duplicates.append((document, canonical, DUPLICATE_EXACT))
+                    continue
+
+                signature = self.hasher.signature(normalized)
+                canonical, similarity = None, 0.0
+                candidates = set()
+                for band_key in self._band_keys(scope, signature):
+                    candidates |= self._buckets.get(band_key, set())
+                for candidate in candidates:
+                    score = float(np.mean(self._entries[candidate]["signature"] == signature))
+                    if score > similarity:
+                        canonical, similarity = candidate, score
+                if canonical is not None and similarity >= self.threshold:
+                    duplicates.append((document, canonical, DUPLICATE_NEAR))
+                    continue
+
+                self._add_entry(document, scope_of, normalized, signature)
+                kept.append(document)
+            self.link(duplicates)
+        return kept, duplicates
+
+    def register(self, documents: List[Dict[str, Any]], scope_of: Callable[[Dict[str, Any]], str]):
+        """登记未经去重直接插入的分块（索引尚未构建时由构建过程读取）"""
+        with self._lock:
+            if self.built:
+                for document in documents:
+                    self._add_entry(document, scope_of)
+
+    def discard(self, documents: List[Dict[str, Any]]):
+        """撤销已登记但插入失败的分块"""
+        with self._lock:
+            for document in documents:
+                key = entry_key(document)
+                self._remove_entry(key)
+                keys = self._doc_entries.get(document.get("doc_id"))
+                if keys is not None:
+                    keys.discard(key)
+
+    # ---------------- 链接 ----------------
+    def link(self, duplicates: List[Tuple[Dict[str, Any], str, str]], canonical_doc_ids: Dict[str, str] = None):
+        """记录重复分块到已有条目的链接
+
+        Args:
+            duplicates: [(重复分块, 被链接条目, 重复类型)]
+            canonical_doc_ids: 被链接条目所属文档，未给出时从索引中查找
+        """
+        if not duplicates:
+            return
+        with self._lock:
+            self._ensure_links_loaded()
+            records = []
+            for document, canonical, kind in duplicates:
+                doc_id = (canonical_doc_ids or {}).get(canonical) or self._entries[canonical]["doc_id"]
+                record = {"op": "link", "key": canonical, "canonical_doc_id": doc_id,
+                          "kind": kind, "document": dict(document)}
+                self._apply_link(record)
+                records.append(record)
+            self._append_records(records)
+
+    def remove_documents(self, doc_ids: List[str]) -> List[List[Tuple[Dict[str, Any], str]]]:
+        """文档删除时清理条目和链接
+
+        Returns:
+            失去被链接条目的 [(重复分块, 重复类型)] 分组（每组原本指向同一条目），由调用方重新插入
+        """
+        with self._lock:
+            self._ensure_links_loaded()
+            records = []
+            for doc_id in doc_ids:
+                for key in self._doc_entries.pop(doc_id, set()):
+                    self._remove_entry(key)
+                if doc_id in self._linking_docs:
+                    self._apply_unlink_doc(doc_id)
+                    records.append({"op": "unlink", "doc_id": doc_id})
+
+            orphans = []
+            for doc_id in doc_ids:
+                for key in sorted(self._canonical_docs.pop(doc_id, set())):
+                    links = self._apply_unlink_key(key)
+                    if links:
+                        orphans.append(links)
+                    records.append({"op": "unlink_key", "key": key})
+            self._append_records(records)
+            return orphans
+
+    def linked_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """文档中被去重链接（没有存储条目）的分块"""
+        with self._lock:
+            self._ensure_links_loaded()
+            return [
+                document
+                for key in sorted(self._linking_docs.get(doc_id, set()))
+                for document, _ in self._links[key]
+                if document.get("doc_id") == doc_id
+            ]
+
+    def remove_chunks(self, doc_id: str, rows: List[Dict[str, Any]],
+                      linked: List[Dict[str, Any]]) -> List[List[Tuple[Dict[str, Any], str]]]:
+        """增量更新删除文档中的部分分块
+
+        Args:
+            doc_id: 文档ID
+            rows: 删除的存储条目
+            linked: 删除的链接分块（linked_chunks 返回的分块）
+
+        Returns:
+            失去被链接条目的重复分块分组，与 remove_documents 相同
+        """
+        with self._lock:
+            self._ensure_links_loaded()
+            records = []
+            if linked:
+                chunk_keys = [entry_key(document) for document in linked]
+                self._apply_unlink_chunks(doc_id, chunk_keys)
+                records.append({"op": "unlink_chunks", "doc_id": doc_id, "keys": chunk_keys})
+
+            orphans = []
+            for row in rows:
+                key = entry_key(row)
+                self._remove_entry(key)
+                self._doc_entries.get(doc_id, set()).discard(key)
+                if key in self._canonical_of:
+                    links = self._apply_unlink_key(key)
+                    if links:
+                        orphans.append(links)
+                    records.append({"op": "unlink_key", "key": key})
+            self._append_records(records)
+            return orphans
+
+    def linked_documents(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """全部分块都被去重的文档没有存储条目，从链接中取每个文档的首个分块"""
+        with self._lock:
+            self._ensure_links_loaded()
+            wanted = set(doc_ids) & set(self._linking_docs)
+            found: Dict[str, Dict[str, Any]] = {}
+            for doc_id in wanted:
+                for key in sorted(self._linking_docs[doc_id]):
+                    for document, _ in self._links[key]:
+                        if document.get("doc_id") == doc_id:
+                            found.setdefault(doc_id, document)
+            return found
+
+    def clear(self):
+        """清空知识库时清空索引和链接"""
+        with self._lock:
+            self._reset_entries()
+            self._reset_links()
+            self.built = False
+            self._links_loaded = True
+            if os.path.exists(self.links_file):
+                os.remove(self.links_file)
+
+    def export_links(self, path: str) -> int:
+        """把有效链接写入快照文件，返回链接数"""
+        with self._lock:
+            self._ensure_links_loaded()
+            self._write_links(path)
+            return self.link_count()
+
+    def import_links(self, path: str):
+        """用快照中的链接替换当前链接（恢复快照时），哈希与签名在下次使用时重新构建"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.links_file) or ".", exist_ok=True)
+            tmp_file = self.links_file + ".tmp"
+            shutil.copyfile(path, tmp_file)
+            os.replace(tmp_file, self.links_file)
+            self._reset_entries()
+            self._reset_links()
+            self.built = False
+            self._links_loaded = False
+
+    def _apply_link(self, record: Dict[str, Any]):
+        key = record["key"]
+        document = record["document"]
+        self._links.setdefault(key, []).append((document, record.get("kind", DUPLICATE_EXACT)))
+        self._canonical_of[key] = record["canonical_doc_id"]
+        self._canonical_docs.setdefault(record["canonical_doc_id"], set()).add(key)
+        self._linking_docs.setdefault(document.get("doc_id"), set()).add(key)
+
+    def _apply_unlink_doc(self, doc_id: str):
+        for key in self._linking_docs.pop(doc_id, set()):
+            links = self._links.get(key, [])
+            remaining = [link for link in links if link[0].get("doc_id") != doc_id]
+            self._dead_records += len(links) - len(remaining)
+            if remaining:
+                self._links[key] = remaining
+            else:
+                self._drop_key(key)
+
+    def _apply_unlink_chunks(self, doc_id: str, chunk_keys: List[str]):
+        removed = set(chunk_keys)
+        for key in list(self._linking_docs.get(doc_id, set())):
+            links = self._links.get(key, [])
+            remaining = [link for link in links
+                         if link[0].get("doc_id") != doc_id or entry_key(link[0]) not in removed]
+            self._dead_records += len(links) - len(remaining)
+            if len(remaining) == len(links):
+                continue
+            if not any(link[0].get("doc_id") == doc_id for link in remaining):
+                self._linking_docs[doc_id].discard(key)
+            if remaining:
+                self._links[key] = remaining
+            else:
+                self._drop_key(key)
+        if not self._linking_docs.get(doc_id, True):
+            del self._linking_docs[doc_id]
+
+    def _apply_unlink_key(self, key: str) -> List[Tuple[Dict[str, Any], str]]:
+        links = self._links.get(key, [])
+        self._dead_records += len(links)
+        for document, _ in links:
+            keys = self._linking_docs.get(document.get("doc_id"))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._linking_docs[document.get("doc_id")]
+        self._drop_key(key)
+        return links
+
+    def _drop_key(self, key: str):
+        self._links.pop(key, None)
+        doc_id = self._canonical_of.pop(key, None)
+        keys = self._canonical_docs.get(doc_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._canonical_docs[doc_id]
+
+    # ---------------- 持久化 ----------------
+    def _ensure_links_loaded(self):
+        """回放链接日志，墓碑记录过多时压缩"""
+        if self._links_loaded:
+            return
+        self._links_loaded = True
+        if not os.path.exists(self.links_file):
+            return
+        with open(self.links_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record["op"] == "link":
+                    self._apply_link(record)
+                elif record["op"] == "unlink":
+                    self._apply_unlink_doc(record["doc_id"])
+                    self._dead_records += 1
+                elif record["op"] == "unlink_chunks":
+                    self._apply_unlink_chunks(record["doc_id"], record["keys"])
+                    self._dead_records += 1
+                elif record["op"] == "unlink_key":
+                    self._apply_unlink_key(record["key"])
+                    self._dead_records += 1
+        if self._dead_records > self.link_count():
+            self._compact()
+
+    def _append_records(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        os.makedirs(os.path.dirname(self.links_file) or ".", exist_ok=True)
+        with open(self.links_file, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _compact(self):
+        """只保留有效链接重写日志"""
+        tmp_file = self.links_file + ".tmp"
+        self._write_links(tmp_file)
+        os.replace(tmp_file, self.links_file)
+        self._dead_records = 0
+
+    def _write_links(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for key, links in self._links.items():
+                for document, kind in links:
+                    record = {"op": "link", "key": key, "canonical_doc_id": self._canonical_of.get(key),
+                              "kind": kind, "document": document}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    # ---------------- 统计 ----------------
+    def link_count(self) -> int:
+        return sum(len(links) for links in self._links.values())
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "scope": self.scope,
+                "built": self.built,
+                "entries": len(self._entries),
+                "linked_chunks": self.link_count() if self._links_loaded else None,
+                "threshold": self.threshold,
+            }
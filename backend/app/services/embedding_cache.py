@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""嵌入向量缓存 - 进程内 LRU + 磁盘内存映射存储"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from ..config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，磁盘写入不加跨进程锁（读取时仍校验键）
+    fcntl = None
+
+# 缓存格式版本，格式变化时旧缓存自动失效
+CACHE_FORMAT_VERSION = 1
+# sha1 摘要长度
+KEY_SIZE = 20
+# 磁盘存储初始容量，之后按需倍增直到上限
+INITIAL_DISK_CAPACITY = 1024
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：全角半角统一、合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).split())
+
+
+class EmbeddingCache:
+    """两级嵌入缓存
+
+    键为 (模型名称, 规范化文本) 的 sha1 摘要。第一级是进程内 LRU；第二级是
+    磁盘上的内存映射文件：vectors.f32 保存 float32 向量矩阵，keys.bin 保存每个
+    槽位对应的键，meta.json 记录模型名称、维度和写入位置。磁盘存储按环形缓冲
+    写入，超出容量时覆盖最早写入的条目。每个模型使用 cache_dir 下独立的子目录，
+    切换模型不会清空其他模型（其他进程）的缓存；向量维度变化时该模型的缓存清空。
+
+    多个 worker 进程共享同一个磁盘缓存：写入在文件锁内进行，并先从 meta.json
+    读取其他进程推进后的写入位置；槽位可能已被其他进程覆盖，磁盘命中时先复制
+    向量再核对槽位中的键，键不一致按未命中处理。
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = None,
+                 memory_entries: int = None, disk_entries: int = None):
+        self.model_name = model_name
+        cache_root = cache_dir or os.path.join(settings.data_dir, "embedding_cache")
+        self.cache_dir = os.path.join(cache_root, self._namespace(model_name))
+        self.memory_entries = memory_entries or settings.embedding_cache_memory_entries
+        self.disk_entries = disk_entries or settings.embedding_cache_disk_entries
+
+        self.meta_file = os.path.join(self.cache_dir, "meta.json")
+        self.keys_file = os.path.join(self.cache_dir, "keys.bin")
+        self.vectors_file = os.path.join(self.cache_dir, "vectors.f32")
+        self.lock_file = os.path.join(self.cache_dir, "write.lock")
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+
+        # 磁盘存储状态，维度未知时磁盘层不可用
+        self.dimension: Optional[int] = None
+        self._capacity = 0
+        self._next_slot = 0
+        self._keys: Optional[np.memmap] = None
+        self._vectors: Optional[np.memmap] = None
+        self._index: Dict[bytes, int] = {}
+
+        # 统计信息
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._open_existing()
+
+    @staticmethod
+    def _namespace(model_name: str) -> str:
+        """模型对应的子目录名：可读的模型名 + 摘要（避免不同模型名规整后相同）"""
+        slug = re.sub(r"[^0-9a-zA-Z]+", "_", model_name).strip("_").lower()[:64]
+        return f"{slug}-{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:8]}"
+
+    # ---------------- 键 ----------------
+    def make_key(self, text: str) -> bytes:
+        """生成缓存键"""
+        payload = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha1(payload).digest()
+
+    # ---------------- 读写接口 ----------------
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """批量查询，未命中的位置返回 None"""
+        with self._lock:
+            return [self._get(self.make_key(text)) for text in texts]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """批量写入并持久化"""
+        with self._lock, self._file_lock():
+            if self.dimension is None:
+                self._bind_dimension(int(vectors.shape[1]))
+            self._sync_write_position()
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                if key not in self._index:
+                    self._write_disk(key, vector)
+            self._flush()
+
+    def _get(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+
+        slot = self._index.get(key)
+        if slot is not None:
+            # 先复制向量再核对键：写入方先写键再写向量，复制期间被覆盖时键已经改变
+            vector = np.array(self._vectors[slot], dtype=np.float32)
+            if self._keys[slot].tobytes() == key:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+            # 槽位已被其他进程覆盖
+            del self._index[key]
+
+        self.misses += 1
+        return None
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        """写入内存LRU"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    # ---------------- 磁盘存储 ----------------
+    @contextmanager
+    def _file_lock(self):
+        """跨进程写锁（flock），不支持时只有进程内的锁"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sync_write_position(self):
+        """读取其他进程写入后的写入位置与容量（调用方持有文件锁）"""
+        if self._keys is None or not os.path.exists(self.meta_file):
+            return
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception:
+            return
+        if meta.get("model_name") != self.model_name or int(meta.get("dimension", 0)) != self.dimension:
+            return
+        self._next_slot = int(meta.get("next_slot", 0)) % self.disk_entries
+        capacity = min(int(meta.get("capacity", 0)), self.disk_entries)
+        if capacity > self._capacity:
+            # 其他进程已扩容文件，重新映射
+            self._close_files()
+            self._capacity = capacity
+            self._map_files("r+")
+
+    def bind_dimension(self, dimension: int):
+        """绑定向量维度，维度与已有缓存不一致时清空缓存"""
+        with self._lock, self._file_lock():
+            self._bind_dimension(dimension)
+
+    def _bind_dimension(self, dimension: int):
+        """调用方持有进程内锁和文件锁"""
+        if self.dimension is None:
+            # 其他进程可能已在本进程启动后创建了缓存
+            self._open_existing()
+        if self.dimension == dimension:
+            return
+        if self.dimension is not None:
+            print(f"嵌入维度由 {self.dimension} 变为 {dimension}，清空嵌入缓存")
+        self._reset(dimension)
+
+    def _open_existing(self):
+        """打开已有的磁盘缓存，模型或格式不一致时清空"""
+        if not os.path.exists(self.meta_file):
+            return
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"读取嵌入缓存元数据失败，清空缓存: {e}")
+            self._remove_files()
+            return
+
+        if (meta.get("version") != CACHE_FORMAT_VERSION
+                or meta.get("model_name") != self.model_name
+                or not os.path.exists(self.keys_file)
+                or not os.path.exists(self.vectors_file)):
+            print(f"嵌入模型已变更（{meta.get('model_name')} -> {self.model_name}），清空嵌入缓存")
+            self._remove_files()
+            return
+
+        self.dimension = int(meta["dimension"])
+        self._capacity = int(meta["capacity"])
+        self._next_slot = int(meta.get("next_slot", 0)) % self.disk_entries
+        self._map_files("r+")
+
+        # 根据非空键重建索引
+        for slot in np.flatnonzero(self._keys.any(axis=1)):
+            self._index[self._keys[slot].tobytes()] = int(slot)
+        print(f"嵌入缓存已加载: {len(self._index)} 条")
+
+    def _reset(self, dimension: int):
+        """按新维度重建空缓存"""
+        self._close_files()
+        self._remove_files()
+        self._memory.clear()
+        self._index.clear()
+        self.dimension = dimension
+        self._capacity = min(INITIAL_DISK_CAPACITY, self.disk_entries)
+        self._next_slot = 0
+        self._map_files("w+")
+        self._flush()
+
+    def _map_files(self, mode: str):
+        self._keys = np.memmap(self.keys_file, dtype=np.uint8, mode=mode,
+                               shape=(self._capacity, KEY_SIZE))
+        self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode=mode,
+                                  shape=(self._capacity, self.dimension))
+
+    def _close_files(self):
+        if self._keys is not None:
+            self._keys.flush()
+            self._vectors.flush()
+        self._keys = None
+        self._vectors = None
+
+    def _remove_files(self):
+        for path in (self.meta_file, self.keys_file, self.vectors_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _grow(self):
+        """磁盘容量倍增（不超过上限）"""
+        new_capacity = min(self._capacity * 2, self.disk_entries)
+        self._close_files()
+        with open(self.keys_file, 'r+b') as f:
+            f.truncate(new_capacity * KEY_SIZE)
+        with open(self.vectors_file, 'r+b') as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self._capacity = new_capacity
+        self._map_files("r+")
+
+    def _write_disk(self, key: bytes, vector: np.ndarray):
+        """写入下一个环形槽位，必要时淘汰旧条目（先写键再写向量）"""
+        if self._keys is None or vector.shape[0] != self.dimension:
+            return
+
+        slot = self._next_slot
+        if slot >= self._capacity:
+            self._grow()
+
+        old_key = self._keys[slot].tobytes()
+        if any(old_key):
+            self._index.pop(old_key, None)
+            self.disk_evictions += 1
+
+        self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+        self._vectors[slot] = vector
+        self._index[key] = slot
+        self._next_slot = (slot + 1) % self.disk_entries
+
+    def _flush(self):
+        """刷新内存映射并原子写入元数据"""
+        if self._keys is None:
+            return
+        self._keys.flush()
+        self._vectors.flush()
+
+        meta = {
+            "version": CACHE_FORMAT_VERSION,
+            "model_name": self.model_name,
+            "dimension": self.dimension,
+            "capacity": self._capacity,
+            "next_slot": self._next_slot,
+        }
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_file, self.meta_file)
+
+    # ---------------- 统计 ----------------
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率等统计信息"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._index),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0,
+                "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions,
+            }
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""嵌入模型运行时 - PyTorch 全精度、PyTorch int8 动态量化、ONNX Runtime
+
+三种运行时都提供与 SentenceTransformer 相同的 encode / get_sentence_embedding_dimension
+接口，EmbeddingService 按 settings.embedding_runtime 选择。
+"""
+
+import os
+from typing import List
+
+import numpy as np
+
+from ..config import settings
+
+RUNTIME_TORCH = "torch"
+RUNTIME_INT8 = "int8"
+RUNTIME_ONNX = "onnx"
+RUNTIMES = (RUNTIME_TORCH, RUNTIME_INT8, RUNTIME_ONNX)
+
+
+def _import_onnxruntime():
+    """导入可选依赖 onnxruntime，未安装时给出安装提示"""
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("ONNX 运行时需要安装 onnxruntime: pip install \"onnxruntime>=1.18.0\"") from e
+    return onnxruntime
+
+
+class OnnxEmbeddingModel:
+    """ONNX Runtime 推理的句向量模型
+
+    模型目录包含导出的 ONNX 文件（可以是量化后的版本）和分词器文件。
+    池化方式与 all-MiniLM-L6-v2 的 SentenceTransformer 管线一致：
+    对 token 向量按注意力掩码求平均，再做 L2 归一化。
+    """
+
+    def __init__(self, model_path: str, onnx_file: str = None, max_seq_length: int = None,
+                 num_threads: int = None):
+        onnxruntime = _import_onnxruntime()
+        from transformers import AutoTokenizer
+
+        onnx_file = onnx_file or settings.embedding_onnx_file
+        self.model_path = model_path
+        self.max_seq_length = max_seq_length or settings.embedding_max_seq_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        options = onnxruntime.SessionOptions()
+        num_threads = settings.embedding_num_threads if num_threads is None else num_threads
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, onnx_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self._dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if not isinstance(self._dimension, int):
+            self._dimension = int(self.encode(["dimension"]).shape[1])
+        return self._dimension
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        """编码文本，返回 L2 归一化的 float32 矩阵"""
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # 按长度排序后分批，减少填充
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for position, index in enumerate(indices):
+                embeddings[index] = pooled[position]
+
+        return np.stack(embeddings).astype(np.float32, copy=False)
+
+
+def load_int8_model(model_path: str):
+    """加载 SentenceTransformer 并对线性层做 int8 动态量化"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    num_threads = settings.embedding_num_threads
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = SentenceTransformer(model_path, device="cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_embedding_model(runtime: str = None, model_name: str = None, model_path: str = None, onnx_file: str = None):
+    """按运行时加载嵌入模型
+
+    Args:
+        runtime: "torch"、"int8" 或 "onnx"，默认使用 settings.embedding_runtime
+        model_name: 模型名称（torch 运行时，或未配置本地路径时使用）
+        model_path: 本地模型目录，默认使用 settings.embedding_model_path
+        onnx_file: 模型目录中的 ONNX 文件（onnx 运行时），默认使用 settings.embedding_onnx_file
+    """
+    runtime = runtime or settings.embedding_runtime
+    model_name = model_name or settings.embedding_model_name
+    model_path = model_path or settings.embedding_model_path or model_name
+    if runtime not in RUNTIMES:
+        raise ValueError(f"不支持的嵌入运行时: {runtime}，可选 {', '.join(RUNTIMES)}")
+
+    if runtime == RUNTIME_ONNX:
+        return OnnxEmbeddingModel(model_path, onnx_file)
+    if runtime == RUNTIME_INT8:
+        return load_int8_model(model_path)
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_path)
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> str:
+    """将 SentenceTransformer 的 Transformer 主干导出为 ONNX，并可选做 int8 动态量化
+
+    Args:
+        model_name: 模型名称或本地路径
+        output_dir: 导出目录（同时保存分词器）
+        quantize: 是否额外生成量化模型 model_quantized.onnx
+        opset: ONNX opset 版本
+
+    Returns:
+        导出的 ONNX 文件路径（quantize 为 True 时为量化模型）
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    model.tokenizer.save_pretrained(output_dir)
+
+    sample = model.tokenizer(["导出示例文本"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    print(f"ONNX 模型已导出: {onnx_path}")
+
+    if not quantize:
+        return onnx_path
+
+    _import_onnxruntime()
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantized_path = os.path.join(output_dir, "model_quantized.onnx")
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"int8 量化模型已导出: {quantized_path}")
+    return quantized_path
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""文本嵌入服务 - 将并发的编码请求合并为微批次"""
+
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+# 设置Hugging Face国内镜像地址
+os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
+
+from ..config import settings
+from .embedding_cache import EmbeddingCache
+from .embedding_runtime import load_embedding_model, RUNTIME_TORCH, RUNTIME_ONNX
+from ..utils.chunk_util import estimate_tokens, split_into_windows
+
+
+def encode_pooled(encode: Callable[[List[str]], np.ndarray], texts: List[str],
+                  max_tokens: int = None, overlap_tokens: int = None) -> np.ndarray:
+    """编码文本，超出模型输入长度的文本按窗口切分，取窗口向量的平均方向
+
+    嵌入模型会静默截断过长的输入（all-MiniLM-L6-v2 为 256 个 token），长文本
+    截断之后的内容对向量没有影响。这里把全部文本的窗口合并为一次 encode，
+    相同的窗口只编码一次；不超长的文本结果与直接编码相同。
+
+    Args:
+        encode: 编码函数（如 EmbeddingService.encode）
+        texts: 待编码文本
+        max_tokens: 窗口最大 token 数，默认 settings.kb_chunk_max_tokens
+        overlap_tokens: 相邻窗口重叠 token 数，默认 settings.kb_chunk_overlap_tokens
+
+    Returns:
+        与 texts 一一对应的 float32 向量矩阵
+    """
+    max_tokens = max_tokens or settings.kb_chunk_max_tokens
+    overlap_tokens = settings.kb_chunk_overlap_tokens if overlap_tokens is None else overlap_tokens
+    texts = [str(text) for text in texts]
+    pieces: Dict[str, int] = {}
+    spans = []
+    for text in texts:
+        windows = split_into_windows(text, max_tokens, overlap_tokens) if estimate_tokens(text) > max_tokens else []
+        windows = windows or [text]
+        spans.append([pieces.setdefault(window, len(pieces)) for window in windows])
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    vectors = np.asarray(encode(list(pieces)), dtype=np.float32)
+    pooled = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+    for row, span in enumerate(spans):
+        if len(span) == 1:
+            pooled[row] = vectors[span[0]]
+            continue
+        windows = vectors[span]
+        mean = (windows / np.maximum(np.linalg.norm(windows, axis=1, keepdims=True), 1e-12)).mean(axis=0)
+        pooled[row] = mean / max(float(np.linalg.norm(mean)), 1e-12)
+    return pooled
+
+
+class _EncodeRequest:
+    """一次编码请求（可包含多条文本）"""
+
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingService:
+    """嵌入模型服务
+
+    所有调用方（同步或异步）提交的编码请求进入同一个队列，由后台工作线程
+    收集为微批次：达到 max_batch_size 条文本或第一条请求等待超过 max_wait_ms
+    时，执行一次 encode，再把结果按请求拆分返回。编码在工作线程中进行，
+    不会占用事件循环。命中嵌入缓存的文本不进入队列。
+    """
+
+    def __init__(self, model_name: str = None, max_batch_size: int = None, max_wait_ms: float = None,
+                 use_cache: bool = None, runtime: str = None, model_path: str = None, onnx_file: str = None):
+        self.model_name = model_name or settings.embedding_model_name
+        self.runtime = runtime or settings.embedding_runtime
+        self.model_path = model_path
+        self.onnx_file = (onnx_file or settings.embedding_onnx_file) if self.runtime == RUNTIME_ONNX else None
+        self.max_batch_size = max_batch_size or settings.embedding_max_batch_size
+        wait_ms = settings.embedding_max_wait_ms if max_wait_ms is None else max_wait_ms
+        self.max_wait = max(wait_ms, 0) / 1000.0
+
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        # 嵌入缓存（导入和检索共用）
+        use_cache = settings.embedding_cache_enabled if use_cache is None else use_cache
+        self.cache: Optional[EmbeddingCache] = EmbeddingCache(self.model_id) if use_cache else None
+
+        self._queue: "queue.Queue[_EncodeRequest]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self._batch_count = 0
+        self._request_count = 0
+        self._text_count = 0
+        self._max_batch_seen = 0
+        self._encode_seconds = 0.0
+        self._recent_batch_sizes = deque(maxlen=1000)
+        self._recent_queue_waits = deque(maxlen=1000)
+
+    # ---------------- 模型 ----------------
+    @property
+    def model_id(self) -> str:
+        """模型标识（量化 / ONNX 运行时的向量与全精度模型略有差异，缓存、集合与快照按标识分开）
+
+        ONNX 运行时的不同模型文件（如全精度 model.onnx 与量化的 model_quantized.onnx）
+        向量也不同，非默认文件名的标识带上文件名（默认文件保持原有标识）。
+        """
+        if self.runtime == RUNTIME_TORCH:
+            return self.model_name
+        if self.onnx_file and os.path.basename(self.onnx_file) != "model.onnx":
+            stem = os.path.splitext(os.path.basename(self.onnx_file))[0]
+            return f"{self.model_name}#{self.runtime}:{stem}"
+        return f"{self.model_name}#{self.runtime}"
+
+    @property
+    def model(self):
+        """嵌入模型（首次使用时按 settings.embedding_runtime 加载）"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = load_embedding_model(self.runtime, self.model_name, self.model_path, self.onnx_file)
+                    print(f"嵌入模型已加载: {self.model_name}（运行时: {self.runtime}）")
+                    if self.cache is not None:
+                        # 维度与缓存不一致时缓存自动失效
+                        self.cache.bind_dimension(self._model.get_sentence_embedding_dimension())
+        return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dimension(self) -> int:
+        """嵌入向量维度"""
+        return self.model.get_sentence_embedding_dimension()
+
+    # ---------------- 编码接口 ----------------
+    def submit(self, texts: List[str]) -> Future:
+        """提交编码请求，返回结果 Future（结果为 float32 矩阵）"""
+        texts = [str(text) for text in texts]
+        if not texts:
+            future = Future()
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+
+        if self.cache is None:
+            return self._enqueue(texts)
+
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        result: Future = Future()
+        if not missing:
+            result.set_result(np.stack(vectors))
+            return result
+
+        missing_texts = [texts[i] for i in missing]
+
+        def _on_encoded(inner: Future):
+            if inner.exception() is not None:
+                result.set_exception(inner.exception())
+                return
+            encoded = inner.result()
+            try:
+                self.cache.put_many(missing_texts, encoded)
+            except Exception as e:
+                print(f"写入嵌入缓存失败: {e}")
+            for position, index in enumerate(missing):
+                vectors[index] = encoded[position]
+            result.set_result(np.stack(vectors))
+
+        self._enqueue(missing_texts).add_done_callback(_on_encoded)
+        return result
+
+    def _enqueue(self, texts: List[str]) -> Future:
+        """将文本放入微批次队列"""
+        request = _EncodeRequest(texts)
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """同步编码，阻塞直到所在批次完成"""
+        return self.submit(texts).result()
+
+    async def encode_async(self, texts: List[str]) -> np.ndarray:
+        """异步编码，等待期间不阻塞事件循环
+
+        缓存查找（锁 + 磁盘读取，可能排在其他进程写入的文件锁之后）放到线程池中执行，
+        事件循环只等待结果。
+        """
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, self.submit, texts)
+        return await asyncio.wrap_future(future)
+
+    def encode_one(self, text: str) -> List[float]:
+        """编码单条文本，返回向量列表"""
+        return self.encode([text])[0].tolist()
+
+    # ---------------- 批处理工作线程 ----------------
+    def _ensure_worker(self):
+        """确保批处理工作线程已启动"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_worker,
+                    name="embedding-batcher",
+                    daemon=True
+                )
+                self._worker.start()
+
+    def _collect_batch(self) -> List[_EncodeRequest]:
+        """从队列收集一个微批次"""
+        first = self._queue.get()
+        batch = [first]
+        text_count = len(first.texts)
+        deadline = first.enqueued_at + self.max_wait
+
+        while text_count < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    # 等待时间已用完，只取走已经排队的请求
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            text_count += len(request.texts)
+
+        return batch
+
+    def _run_worker(self):
+        """工作线程主循环"""
+        while True:
+            batch = self._collect_batch()
+            started_at = time.perf_counter()
+
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self.model.encode(
+                    texts,
+                    batch_size=self.max_batch_size,
+                    convert_to_numpy=True
+                ).astype(np.float32, copy=False)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.cancelled():
+                        request.future.set_exception(e)
+                continue
+
+            finished_at = time.perf_counter()
+            self._record_batch(batch, len(texts), started_at, finished_at)
+
+            offset = 0
+            for request in batch:
+                size = len(request.texts)
+                if not request.future.cancelled():
+                    request.future.set_result(embeddings[offset:offset + size])
+                offset += size
+
+    def _record_batch(self, batch: List[_EncodeRequest], text_count: int, started_at: float, finished_at: float):
+        """记录批次统计"""
+        with self._stats_lock:
+            self._batch_count += 1
+            self._request_count += len(batch)
+            self._text_count += text_count
+            self._max_batch_seen = max(self._max_batch_seen, text_count)
+            self._encode_seconds += finished_at - started_at
+            self._recent_batch_sizes.append(text_count)
+            for request in batch:
+                self._recent_queue_waits.append((started_at - request.enqueued_at) * 1000)
+
+    # ---------------- 统计 ----------------
+    def stats(self) -> Dict[str, Any]:
+        """返回批处理统计信息（批大小、排队等待时间等）"""
+        with self._stats_lock:
+            batch_sizes = list(self._recent_batch_sizes)
+            queue_waits = sorted(self._recent_queue_waits)
+            batch_count = self._batch_count
+            text_count = self._text_count
+            encode_seconds = self._encode_seconds
+
+            return {
+                "model_name": self.model_name,
+                "runtime": self.runtime,
+                "model_id": self.model_id,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "batches": batch_count,
+                "requests": self._request_count,
+                "texts": text_count,
+                "max_batch_seen": self._max_batch_seen,
+                "avg_batch_size": round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else 0,
+                "queue_wait_ms_p50": round(_percentile(queue_waits, 50), 3),
+                "queue_wait_ms_p99": round(_percentile(queue_waits, 99), 3),
+                "texts_per_second": round(text_count / encode_seconds, 2) if encode_seconds else 0,
+                "cache": self.cache.stats() if self.cache is not None else None,
+            }
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """计算已排序数据的百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# 创建全局嵌入服务实例（模型在首次编码时加载）
+embedding_service = EmbeddingService()
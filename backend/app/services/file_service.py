@@ -6,8 +6,10 @@ import gc
 import io
 from datetime import datetime
 from typing import Optional, List, Dict, Tuple
+import re
 import PyPDF2
 import docx
+from docx.oxml.ns import qn
 from fastapi import UploadFile
 import aiohttp
 import asyncio
@@ -28,6 +30,11 @@ except ImportError as e:
 class FileService:
     """文件处理服务"""
 
+    # 支持的上传文件类型
+    PDF_CONTENT_TYPE = "application/pdf"
+    DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    SUPPORTED_CONTENT_TYPES = (PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE)
+
     # 图片上传配置
     IMAGE_UPLOAD_URL = "https://mt.agnet.top/image/upload"
     IMAGE_UPLOAD_TIMEOUT = 30  # 超时时间（秒）
@@ -337,10 +344,15 @@ class FileService:
             raise Exception(f"PDF文件读取失败: {str(e)}")
     
     @staticmethod
-    async def extract_text_from_docx(file_path: str) -> str:
-        """从Word文档提取文本，支持表格内容和图片"""
+    async def extract_text_from_docx(file_path: str, mark_headings: bool = False) -> str:
+        """从Word文档提取文本，支持表格内容和图片
+        
+        Args:
+            file_path: 文件路径
+            mark_headings: 是否用 "#" 前缀标记标题样式段落（"## " 表示二级标题），供知识库分块使用
+        """
         # 直接使用python-docx方法，避免docx2python的表格解析问题
-        return await FileService._extract_docx_with_python_docx(file_path)
+        return await FileService._extract_docx_with_python_docx(file_path, mark_headings)
     
     @staticmethod
     async def _extract_docx_with_docx2python(file_path: str) -> str:
@@ -448,7 +460,7 @@ class FileService:
                 raise Exception(f"Word文档读取失败: {str(e)}")
     
     @staticmethod
-    async def _extract_docx_with_python_docx(file_path: str) -> str:
+    async def _extract_docx_with_python_docx(file_path: str, mark_headings: bool = False) -> str:
         """使用python-docx提取Word文档内容和图片（简化版）"""
         doc = None
         try:
@@ -459,6 +471,10 @@ class FileService:
             for paragraph in doc.paragraphs:
                 text = paragraph.text.strip()
                 if text:
+                    if mark_headings:
+                        level = FileService._docx_heading_level(paragraph)
+                        if level:
+                            text = f"{'#' * level} {text}"
                     extracted_text.append(text)
 
             # 直接返回纯文本内容
@@ -478,8 +494,42 @@ class FileService:
             raise Exception(f"Word文档读取失败: {str(e)}")
     
     @staticmethod
-    async def process_uploaded_file(file: UploadFile) -> str:
-        """处理上传的文件并提取文本内容"""
+    def _docx_heading_level(paragraph) -> int:
+        """根据段落样式（Heading N / 标题 N / Title）或大纲级别返回标题层级，正文返回 0"""
+        style_name = (paragraph.style.name if paragraph.style is not None else "") or ""
+        match = re.match(r"^(?:heading|标题)\s*(\d)$", style_name.strip(), re.IGNORECASE)
+        if match:
+            return min(max(int(match.group(1)), 1), 6)
+        if style_name.strip().lower() in ("title", "标题"):
+            return 1
+
+        # 自定义样式可能通过大纲级别（0 起）标记标题
+        p_pr = paragraph._p.pPr
+        outline = p_pr.find(qn("w:outlineLvl")) if p_pr is not None else None
+        if outline is not None:
+            level = int(outline.get(qn("w:val"), "9"))
+            if level < 6:
+                return level + 1
+        return 0
+    
+    @staticmethod
+    async def extract_text_from_path(file_path: str, content_type: str, mark_headings: bool = False) -> str:
+        """根据文件类型从已保存的文件提取文本"""
+        if content_type == FileService.PDF_CONTENT_TYPE:
+            return await FileService.extract_text_from_pdf(file_path)
+        elif content_type == FileService.DOCX_CONTENT_TYPE:
+            return await FileService.extract_text_from_docx(file_path, mark_headings)
+        else:
+            raise Exception("不支持的文件类型，请上传PDF或Word文档")
+    
+    @staticmethod
+    async def process_uploaded_file(file: UploadFile, mark_headings: bool = False) -> str:
+        """处理上传的文件并提取文本内容
+        
+        Args:
+            file: 上传的文件
+            mark_headings: 是否标记Word标题样式段落（见 extract_text_from_docx）
+        """
         # 检查文件大小
         content = await file.read()
         if len(content) > settings.max_file_size:
@@ -493,12 +543,7 @@ class FileService:
         
         try:
             # 根据文件类型提取文本和图片
-            if file.content_type == "application/pdf":
-                text = await FileService.extract_text_from_pdf(file_path)
-            elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text = await FileService.extract_text_from_docx(file_path)
-            else:
-                raise Exception("不支持的文件类型，请上传PDF或Word文档")
+            text = await FileService.extract_text_from_path(file_path, file.content_type, mark_headings)
 
             # 成功提取后，使用安全的文件清理方法
             FileService._safe_file_cleanup(file_path)
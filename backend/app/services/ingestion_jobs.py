@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库后台导入任务队列"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Optional, AsyncGenerator, Set
+
+import aiofiles
+from fastapi import UploadFile
+
+from ..config import settings
+from ..utils.chunk_util import chunk_document
+from .file_service import FileService
+from .knowledge_base import knowledge_base
+from .knowledge_base_async import async_knowledge_base, OP_READ, OP_WRITE
+from .knowledge_group_manager import knowledge_group_manager
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED)
+
+# 任务阶段（按执行顺序）
+STAGES = ["extracting", "chunking", "indexing", "grouping"]
+
+# 导入方式：新文档插入，或对已有文档增量更新
+MODE_INSERT = "insert"
+MODE_UPSERT = "upsert"
+
+
+def _run_coroutine_in_thread(coroutine_factory, *args):
+    """在工作线程的独立事件循环中运行协程（文本提取包含大量同步解析）"""
+    return asyncio.run(coroutine_factory(*args))
+
+
+class IngestionJobManager:
+    """知识库导入任务管理器
+
+    上传接口只保存文件并登记任务，立即返回任务ID；固定数量的工作协程从队列
+    取出任务，依次执行文本提取、分块、分批嵌入与插入、分组登记。任务状态以
+    JSON 文件持久化在 data/ingestion_jobs 下，服务重启后未完成的任务会重新入队。
+    同一分组中重新上传同名文件（或指定已有文档ID）时对该文档增量更新。
+    """
+
+    def __init__(self, jobs_dir: str = None, concurrency: int = None):
+        self.jobs_dir = jobs_dir or os.path.join(settings.data_dir, "ingestion_jobs")
+        self.files_dir = os.path.join(self.jobs_dir, "files")
+        self.concurrency = concurrency or settings.kb_ingest_concurrency
+
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # 同一文档的增量更新依次执行
+        self._doc_locks: Dict[str, asyncio.Lock] = {}
+
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._load_jobs()
+
+    # ---------------- 持久化 ----------------
+    def _job_file(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _load_jobs(self):
+        """加载已持久化的任务"""
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+                self._jobs[job["job_id"]] = job
+            except Exception as e:
+                print(f"读取导入任务失败 {name}: {e}")
+
+    def _save_job(self, job: Dict[str, Any]):
+        """原子写入任务状态"""
+        tmp_file = self._job_file(job["job_id"]) + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self._job_file(job["job_id"]))
+
+    def _update(self, job: Dict[str, Any], **changes):
+        """更新任务状态、持久化并通知订阅者"""
+        job.update(changes)
+        job["updated_at"] = datetime.now().isoformat()
+        self._save_job(job)
+        for listener in self._listeners.get(job["job_id"], set()):
+            listener.put_nowait(self.snapshot(job))
+
+    @staticmethod
+    def snapshot(job: Dict[str, Any]) -> Dict[str, Any]:
+        """对外展示的任务信息（不包含服务器文件路径）"""
+        return {key: value for key, value in job.items() if key != "file_path"}
+
+    # ---------------- 生命周期 ----------------
+    async def start(self):
+        """启动工作协程，并将未完成的任务重新入队"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(index)) for index in range(self.concurrency)
+        ]
+
+        unfinished = sorted(
+            (job for job in self._jobs.values() if job["status"] not in FINISHED_STATUSES),
+            key=lambda job: job["created_at"]
+        )
+        for job in unfinished:
+            self._update(job, status=STATUS_QUEUED, stage=None)
+            self._queue.put_nowait(job["job_id"])
+        if unfinished:
+            print(f"恢复 {len(unfinished)} 个未完成的导入任务")
+
+    async def stop(self):
+        """停止工作协程，正在执行的任务在下次启动时恢复"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ---------------- 提交与查询 ----------------
+    async def submit(self, file: UploadFile, group_name: str, doc_id: str = None,
+                     replace_existing: bool = True) -> Dict[str, Any]:
+        """保存上传文件并登记导入任务
+
+        Args:
+            file: 上传的文件
+            group_name: 分组名称
+            doc_id: 要增量更新的已有文档ID（须属于该分组）
+            replace_existing: 未指定 doc_id 时，分组中已有同名文件则增量更新该文档
+        """
+        content = await file.read()
+        if len(content) > settings.max_file_size:
+            raise ValueError(f"文件大小超过限制 ({settings.max_file_size / 1024 / 1024}MB)")
+        if file.content_type not in FileService.SUPPORTED_CONTENT_TYPES:
+            raise ValueError("不支持的文件类型，请上传PDF或Word文档")
+
+        if doc_id:
+            if not await async_knowledge_base.run(OP_READ, knowledge_group_manager.has_document, group_name, doc_id):
+                raise ValueError(f"文档 {doc_id} 不在分组 {group_name} 中")
+        elif replace_existing:
+            doc_id = await self._find_previous_upload(group_name, file.filename)
+
+        job_id = uuid.uuid4().hex
+        _, ext = os.path.splitext(file.filename or "")
+        file_path = os.path.join(self.files_dir, f"{job_id}{ext}")
+        async with aiofiles.open(file_path, 'wb') as f:
+            await f.write(content)
+
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": job_id,
+            "group_name": group_name,
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "file_path": file_path,
+            "doc_id": doc_id or f"doc_{str(uuid.uuid4()).replace('-', '_')}",
+            "mode": MODE_UPSERT if doc_id else MODE_INSERT,
+            "status": STATUS_QUEUED,
+            "stage": None,
+            "stages": {},
+            "attempts": 0,
+            "chunk_count": 0,
+            "indexed_count": 0,
+            "deduplicated_count": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._jobs[job_id] = job
+        self._save_job(job)
+        if self._queue is None:
+            await self.start()
+        self._queue.put_nowait(job_id)
+        return self.snapshot(job)
+
+    async def _find_previous_upload(self, group_name: str, filename: str) -> Optional[str]:
+        """同一分组中同名文件最近一次成功导入的文档ID（文档仍在分组中）"""
+        previous = sorted(
+            (job for job in self._jobs.values()
+             if job["group_name"] == group_name and job["filename"] == filename and job["status"] == STATUS_COMPLETED),
+            key=lambda job: job["created_at"], reverse=True
+        )
+        doc_ids = [job["doc_id"] for job in previous]
+        # 分组成员判断访问分组数据库，在线程池中执行
+        return await async_knowledge_base.run(OP_READ, self._first_in_group, group_name, doc_ids)
+
+    @staticmethod
+    def _first_in_group(group_name: str, doc_ids: List[str]) -> Optional[str]:
+        return next((doc_id for doc_id in doc_ids if knowledge_group_manager.has_document(group_name, doc_id)), None)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return self.snapshot(job) if job else None
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        jobs = sorted(self._jobs.values(), key=lambda job: job["created_at"], reverse=True)
+        return [self.snapshot(job) for job in jobs[:limit]]
+
+    async def watch(self, job_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """订阅任务进度，任务结束后停止"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, set()).add(listener)
+        try:
+            snapshot = self.snapshot(job)
+            yield snapshot
+            while snapshot["status"] not in FINISHED_STATUSES:
+                snapshot = await listener.get()
+                yield snapshot
+        finally:
+            self._listeners[job_id].discard(listener)
+            if not self._listeners[job_id]:
+                del self._listeners[job_id]
+
+    # ---------------- 任务执行 ----------------
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            try:
+                if job is not None and job["status"] not in FINISHED_STATUSES:
+                    await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"导入任务失败 {job_id}: {e}")
+                if job is not None:
+                    self._update(job, status=STATUS_FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _run_stage(self, job: Dict[str, Any], stage: str, func, *args, operation: str = None):
+        """在线程池中执行一个阶段并记录耗时（指定 operation 时使用知识库线程池及其并发限制）"""
+        started_at = time.perf_counter()
+        stages = dict(job["stages"])
+        stages[stage] = {"started_at": datetime.now().isoformat(), "duration_ms": None}
+        self._update(job, stage=stage, stages=stages)
+
+        if operation:
+            result = await async_knowledge_base.run(operation, func, *args)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, func, *args)
+
+        stages = dict(job["stages"])
+        stages[stage] = {**stages[stage], "duration_ms": round((time.perf_counter() - started_at) * 1000, 1)}
+        self._update(job, stages=stages)
+        return result
+
+    async def _process(self, job: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        self._update(job, status=STATUS_RUNNING, attempts=job["attempts"] + 1, error=None, stages={})
+
+        upsert = job.get("mode") == MODE_UPSERT
+        # 重试或恢复的任务先清理上次写入的部分数据（增量更新可直接重新执行）
+        if job["attempts"] > 1 and not upsert:
+            await async_knowledge_base.delete_document(job["doc_id"])
+
+        text = await self._run_stage(
+            job, "extracting", _run_coroutine_in_thread,
+            FileService.extract_text_from_path, job["file_path"], job["content_type"], True
+        )
+
+        documents = await self._run_stage(
+            job, "chunking", lambda: chunk_document(
+                text,
+                doc_id=job["doc_id"],
+                source_name=job["filename"],
+                max_tokens=settings.kb_chunk_max_tokens,
+                overlap_tokens=settings.kb_chunk_overlap_tokens
+            )
+        )
+        if not documents:
+            raise ValueError("未能从文件中提取到文本内容")
+        # 分块写入所属分组的分区，支持按分组检索
+        for document in documents:
+            document["group"] = job["group_name"]
+        self._update(job, chunk_count=len(documents))
+
+        def report_progress(indexed: int, total: int):
+            loop.call_soon_threadsafe(lambda: self._update(job, indexed_count=indexed))
+
+        if upsert:
+            # 只嵌入新增的分块，删除不再出现的分块
+            lock = self._doc_locks.setdefault(job["doc_id"], asyncio.Lock())
+            async with lock:
+                result = await self._run_stage(
+                    job, "indexing",
+                    lambda: knowledge_base.upsert_document(job["doc_id"], documents, progress_callback=report_progress),
+                    operation=OP_WRITE
+                )
+        else:
+            result = await self._run_stage(
+                job, "indexing", lambda: knowledge_base.add_documents(documents, progress_callback=report_progress),
+                operation=OP_WRITE
+            )
+        stages = dict(job["stages"])
+        stages["indexing"] = {**stages["indexing"], **result}
+        # 重复分块链接到已有条目而不再插入
+        changes = {"deduplicated_count": result["deduplicated"]}
+        if upsert:
+            changes.update(added_count=result["added"], deleted_count=result["deleted"],
+                           unchanged_count=result["unchanged"])
+        self._update(job, stages=stages, **changes)
+
+        try:
+            await self._run_stage(
+                job, "grouping", knowledge_group_manager.add_document_to_group, job["group_name"], job["doc_id"]
+            )
+        except ValueError:
+            # 分组在导入期间开始删除，撤销已写入的条目
+            await async_knowledge_base.delete_document(job["doc_id"])
+            raise
+
+        FileService._safe_file_cleanup(job["file_path"])
+        self._update(job, status=STATUS_COMPLETED, stage=None)
+        print(f"导入任务完成 {job['job_id']}: {job['filename']}，{len(documents)} 个分块，"
+              f"去重 {job['deduplicated_count']} 个")
+
+
+# 创建全局导入任务管理器实例（工作协程在应用启动时启动）
+ingestion_job_manager = IngestionJobManager()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库快照 - 导出/恢复向量、元数据与分组映射，恢复时不重新嵌入"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+from ..config import settings
+from .knowledge_base_backend import DEFAULT_FIELDS
+from .knowledge_base import knowledge_base
+from .knowledge_group_manager import knowledge_group_manager
+
+SNAPSHOT_FORMAT = 1
+
+# 快照目录中的文件
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.bin"  # 原始向量矩阵（行优先，按 manifest 中的 dtype 与维度解释）
+METADATA_FILE = "metadata.json"  # 列式元数据：字段名 -> 按行排列的值
+GROUPS_FILE = "knowledge_groups.json"
+LINKS_FILE = "dedup_links.jsonl"
+
+SNAPSHOT_FIELDS = [*DEFAULT_FIELDS, 'group', 'granularity']
+# 较早的快照没有的列，恢复时按空值处理
+OPTIONAL_FIELDS = ['granularity']
+VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _model_id(backend) -> str:
+    """生成存储中向量的嵌入模型标识"""
+    service = backend.embedding_service
+    return getattr(service, "model_id", None) or service.model_name
+
+
+class KnowledgeBaseSnapshots:
+    """知识库快照管理
+
+    导出时分批读取全部条目及其向量：向量写成原始 float32/float16 矩阵文件，
+    元数据按列写成 JSON，同时保存分组映射和去重链接，manifest 记录行数、维度、
+    嵌入模型与各文件的 sha256。恢复时先校验全部文件，再清空知识库，按
+    kb_snapshot_batch_size 分批直接插入向量，不经过嵌入模型。
+    """
+
+    def __init__(self, backend=None, snapshot_dir: str = None, group_manager=None):
+        self.backend = backend or knowledge_base
+        self.snapshot_dir = snapshot_dir or settings.kb_snapshot_dir or os.path.join(settings.data_dir, "snapshots")
+        self.group_manager = group_manager or knowledge_group_manager
+
+    def _path(self, name: str) -> str:
+        if not _NAME_PATTERN.match(name or "") or name.startswith("."):
+            raise ValueError(f"快照名称只能包含字母、数字、下划线、点和连字符: {name}")
+        return os.path.join(self.snapshot_dir, name)
+
+    # ---------------- 查询 ----------------
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        """全部快照的 manifest，按创建时间倒序"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.snapshot_dir):
+            manifest_file = os.path.join(self.snapshot_dir, name, MANIFEST_FILE)
+            if os.path.exists(manifest_file):
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+        return sorted(manifests, key=lambda manifest: manifest.get("created_at", ""), reverse=True)
+
+    def get_manifest(self, name: str) -> Dict[str, Any]:
+        manifest_file = os.path.join(self._path(name), MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            raise FileNotFoundError(f"快照不存在: {name}")
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # ---------------- 导出 ----------------
+    def export(self, name: str = None, dtype: str = None) -> Dict[str, Any]:
+        """导出当前知识库为快照
+
+        Args:
+            name: 快照名称，默认按时间生成
+            dtype: 向量精度 "float32" 或 "float16"，默认 settings.kb_snapshot_dtype
+
+        Returns:
+            快照 manifest（附导出耗时 elapsed_ms）
+        """
+        name = name or datetime.now().strftime("kb-%Y%m%d-%H%M%S")
+        path = self._path(name)
+        dtype = dtype or settings.kb_snapshot_dtype
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"不支持的向量精度: {dtype}，可选 {', '.join(VECTOR_DTYPES)}")
+        if os.path.exists(path):
+            raise ValueError(f"快照已存在: {name}")
+
+        started_at = time.perf_counter()
+        groups_data = self.group_manager.export_data()
+        group_names = [group["name"] for group in groups_data.get("groups", [])]
+        group_names += [group for group in groups_data.get("group_documents", {}) if group not in group_names]
+
+        # 先写入临时目录，完成后整体改名，中断的导出不会留下不完整的快照
+        tmp_dir = path + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            columns: Dict[str, List[str]] = {field: [] for field in SNAPSHOT_FIELDS}
+            rows, dimension = 0, 0
+            with open(os.path.join(tmp_dir, VECTORS_FILE), 'wb') as f:
+                for batch, embeddings in self.backend.iter_embeddings(group_names, settings.kb_snapshot_batch_size):
+                    if not batch:
+                        continue
+                    embeddings = np.ascontiguousarray(embeddings, dtype=VECTOR_DTYPES[dtype])
+                    dimension = dimension or int(embeddings.shape[1])
+                    f.write(embeddings.tobytes())
+                    for field in SNAPSHOT_FIELDS:
+                        columns[field].extend(str(row.get(field) or '') for row in batch)
+                    rows += len(batch)
+
+            with open(os.path.join(tmp_dir, METADATA_FILE), 'w', encoding='utf-8') as f:
+                json.dump(columns, f, ensure_ascii=False)
+            with open(os.path.join(tmp_dir, GROUPS_FILE), 'w', encoding='utf-8') as f:
+                json.dump(groups_data, f, ensure_ascii=False, indent=2)
+            linked_chunks = self.backend.dedup_index.export_links(os.path.join(tmp_dir, LINKS_FILE))
+
+            files = [VECTORS_FILE, METADATA_FILE, GROUPS_FILE, LINKS_FILE]
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "name": name,
+                "created_at": datetime.now().isoformat(),
+                "backend": self.backend.backend_name,
+                "model_id": _model_id(self.backend),
+                "rows": rows,
+                "dimension": dimension,
+                "dtype": dtype,
+                "linked_chunks": linked_chunks,
+                "files": {
+                    file: {"bytes": os.path.getsize(os.path.join(tmp_dir, file)),
+                           "sha256": _sha256(os.path.join(tmp_dir, file))}
+                    for file in files
+                },
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_dir, path)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        elapsed_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        print(f"知识库快照已导出: {name}，{rows} 条，耗时 {elapsed_ms} ms")
+        return {**manifest, "elapsed_ms": elapsed_ms}
+
+    # ---------------- 恢复 ----------------
+    def verify(self, name: str) -> Dict[str, Any]:
+        """校验快照文件的大小和 sha256，失败抛出 ValueError"""
+        path = self._path(name)
+        manifest = self.get_manifest(name)
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"不支持的快照格式版本: {manifest.get('format')}")
+        if manifest.get("dtype") not in VECTOR_DTYPES:
+            raise ValueError(f"不支持的向量精度: {manifest.get('dtype')}")
+
+        for file, expected in manifest["files"].items():
+            file_path = os.path.join(path, file)
+            if not os.path.exists(file_path):
+                raise ValueError(f"快照文件缺失: {file}")
+            if os.path.getsize(file_path) != expected["bytes"] or _sha256(file_path) != expected["sha256"]:
+                raise ValueError(f"快照文件校验失败: {file}")
+
+        itemsize = np.dtype(VECTOR_DTYPES[manifest["dtype"]]).itemsize
+        if manifest["files"][VECTORS_FILE]["bytes"] != manifest["rows"] * manifest["dimension"] * itemsize:
+            raise ValueError("向量文件大小与行数、维度不一致")
+        return manifest
+
+    def restore(self, name: str, progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """用快照替换当前知识库的全部内容（向量、元数据、分组映射和去重链接）
+
+        先校验快照和嵌入模型，校验通过后才清空知识库；恢复中途失败时知识库只有部分
+        条目，重新执行恢复即可。
+
+        Args:
+            name: 快照名称
+            progress_callback: 每批插入后回调 (已恢复数量, 总数量)
+
+        Returns:
+            恢复的条目数 rows、耗时 elapsed_ms 与速率 rows_per_second
+        """
+        manifest = self.verify(name)
+        model_id = _model_id(self.backend)
+        if manifest["model_id"] != model_id:
+            raise ValueError(f"快照的嵌入模型 {manifest['model_id']} 与当前知识库的 {model_id} 不一致")
+
+        path = self._path(name)
+        with open(os.path.join(path, METADATA_FILE), 'r', encoding='utf-8') as f:
+            columns = json.load(f)
+        rows = manifest["rows"]
+        for field in OPTIONAL_FIELDS:
+            columns.setdefault(field, [''] * rows)
+        if any(len(columns.get(field, [])) != rows for field in SNAPSHOT_FIELDS):
+            raise ValueError("元数据行数与向量行数不一致")
+        vectors: Optional[np.memmap] = None
+        if rows:
+            vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=VECTOR_DTYPES[manifest["dtype"]],
+                                mode='r', shape=(rows, manifest["dimension"]))
+
+        started_at = time.perf_counter()
+        self.backend.clear_all_documents()
+        with open(os.path.join(path, GROUPS_FILE), 'r', encoding='utf-8') as f:
+            self.group_manager.import_data(json.load(f))
+
+        batch_size = max(settings.kb_snapshot_batch_size, 1)
+        for start in range(0, rows, batch_size):
+            end = min(start + batch_size, rows)
+            documents = [{field: columns[field][index] for field in SNAPSHOT_FIELDS} for index in range(start, end)]
+            self.backend.load_entries(documents, np.asarray(vectors[start:end], dtype=np.float32))
+            if progress_callback:
+                progress_callback(end, rows)
+        self.backend.dedup_index.import_links(os.path.join(path, LINKS_FILE))
+
+        elapsed = time.perf_counter() - started_at
+        print(f"知识库快照已恢复: {name}，{rows} 条，耗时 {elapsed:.1f} 秒")
+        return {
+            "name": name,
+            "rows": rows,
+            "linked_chunks": manifest.get("linked_chunks", 0),
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def delete(self, name: str):
+        path = self._path(name)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"快照不存在: {name}")
+        shutil.rmtree(path)
+
+
+# 全局快照管理实例
+kb_snapshots = KnowledgeBaseSnapshots()
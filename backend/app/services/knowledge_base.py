@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库实例 - 根据配置选择 Milvus 或进程内向量存储后端"""
+
+import threading
+from typing import Callable, Optional
+
+from ..config import settings
+from .knowledge_base_backend import KnowledgeBaseBackend
+
+
+def create_knowledge_base() -> KnowledgeBaseBackend:
+    """根据配置创建知识库后端
+
+    settings.knowledge_base_backend 为 "local" 或 settings.enable_milvus 为 False 时
+    使用进程内向量存储，否则使用 Milvus。
+    """
+    if not settings.enable_milvus or settings.knowledge_base_backend == "local":
+        from .local_vector_store import LocalKnowledgeBase
+        print("使用本地向量存储作为知识库后端")
+        return LocalKnowledgeBase()
+
+    from .milvus_service import MilvusKnowledgeBase
+    return MilvusKnowledgeBase()
+
+
+class LazyKnowledgeBase:
+    """延迟创建的知识库代理
+
+    导入模块时不连接 Milvus、不加载存储；首次访问属性时才创建后端实例，
+    之后所有属性访问都转发给该实例。启动预热（见 warmup 模块）会在后台线程中
+    提前触发创建。
+    """
+
+    def __init__(self, factory: Callable[[], KnowledgeBaseBackend]):
+        self._factory = factory
+        self._backend: Optional[KnowledgeBaseBackend] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._backend is not None
+
+    def get(self) -> KnowledgeBaseBackend:
+        """获取后端实例（首次调用时创建，可能耗时较长）"""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._factory()
+        return self._backend
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# 创建全局知识库实例（首次使用时初始化）
+knowledge_base = LazyKnowledgeBase(create_knowledge_base)
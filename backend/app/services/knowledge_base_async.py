@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库异步接口 - 所有阻塞操作在专用线程池中执行，不占用事件循环"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List, Dict, Any, Optional, Callable
+
+from ..config import settings
+from .knowledge_base import knowledge_base
+from .knowledge_base_backend import DEFAULT_FIELDS, LEVEL_FINE
+from .embedding_service import _percentile
+
+# 操作类别
+OP_SEARCH = "search"  # 检索（嵌入 + 向量/词法检索）
+OP_READ = "read"      # 按ID查询、计数、分组文档列表等
+OP_WRITE = "write"    # 插入、删除、清空
+
+
+class _OperationStats:
+    """单个操作类别的并发与耗时统计"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=1000)
+        self.queue_waits = deque(maxlen=1000)
+
+
+class AsyncKnowledgeBase:
+    """知识库异步门面
+
+    路由和服务通过该类访问知识库。阻塞的存储操作（Milvus RPC、本地检索、
+    分组管理中的批量查询）提交到专用的有界线程池；查询嵌入通过嵌入服务的
+    异步接口生成。每类操作有独立的并发上限，超出上限的请求在事件循环中排队，
+    排队数量、执行数量和耗时可通过 stats 查看。
+    """
+
+    def __init__(self, max_workers: int = None, limits: Dict[str, int] = None):
+        self.max_workers = max_workers or settings.kb_executor_workers
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="kb-async")
+        limits = limits or {
+            OP_SEARCH: settings.kb_search_concurrency,
+            OP_READ: settings.kb_read_concurrency,
+            OP_WRITE: settings.kb_write_concurrency,
+        }
+        self._operations = {name: _OperationStats(limit) for name, limit in limits.items()}
+        self._stats_lock = threading.Lock()
+
+    # ---------------- 执行 ----------------
+    @asynccontextmanager
+    async def _limit(self, operation: str):
+        """按操作类别限制并发并记录排队与执行耗时"""
+        stats = self._operations[operation]
+        enqueued_at = time.perf_counter()
+        stats.waiting += 1
+        try:
+            await stats.semaphore.acquire()
+        finally:
+            stats.waiting -= 1
+        started_at = time.perf_counter()
+        stats.running += 1
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            stats.running -= 1
+            stats.semaphore.release()
+            with self._stats_lock:
+                stats.completed += 1
+                stats.errors += int(failed)
+                stats.queue_waits.append((started_at - enqueued_at) * 1000)
+                stats.latencies.append((time.perf_counter() - started_at) * 1000)
+
+    async def _offload(self, func: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def _backend(self):
+        """获取知识库后端，尚未初始化时在线程池中创建"""
+        if knowledge_base.is_initialized:
+            return knowledge_base.get()
+        return await self._offload(knowledge_base.get)
+
+    async def run(self, operation: str, func: Callable, *args, **kwargs):
+        """在知识库线程池中执行任意阻塞函数（如分组管理中的知识库查询）"""
+        async with self._limit(operation):
+            return await self._offload(func, *args, **kwargs)
+
+    async def _run_backend(self, operation: str, method: str, *args, **kwargs):
+        """在线程池中执行知识库后端方法；后端在线程池中解析，不在事件循环中初始化"""
+        async with self._limit(operation):
+            backend = await self._backend()
+            return await self._offload(getattr(backend, method), *args, **kwargs)
+
+    # ---------------- 检索 ----------------
+    async def search(self, query: str, top_k: int = 5, keyword: str = None,
+                     groups: List[str] = None, level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """向量检索，参数与返回值同 KnowledgeBaseBackend.search"""
+        async with self._limit(OP_SEARCH):
+            backend = await self._backend()
+            query_embedding = (await backend.embedding_service.encode_async([query]))[0].tolist()
+            return await self._offload(backend._cached_search, query_embedding, top_k, keyword, groups, level)
+
+    async def batch_search(self, queries: List[str], top_k: int = 5, keyword: str = None,
+                           groups: List[str] = None, level: str = LEVEL_FINE) -> List[List[Dict[str, Any]]]:
+        """批量检索，参数与返回值同 KnowledgeBaseBackend.batch_search"""
+        if not queries:
+            return []
+        async with self._limit(OP_SEARCH):
+            backend = await self._backend()
+            query_embeddings = await backend.embedding_service.encode_async(list(queries))
+            return await self._offload(backend._cached_search_many, query_embeddings, top_k, keyword, groups, level)
+
+    async def hybrid_search(self, query: str, top_k: int = 5, keyword: str = None, groups: List[str] = None,
+                            level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """混合检索，参数与返回值同 KnowledgeBaseBackend.hybrid_search"""
+        async with self._limit(OP_SEARCH):
+            backend = await self._backend()
+            started_at = time.perf_counter()
+            lexical_future = backend._submit_lexical(query, top_k, keyword, groups, level)
+            query_embedding = (await backend.embedding_service.encode_async([query]))[0].tolist()
+            return await self._offload(backend._fuse, started_at, query_embedding, lexical_future, top_k, groups, level)
+
+    async def similar_documents(self, doc_id: str, top_k: int = 5, groups: List[str] = None,
+                                chunk_id: str = None) -> Optional[List[Dict[str, Any]]]:
+        """以已存储的向量检索相似章节，参数与返回值同 KnowledgeBaseBackend.similar_documents"""
+        return await self._run_backend(OP_SEARCH, 'similar_documents', doc_id, top_k, groups, chunk_id)
+
+    async def lexical_search(self, query: str, top_k: int = 5, wait: bool = False, groups: List[str] = None,
+                             level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """BM25 词法检索，参数与返回值同 KnowledgeBaseBackend.lexical_search"""
+        return await self._run_backend(OP_SEARCH, 'lexical_search', query, top_k, wait, groups, level)
+
+    async def get_reference_sections(self, section_title: str, section_content: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """获取生成章节内容的参考章节，参数与返回值同 KnowledgeBaseBackend.get_reference_sections"""
+        return await self._run_backend(OP_SEARCH, 'get_reference_sections', section_title, section_content, top_k)
+
+    # ---------------- 查询 ----------------
+    async def reference_embeddings(self, query: str, candidates: List[Dict[str, Any]]):
+        """参考资料打包所需的查询向量与候选向量，同 KnowledgeBaseBackend.reference_embeddings"""
+        return await self._run_backend(OP_SEARCH, 'reference_embeddings', query, candidates)
+
+    async def get_document_count(self) -> int:
+        return await self._run_backend(OP_READ, 'get_document_count')
+
+    async def get_document_by_id(self, doc_id: str, fields: List[str] = DEFAULT_FIELDS) -> Optional[Dict[str, Any]]:
+        return await self._run_backend(OP_READ, 'get_document_by_id', doc_id, fields)
+
+    async def get_documents_by_ids(self, doc_ids: List[str], fields: List[str] = DEFAULT_FIELDS) -> Dict[str, Dict[str, Any]]:
+        return await self._run_backend(OP_READ, 'get_documents_by_ids', doc_ids, fields)
+
+    async def status(self) -> Dict[str, Any]:
+        return await self._run_backend(OP_READ, 'status')
+
+    # ---------------- 写入 ----------------
+    async def add_documents(self, documents: List[Dict[str, Any]],
+                            progress_callback: Callable[[int, int], None] = None) -> Dict[str, float]:
+        return await self._run_backend(OP_WRITE, 'add_documents', documents, progress_callback)
+
+    async def delete_document(self, doc_id: str):
+        return await self._run_backend(OP_WRITE, 'delete_document', doc_id)
+
+    async def delete_documents(self, doc_ids: List[str]):
+        return await self._run_backend(OP_WRITE, 'delete_documents', doc_ids)
+
+    async def clear_all_documents(self):
+        return await self._run_backend(OP_WRITE, 'clear_all_documents')
+
+    # ---------------- 统计 ----------------
+    def stats(self) -> Dict[str, Any]:
+        """返回线程池排队深度与各类操作的并发、耗时统计"""
+        operations = {}
+        with self._stats_lock:
+            for name, stats in self._operations.items():
+                latencies = sorted(stats.latencies)
+                queue_waits = sorted(stats.queue_waits)
+                operations[name] = {
+                    "limit": stats.limit,
+                    "waiting": stats.waiting,
+                    "running": stats.running,
+                    "completed": stats.completed,
+                    "errors": stats.errors,
+                    "latency_ms_p50": round(_percentile(latencies, 50), 3),
+                    "latency_ms_p99": round(_percentile(latencies, 99), 3),
+                    "queue_wait_ms_p99": round(_percentile(queue_waits, 99), 3),
+                }
+        return {
+            "max_workers": self.max_workers,
+            "executor_queue_depth": self._executor._work_queue.qsize(),
+            "operations": operations,
+        }
+
+
+# 创建全局知识库异步接口实例
+async_knowledge_base = AsyncKnowledgeBase()
@@ -0,0 +1,616 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库后端接口"""
+
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+
+import numpy as np
+
+from ..config import settings
+from ..utils.chunk_util import compute_chunk_id, estimate_tokens, split_into_windows
+from .embedding_service import embedding_service, encode_pooled
+from .dedup_index import DedupIndex
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion, entry_key
+from .search_cache import SearchCache
+
+# 文档默认返回字段
+DEFAULT_FIELDS = ['doc_id', 'section_title', 'summary', 'title_path']
+
+# 条目粒度：普通分块；超长条目切分出的窗口；超长条目整体的池化向量
+GRANULARITY_CHUNK = ""
+GRANULARITY_WINDOW = "window"
+GRANULARITY_DOCUMENT = "document"
+
+# 检索粒度：fine 检索分块和窗口（默认），coarse 检索分块和池化文档向量
+LEVEL_FINE = "fine"
+LEVEL_COARSE = "coarse"
+EXCLUDED_GRANULARITY = {LEVEL_FINE: GRANULARITY_DOCUMENT, LEVEL_COARSE: GRANULARITY_WINDOW}
+
+
+class KnowledgeBaseBackend(ABC):
+    """知识库后端接口
+
+    Milvus 与进程内向量存储实现相同的 search / add_documents / delete_document 契约。
+    查询嵌入统一由嵌入服务生成，子类只需实现基于向量的检索和存储操作。
+    词法索引（BM25）由基类维护，随入库和删除增量更新，用于混合检索。
+    向量检索结果由基类缓存，写入操作完成后递增集合代数使缓存失效。
+    导入时由基类去重：重复分块不插入，链接到已有条目。
+    """
+
+    # 后端名称，用于状态展示
+    backend_name = "base"
+
+    def __init__(self):
+        # 嵌入服务（并发请求合并为微批次编码）
+        # 模型名称由 settings.embedding_model_name 配置，如 'Qwen/Qwen3-Embedding-0.6'
+        self.embedding_service = embedding_service
+
+        # 词法索引：首次使用时在后台线程中从存储全量构建
+        self.lexical_index = LexicalIndex()
+        self._lexical_build_lock = threading.Lock()
+        self._lexical_build_thread: Optional[threading.Thread] = None
+        self._lexical_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="kb-lexical")
+
+        # 向量检索结果缓存
+        self.search_cache = SearchCache()
+
+        # 导入去重索引（首次导入时从存储构建）
+        self.dedup_index = DedupIndex()
+
+        # 相似章节检索使用的已存储向量：doc_id -> (集合代数, 分块, 向量矩阵)，LRU 淘汰
+        self._stored_vectors: "OrderedDict[str, Tuple[int, List[Dict[str, Any]], np.ndarray]]" = OrderedDict()
+        self._stored_vectors_lock = threading.Lock()
+
+    # ---------------- 检索 ----------------
+    def search(self, query: str, top_k: int = 5, keyword: str = None, groups: List[str] = None,
+               level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """搜索知识库 - 混合检索（向量 + 标题关键词）
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            keyword: 标题关键词，用于精确匹配章节标题
+            groups: 只检索这些分组中的文档，None 表示全部
+            level: 检索粒度，fine 检索分块与长文本窗口，coarse 检索分块与长文本的池化向量
+
+        Returns:
+            搜索结果列表，包含 doc_id, section_title, summary, title_path, score 字段
+        """
+        # 生成查询嵌入
+        query_embedding = self.embedding_service.encode_one(query)
+        return self._cached_search(query_embedding, top_k, keyword, groups, level)
+
+    def _cached_search(self, query_embedding: List[float], top_k: int = 5, keyword: str = None,
+                       groups: List[str] = None, level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """使用已生成的查询向量检索，优先返回当前集合代数下缓存的结果"""
+        key = self.search_cache.make_key(query_embedding, top_k, keyword, groups, level)
+        results = self.search_cache.get(key)
+        if results is not None:
+            return results
+
+        generation = self.search_cache.generation
+        started_at = time.perf_counter()
+        results = self._search_by_embedding(query_embedding, top_k, keyword, groups, level)
+        self.search_cache.put(key, results, generation, (time.perf_counter() - started_at) * 1000)
+        return results
+
+    @abstractmethod
+    def _search_by_embedding(self, query_embedding: List[float], top_k: int = 5, keyword: str = None,
+                             groups: List[str] = None, level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """使用已生成的查询向量执行检索，groups 限定检索的分组，level 为检索粒度"""
+
+    def batch_search(self, queries: List[str], top_k: int = 5, keyword: str = None,
+                     groups: List[str] = None, level: str = LEVEL_FINE) -> List[List[Dict[str, Any]]]:
+        """批量检索多个查询（如提纲的全部叶子章节）
+
+        所有查询在一次 encode 中生成嵌入，未命中缓存的查询向量合并为多向量检索。
+
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的结果数量
+            keyword: 标题关键词，作用于全部查询
+            groups: 只检索这些分组中的文档，None 表示全部
+            level: 检索粒度，同 search
+
+        Returns:
+            与 queries 一一对应的搜索结果列表
+        """
+        if not queries:
+            return []
+        query_embeddings = self.embedding_service.encode(list(queries))
+        return self._cached_search_many(query_embeddings, top_k, keyword, groups, level)
+
+    def _cached_search_many(self, query_embeddings, top_k: int = 5, keyword: str = None,
+                            groups: List[str] = None, level: str = LEVEL_FINE) -> List[List[Dict[str, Any]]]:
+        """批量版本的 _cached_search，未命中缓存的查询向量一次提交检索"""
+        keys = [self.search_cache.make_key(embedding, top_k, keyword, groups, level) for embedding in query_embeddings]
+        results = [self.search_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        generation = self.search_cache.generation
+        started_at = time.perf_counter()
+        searched = self._search_by_embeddings([query_embeddings[i] for i in missing], top_k, keyword, groups, level)
+        latency_ms = (time.perf_counter() - started_at) * 1000 / len(missing)
+        for index, result in zip(missing, searched):
+            self.search_cache.put(keys[index], result, generation, latency_ms)
+            results[index] = result
+        return results
+
+    def _search_by_embeddings(self, query_embeddings: List[List[float]], top_k: int = 5, keyword: str = None,
+                              groups: List[str] = None, level: str = LEVEL_FINE) -> List[List[Dict[str, Any]]]:
+        """使用多个查询向量检索，子类可以合并为一次请求"""
+        return [self._search_by_embedding(embedding, top_k, keyword, groups, level) for embedding in query_embeddings]
+
+    def get_reference_sections(self, section_title: str, section_content: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """获取用于生成章节内容的参考章节
+        
+        根据输入的章节标题和内容，在知识库中搜索相似的章节。
+        章节标题作为词法检索的加权词项（而不是标题过滤条件），与内容向量
+        相似性的结果做倒数排名融合，返回最相关的章节供参考。
+        
+        Args:
+            section_title: 要生成的章节标题
+            section_content: 要生成的章节内容（或大纲）
+            top_k: 返回参考章节数量
+            
+        Returns:
+            参考章节列表，包含 doc_id, section_title, summary, title_path, score 字段
+        """
+        # 使用章节内容生成查询向量
+        query_text = f"{section_title} {section_content}"
+        
+        # 使用混合检索获取参考章节
+        reference_sections = self.hybrid_search(query_text, top_k=top_k, keyword=section_title)
+        
+        print(f"为章节 '{section_title}' 找到 {len(reference_sections)} 个参考章节")
+        
+        return reference_sections
+
+    # ---------------- 相似章节 ----------------
+    def similar_documents(self, doc_id: str, top_k: int = 5, groups: List[str] = None,
+                          chunk_id: str = None) -> Optional[List[Dict[str, Any]]]:
+        """以文档已存储的向量检索相似章节，不经过嵌入模型
+
+        默认以文档全部分块向量的平均方向为查询向量，指定 chunk_id 时使用该分块的向量；
+        结果不包含文档自身的分块。
+
+        Returns:
+            搜索结果列表（字段同 search）；文档或分块没有存储的向量时返回 None
+        """
+        stored = self.stored_embeddings(doc_id)
+        if stored is None:
+            return None
+        rows, vectors = stored
+        if chunk_id:
+            matches = [index for index, row in enumerate(rows) if self._chunk_id(row) == chunk_id]
+            if not matches:
+                return None
+            query_embedding = vectors[matches[0]]
+        else:
+            normalized = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            query_embedding = normalized.mean(axis=0)
+
+        # 多取文档自身分块的数量，过滤后仍有 top_k 个结果
+        depth = min(top_k + len(rows), max(settings.kb_similar_max_candidates, top_k))
+        results = self._cached_search(query_embedding.tolist(), depth, None, groups)
+        return [result for result in results if result.get('doc_id') != doc_id][:top_k]
+
+    def stored_embeddings(self, doc_id: str) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """文档已存储的分块及其向量，按集合代数缓存（写入后失效）"""
+        generation = self.search_cache.generation
+        with self._stored_vectors_lock:
+            cached = self._stored_vectors.get(doc_id)
+            if cached is not None and cached[0] == generation:
+                self._stored_vectors.move_to_end(doc_id)
+                return cached[1], cached[2]
+
+        rows, vectors = self._fetch_embeddings(doc_id)
+        if not rows:
+            return None
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._stored_vectors_lock:
+            self._stored_vectors[doc_id] = (generation, rows, vectors)
+            self._stored_vectors.move_to_end(doc_id)
+            while len(self._stored_vectors) > max(settings.kb_similar_cache_entries, 1):
+                self._stored_vectors.popitem(last=False)
+        return rows, vectors
+
+    def reference_embeddings(self, query: str, candidates: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """参考资料打包所需的查询向量与候选向量
+
+        候选使用已存储的向量（按文档读取并缓存），找不到对应条目的候选才与查询一起编码。
+        """
+        stored: Dict[str, Dict[Tuple[str, str, str], np.ndarray]] = {}
+        vectors: List[Optional[np.ndarray]] = []
+        for candidate in candidates:
+            doc_id = candidate.get('doc_id')
+            if doc_id not in stored:
+                fetched = self.stored_embeddings(doc_id) if doc_id else None
+                stored[doc_id] = {} if fetched is None else {
+                    (row.get('section_title'), row.get('summary'), row.get('title_path')): vector
+                    for row, vector in zip(*fetched)
+                }
+            key = (candidate.get('section_title'), candidate.get('summary'), candidate.get('title_path'))
+            vectors.append(stored[doc_id].get(key))
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        embeddings = np.asarray(self.embedding_service.encode(
+            [query] + [str(candidates[i].get('summary') or '') for i in missing]
+        ), dtype=np.float32)
+        for i, embedding in zip(missing, embeddings[1:]):
+            vectors[i] = embedding
+        return embeddings[0], np.asarray(vectors, dtype=np.float32).reshape(len(candidates), -1)
+
+    @abstractmethod
+    def _fetch_embeddings(self, doc_id: str) -> Tuple[List[Dict[str, Any]], Any]:
+        """从存储读取文档全部分块（DEFAULT_FIELDS）及对应的向量矩阵"""
+
+    # ---------------- 混合检索 ----------------
+    def ensure_lexical_index(self, wait: bool = False):
+        """启动词法索引的后台构建（已构建或正在构建时直接返回）
+
+        Args:
+            wait: 是否等待构建完成
+        """
+        with self._lexical_build_lock:
+            if self.lexical_index.state in (LexicalIndex.STATE_EMPTY, LexicalIndex.STATE_FAILED):
+                self.lexical_index.begin_build()
+                self._lexical_build_thread = threading.Thread(
+                    target=self._build_lexical_index, name="kb-lexical-build", daemon=True
+                )
+                self._lexical_build_thread.start()
+            thread = self._lexical_build_thread
+        if wait and thread is not None:
+            thread.join()
+
+    def _build_lexical_index(self):
+        started_at = time.perf_counter()
+        try:
+            # 与去重索引相同的遍历，条目带有计算作用域所需的分组（分区）字段
+            for batch in self._iter_dedup_rows():
+                self.lexical_index.load(self._lexical_rows(batch))
+            self.lexical_index.finish_build()
+            print(f"词法索引构建完成: {len(self.lexical_index)} 个条目，"
+                  f"耗时 {(time.perf_counter() - started_at) * 1000:.0f}ms")
+        except Exception as e:
+            self.lexical_index.fail_build(e)
+            print(f"词法索引构建失败: {e}")
+
+    def lexical_search(self, query: str, top_k: int = 5, wait: bool = False, groups: List[str] = None,
+                       level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """BM25 词法检索（正文 + 标题），索引未就绪时返回空列表
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            wait: 索引未构建时是否等待构建完成
+            groups: 只检索这些分组中的文档，None 表示全部
+            level: 检索粒度，同 search
+        """
+        self.ensure_lexical_index(wait=wait)
+        if not self.lexical_index.is_ready:
+            return []
+        return self.lexical_index.search(query, top_k, *self._lexical_filter(groups, level))
+
+    def _lexical_filter(self, groups: List[str] = None, level: str = LEVEL_FINE) -> Tuple[Optional[set], str]:
+        """词法检索的作用域与排除的粒度，与向量检索的分组、粒度过滤一致"""
+        scopes = {self._dedup_scope({'group': group}) for group in groups} if groups else None
+        return scopes, EXCLUDED_GRANULARITY[level]
+
+    def hybrid_search(self, query: str, top_k: int = 5, keyword: str = None, groups: List[str] = None,
+                      level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """混合检索：向量检索与 BM25 词法检索的倒数排名融合
+
+        词法检索在独立线程中与向量检索并行执行，超过 settings.kb_hybrid_budget_ms
+        仍未返回（或索引尚未构建完成）时只使用向量结果。
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            keyword: 标题关键词，作为词法检索的附加词项，不做过滤
+            groups: 只检索这些分组中的文档，None 表示全部（向量与词法结果都按分组过滤）
+            level: 检索粒度，同 search
+
+        Returns:
+            搜索结果列表，包含 doc_id, section_title, summary, title_path, score 字段，
+            以及命中路径对应的 vector_score / lexical_score
+        """
+        started_at = time.perf_counter()
+        lexical_future = self._submit_lexical(query, top_k, keyword, groups, level)
+        query_embedding = self.embedding_service.encode_one(query)
+        return self._fuse(started_at, query_embedding, lexical_future, top_k, groups, level)
+
+    def _candidate_depth(self, top_k: int) -> int:
+        return max(top_k * 2, settings.kb_hybrid_candidates)
+
+    def _submit_lexical(self, query: str, top_k: int, keyword: str = None, groups: List[str] = None,
+                        level: str = LEVEL_FINE):
+        self.ensure_lexical_index()
+        if not self.lexical_index.is_ready:
+            return None
+        lexical_query = f"{query} {keyword}" if keyword else query
+        return self._lexical_executor.submit(self.lexical_index.search, lexical_query, self._candidate_depth(top_k),
+                                             *self._lexical_filter(groups, level))
+
+    def _fuse(self, started_at: float, query_embedding: List[float], lexical_future, top_k: int,
+              groups: List[str] = None, level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """执行向量检索，在预算内等待词法结果并融合（词法检索失败时只使用向量结果）"""
+        vector_hits = self._cached_search(query_embedding, self._candidate_depth(top_k), None, groups, level)
+        vector_hits = [{**hit, "vector_score": hit["score"]} for hit in vector_hits]
+
+        lexical_hits = []
+        if lexical_future is not None:
+            remaining = settings.kb_hybrid_budget_ms / 1000 - (time.perf_counter() - started_at)
+            try:
+                lexical_hits = lexical_future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                print("词法检索超出延迟预算，仅使用向量检索结果")
+            except Exception as e:
+                print(f"词法检索失败，仅使用向量检索结果: {e}")
+        lexical_hits = [{**hit, "lexical_score": hit["score"]} for hit in lexical_hits]
+
+        return reciprocal_rank_fusion([vector_hits, lexical_hits], top_k, k=settings.kb_rrf_k)
+
+    # ---------------- 存储 ----------------
+    def add_documents(self, documents: List[Dict[str, Any]],
+                      progress_callback: Callable[[int, int], None] = None,
+                      deduplicate: bool = True) -> Dict[str, float]:
+        """向知识库添加文档
+
+        超出嵌入模型输入长度的条目先拆成窗口条目和一个池化文档条目（见
+        _expand_long_documents）。再按内容哈希和 MinHash 去重，重复分块链接到已有条目
+        而不再插入；其余分块按 settings.kb_insert_batch_size 分批嵌入并插入，大文档的
+        分块不会一次性占满嵌入队列。
+
+        Args:
+            documents: 文档列表，每个文档包含 doc_id, section_title, summary, title_path 字段，
+                可选 group 字段（所属分组，用于按分组检索）
+            progress_callback: 每批插入后回调 (已处理数量, 总数量)，重复分块计为已处理
+            deduplicate: 是否去重（重新插入链接分块时为 False）
+
+        Returns:
+            耗时统计 embedding_ms 和 insert_ms，以及去重数量 deduplicated（其中
+            exact_duplicates 为内容完全相同，near_duplicates 为近重复）
+        """
+        timings = {"embedding_ms": 0.0, "insert_ms": 0.0}
+        counts = {"deduplicated": 0, "exact_duplicates": 0, "near_duplicates": 0}
+        if not documents:
+            return {**timings, **counts}
+
+        documents = self._expand_long_documents(documents)
+        total = len(documents)
+        if deduplicate and self.dedup_index.enabled:
+            self.dedup_index.ensure_built(self._iter_dedup_rows, self._dedup_scope)
+            documents, duplicates = self.dedup_index.check(documents, self._dedup_scope)
+            counts["deduplicated"] = len(duplicates)
+            counts["exact_duplicates"] = sum(1 for _, _, kind in duplicates if kind == "exact")
+            counts["near_duplicates"] = counts["deduplicated"] - counts["exact_duplicates"]
+
+        batch_size = max(settings.kb_insert_batch_size, 1)
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            started_at = time.perf_counter()
+            try:
+                # 生成文本嵌入 - 使用 summary 作为嵌入源，池化文档条目与其窗口在同一次编码中完成
+                embeddings = encode_pooled(self.embedding_service.encode, [str(doc['summary']) for doc in batch])
+                embedded_at = time.perf_counter()
+                self._insert_batch(batch, embeddings)
+            except Exception:
+                # 未插入的分块撤销登记，之后的重复分块不会链接到不存在的条目
+                self.dedup_index.discard(documents[start:])
+                raise
+            if not deduplicate:
+                self.dedup_index.register(batch, self._dedup_scope)
+            self.lexical_index.add_documents(self._lexical_rows(batch))
+            self.search_cache.bump()
+            timings["embedding_ms"] += (embedded_at - started_at) * 1000
+            timings["insert_ms"] += (time.perf_counter() - embedded_at) * 1000
+            if progress_callback:
+                progress_callback(counts["deduplicated"] + start + len(batch), total)
+
+        if counts["deduplicated"] and progress_callback and not documents:
+            progress_callback(total, total)
+        print(f"成功添加 {len(documents)} 个文档到知识库，去重 {counts['deduplicated']} 个")
+        return {**{key: round(value, 1) for key, value in timings.items()}, **counts}
+
+    @abstractmethod
+    def _insert_batch(self, documents: List[Dict[str, Any]], embeddings):
+        """插入一批已生成嵌入的文档（embeddings 为 float32 矩阵）"""
+
+    def _expand_long_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """拆分超出嵌入模型输入长度的条目
+
+        超长条目保留为一个池化文档条目（granularity 为 document，向量为各窗口向量的
+        平均方向，用于粗粒度检索），并按模型窗口拆出窗口条目（granularity 为 window，
+        用于细粒度检索）。已带有粒度标记的条目不再拆分，存储不支持粒度字段时原样返回
+        （超长条目仍使用池化向量）。
+        """
+        if not self._granularity_fields():
+            return documents
+        max_tokens, overlap_tokens = settings.kb_chunk_max_tokens, settings.kb_chunk_overlap_tokens
+        expanded = []
+        for document in documents:
+            summary = str(document.get('summary') or '')
+            if document.get('granularity') or estimate_tokens(summary) <= max_tokens:
+                expanded.append(document)
+                continue
+            expanded.append({**document, 'granularity': GRANULARITY_DOCUMENT})
+            fields = {key: value for key, value in document.items() if key != 'chunk_id'}
+            for window in split_into_windows(summary, max_tokens, overlap_tokens):
+                expanded.append({**fields, 'summary': window, 'granularity': GRANULARITY_WINDOW})
+        return expanded
+
+    def _granularity_fields(self) -> List[str]:
+        """存储支持粒度字段时为 ['granularity']"""
+        return ['granularity']
+
+    def _lexical_rows(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """词法索引只收录分块和窗口（池化文档条目的正文与其窗口重复），并附上条目的作用域"""
+        return [{**document, 'scope': self._dedup_scope(document)}
+                for document in documents if document.get('granularity') != GRANULARITY_DOCUMENT]
+
+    def upsert_document(self, doc_id: str, documents: List[Dict[str, Any]],
+                        progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """增量更新文档（修订后重新上传）
+
+        分块ID由规范化正文和标题路径计算（内容寻址），与该文档已存储的分块
+        （包括被去重链接的分块）比较：只嵌入并插入新增的分块，分批删除不再出现的
+        分块，未变化的分块保持不动。重复执行结果相同，失败后可直接重试。
+
+        Args:
+            doc_id: 要更新的文档ID
+            documents: 新版本的全部分块
+            progress_callback: 回调 (已处理数量, 总数量)，未变化的分块计为已处理
+
+        Returns:
+            add_documents 的统计，以及 added / deleted / unchanged 分块数
+        """
+        incoming: Dict[str, Dict[str, Any]] = {}
+        for document in self._expand_long_documents(documents):
+            document = {**document, "doc_id": doc_id}
+            incoming.setdefault(self._chunk_id(document), document)
+
+        stored = self._document_chunks(doc_id)
+        linked = self.dedup_index.linked_chunks(doc_id)
+        existing = {self._chunk_id(row) for row in stored + linked}
+        removed_rows = [row for row in stored if self._chunk_id(row) not in incoming]
+        removed_links = [document for document in linked if self._chunk_id(document) not in incoming]
+        added = [document for chunk_id, document in incoming.items() if chunk_id not in existing]
+        unchanged = len(incoming) - len(added)
+
+        if removed_rows or removed_links:
+            orphans = self.dedup_index.remove_chunks(doc_id, removed_rows, removed_links)
+            self._delete_chunks(removed_rows)
+            self.lexical_index.delete_entries(self._lexical_rows(removed_rows))
+            self.search_cache.bump()
+            if orphans:
+                self._promote_links(orphans)
+
+        def report_progress(processed: int, total: int):
+            progress_callback(unchanged + processed, len(incoming))
+
+        result = self.add_documents(added, report_progress if progress_callback else None)
+        if progress_callback and not added:
+            progress_callback(len(incoming), len(incoming))
+        deleted = len(removed_rows) + len(removed_links)
+        print(f"增量更新文档 {doc_id}: 新增 {len(added)}，删除 {deleted}，未变化 {unchanged}")
+        return {**result, "added": len(added), "deleted": deleted, "unchanged": unchanged}
+
+    @staticmethod
+    def _chunk_id(document: Dict[str, Any]) -> str:
+        """内容寻址的分块ID，存储中的条目按正文和标题路径重新计算"""
+        return document.get("chunk_id") or compute_chunk_id(document.get("summary"), document.get("title_path"))
+
+    @abstractmethod
+    def _document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """文档已存储的全部分块（DEFAULT_FIELDS 及 _delete_chunks 需要的行标识）"""
+
+    @abstractmethod
+    def _delete_chunks(self, rows: List[Dict[str, Any]]):
+        """删除 _document_chunks 返回的部分分块"""
+
+    def delete_document(self, doc_id: str):
+        """删除指定 ID 的文档"""
+        self.delete_documents([doc_id])
+        print(f"成功删除文档: {doc_id}")
+
+    def delete_documents(self, doc_ids: List[str]):
+        """批量删除多个文档的全部分块"""
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        orphans = self.dedup_index.remove_documents(doc_ids)
+        self._delete_documents(doc_ids)
+        self.lexical_index.delete_documents(doc_ids)
+        self.search_cache.bump()
+        if orphans:
+            self._promote_links(orphans)
+
+    def _promote_links(self, orphans: List[List[Tuple[Dict[str, Any], str]]]):
+        """被链接的条目删除后，把每组第一个重复分块重新插入，其余链接改为指向它"""
+        promoted = [links[0][0] for links in orphans]
+        self.add_documents(promoted, deduplicate=False)
+        self.dedup_index.link(
+            [(document, entry_key(links[0][0]), kind) for links in orphans for document, kind in links[1:]],
+            canonical_doc_ids={entry_key(document): document["doc_id"] for document in promoted}
+        )
+        print(f"重新插入 {len(promoted)} 个被去重链接的分块")
+
+    @abstractmethod
+    def _delete_documents(self, doc_ids: List[str]):
+        """从存储中删除多个文档的全部分块"""
+
+    @abstractmethod
+    def get_document_count(self) -> int:
+        """获取知识库中文档数量"""
+
+    @abstractmethod
+    def get_document_by_id(self, doc_id: str, fields: List[str] = DEFAULT_FIELDS) -> Optional[Dict[str, Any]]:
+        """根据文档 ID 获取文档信息，不存在则返回 None"""
+
+    @abstractmethod
+    def get_documents_by_ids(self, doc_ids: List[str], fields: List[str] = DEFAULT_FIELDS) -> Dict[str, Dict[str, Any]]:
+        """批量获取文档信息，返回 doc_id -> 文档信息（取每个文档的首个分块），不存在的 ID 不出现在结果中"""
+
+    @abstractmethod
+    def iter_documents(self, fields: List[str] = DEFAULT_FIELDS) -> Iterator[List[Dict[str, Any]]]:
+        """分批遍历存储中的全部条目（用于构建词法索引）"""
+
+    @abstractmethod
+    def iter_embeddings(self, groups: List[str] = None,
+                        batch_size: int = 1000) -> Iterator[Tuple[List[Dict[str, Any]], Any]]:
+        """分批遍历全部条目及其向量（用于导出快照）
+
+        每批为 (条目列表, float32 向量矩阵)，条目带 DEFAULT_FIELDS 和 group 字段；
+        groups 为已知分组名称，存储中只记录分区的后端据此还原条目所属分组。
+        """
+
+    def load_entries(self, documents: List[Dict[str, Any]], embeddings):
+        """写入一批已有向量的条目（恢复快照），不重新嵌入也不去重"""
+        self._insert_batch(documents, embeddings)
+        self.lexical_index.add_documents(self._lexical_rows(documents))
+        self.search_cache.bump()
+
+    def clear_all_documents(self):
+        """清空知识库所有文档"""
+        self._clear_all_documents()
+        self.lexical_index.clear()
+        self.dedup_index.clear()
+        self.search_cache.bump()
+        print("成功清空知识库")
+
+    @abstractmethod
+    def _clear_all_documents(self):
+        """清空存储"""
+
+    # ---------------- 去重 ----------------
+    def _iter_dedup_rows(self) -> Iterator[List[Dict[str, Any]]]:
+        """构建去重索引时遍历的条目，需带有 _dedup_scope 所需的字段"""
+        return self.iter_documents(DEFAULT_FIELDS + ['group'] + self._granularity_fields())
+
+    def _dedup_scope(self, document: Dict[str, Any]) -> str:
+        """分组内去重时条目的作用域"""
+        return str(document.get('group') or '')
+
+    def linked_documents(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """全部分块都被去重链接的文档（没有存储条目）的首个分块"""
+        return self.dedup_index.linked_documents(doc_ids)
+
+    # ---------------- 分组 ----------------
+    @abstractmethod
+    def assign_groups(self, group_documents: Dict[str, List[str]]) -> int:
+        """把已有文档归入所属分组（入库时未携带 group 字段的旧数据），返回更新的条目数"""
+
+    def drop_group(self, group: str):
+        """分组文档删除后释放分组占用的存储结构（默认无需处理）"""
+
+    @abstractmethod
+    def status(self) -> Dict[str, Any]:
+        """知识库后端状态"""
@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""知识库分组管理服务 - 使用JSON文件存储分组信息"""
+"""知识库分组管理服务 - 使用SQLite存储分组信息"""
 
-import json
 import os
-from typing import List, Dict, Any
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterator, Set
 from pathlib import Path
-from datetime import datetime
 
 # 获取应用数据目录
 APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -15,241 +18,498 @@ DATA_DIR = os.path.join(APP_DIR, 'data')
 # 确保数据目录存在
 os.makedirs(DATA_DIR, exist_ok=True)
 
-from .milvus_service import knowledge_base
+from ..config import settings
+from .knowledge_base import knowledge_base
+
+DEFAULT_GROUP = {"name": "未分类", "description": "默认分组"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS group_documents (
+    id INTEGER PRIMARY KEY,
+    group_name TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    UNIQUE (group_name, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_group_documents_order ON group_documents (group_name, id);
+CREATE INDEX IF NOT EXISTS idx_group_documents_doc ON group_documents (doc_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deleting_groups (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    group_name TEXT,
+    doc_id TEXT,
+    description TEXT
+);
+"""
+
+# 变更日志保留的记录数，落后更多的进程全量重新加载
+CHANGE_LOG_KEEP = 10000
 
 
 class KnowledgeGroupManager:
-    """知识库分组管理器 - 使用JSON文件存储分组信息"""
-    
-    def __init__(self):
-        """初始化分组管理器"""
+    """知识库分组管理器 - 使用SQLite存储分组信息
+
+    分组与文档归属持久化在带索引的两张表中，同时在内存中维护正向索引
+    （分组 -> 有序文档集合）和反向索引（文档 -> 所属分组集合）：成员判断、
+    单个文档的加入和移除都是常数时间，写入只把变化的记录增量写入数据库。
+
+    数据库使用 WAL 模式，写入在 BEGIN IMMEDIATE 事务中执行，多个 uvicorn worker
+    可以共享同一个数据库。每次写入同时追加变更日志（changes 表）；每次访问前检查
+    PRAGMA data_version，其他进程提交过写入时只按日志应用新增的变更，增量更新
+    正向和反向索引。
+
+    首次启动时从旧的 knowledge_groups.json 一次性导入分组数据（原文件保留不动）。
+    分组与文档的顺序按写入顺序保持不变。
+    """
+
+    def __init__(self, db_file: str = None, groups_file: str = None):
+        """初始化分组管理器
+
+        Args:
+            db_file: 分组数据库文件，默认 settings.kb_groups_db 或 data/knowledge_groups.db
+            groups_file: 需要导入的旧分组文件，默认 data/knowledge_groups.json
+        """
         # 获取知识库数据目录
         self.data_dir = Path(DATA_DIR)
-        self.groups_file = self.data_dir / "knowledge_groups.json"
-        
-        # 确保分组文件存在
-        self._ensure_groups_file()
-    
-    def _ensure_groups_file(self):
-        """确保分组文件存在，如果不存在则创建"""
-        if not self.groups_file.exists():
-            initial_data = {
-                "groups": [
-                    {"name": "未分类", "description": "默认分组"}
-                ],
-                "group_documents": {}
-            }
-            
-            with open(self.groups_file, 'w', encoding='utf-8') as f:
-                json.dump(initial_data, f, ensure_ascii=False, indent=2)
-    
-    def _load_groups_data(self) -> Dict[str, Any]:
-        """加载分组数据"""
-        with open(self.groups_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
-    def _save_groups_data(self, data: Dict[str, Any]):
-        """保存分组数据"""
-        with open(self.groups_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    
+        self.db_file = Path(db_file or settings.kb_groups_db or self.data_dir / "knowledge_groups.db")
+        self.groups_file = Path(groups_file) if groups_file else self.data_dir / "knowledge_groups.json"
+
+        # 内存索引：分组名称 -> 描述；分组 -> 文档（dict 作为保持加入顺序的集合）；文档 -> 分组
+        self._groups: Dict[str, str] = {}
+        self._group_documents: Dict[str, Dict[str, None]] = {}
+        self._document_groups: Dict[str, Set[str]] = {}
+        self._deleting: Set[str] = set()  # 正在删除的分组，不再接受新文档
+        self._data_version: Optional[int] = None  # 内存索引对应的 data_version，None 表示需要重新加载
+        self._change_seq = 0  # 内存索引已应用到的变更日志序号
+
+        # 单个连接在锁内使用：自己的提交不改变该连接的 data_version，只有其他进程的提交会改变
+        self._lock = threading.RLock()
+        os.makedirs(self.db_file.parent, exist_ok=True)
+        # isolation_level=None：事务由 _transaction 显式控制
+        self._connection = sqlite3.connect(str(self.db_file), timeout=settings.kb_groups_db_timeout,
+                                           isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+
+        # 建表并导入旧分组文件
+        self._ensure_schema()
+
+    # ---------------- 事务与内存索引 ----------------
+    @contextmanager
+    def _transaction(self, sync: bool = True) -> Iterator[sqlite3.Connection]:
+        """写事务：开始时即获取写锁，其他进程的写入等待 busy timeout
+
+        获取写锁后先同步内存索引，事务内对内存索引的修改与数据库写入一致；
+        事务失败时内存索引在下次访问时重新加载。
+        """
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if sync:
+                    self._sync()
+                yield connection
+                connection.execute("COMMIT")
+            except BaseException:
+                self._data_version = None
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+
+    def _sync(self):
+        """其他进程提交过写入（data_version 变化）时按变更日志增量更新内存索引（调用方持有锁）
+
+        日志中有整体替换记录，或本进程落后太多（所需记录已被清理）时全量重新加载。
+        """
+        version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        # 在同一个读事务中读取日志和数据，保证两者一致
+        own_transaction = not self._connection.in_transaction
+        if own_transaction:
+            self._connection.execute("BEGIN")
+        try:
+            if self._data_version is None or not self._apply_changes():
+                self._reload()
+            self._data_version = version
+        finally:
+            if own_transaction:
+                self._connection.execute("COMMIT")
+
+    def _reload(self):
+        """从数据库全量加载内存索引（调用方持有锁）"""
+        groups: Dict[str, str] = {}
+        group_documents: Dict[str, Dict[str, None]] = {}
+        document_groups: Dict[str, Set[str]] = {}
+        for name, description in self._connection.execute("SELECT name, description FROM groups ORDER BY id"):
+            groups[name] = description
+            group_documents[name] = {}
+        for group_name, doc_id in self._connection.execute(
+            "SELECT group_name, doc_id FROM group_documents ORDER BY id"
+        ):
+            group_documents.setdefault(group_name, {})[doc_id] = None
+            document_groups.setdefault(doc_id, set()).add(group_name)
+        self._groups, self._group_documents, self._document_groups = groups, group_documents, document_groups
+        self._deleting = {name for name, in self._connection.execute("SELECT name FROM deleting_groups")}
+        self._change_seq = self._connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _apply_changes(self) -> bool:
+        """应用其他进程追加的变更，需要全量重新加载时返回 False（调用方持有锁）"""
+        oldest = self._connection.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        if oldest is not None and oldest > self._change_seq + 1:
+            return False
+        changes = self._connection.execute(
+            "SELECT seq, op, group_name, doc_id, description FROM changes WHERE seq > ? ORDER BY seq",
+            (self._change_seq,)
+        ).fetchall()
+        if any(op == "reset" for _, op, _, _, _ in changes):
+            return False
+        for seq, op, group_name, doc_id, description in changes:
+            if op == "group":
+                self._groups[group_name] = description or ""
+                self._group_documents.setdefault(group_name, {})
+            elif op == "deleting":
+                self._deleting.add(group_name)
+            elif op == "group_delete":
+                self._deleting.discard(group_name)
+                self._groups.pop(group_name, None)
+                for member in self._group_documents.pop(group_name, {}):
+                    self._discard_membership(member, group_name)
+            elif op == "member":
+                self._group_documents.setdefault(group_name, {})[doc_id] = None
+                self._document_groups.setdefault(doc_id, set()).add(group_name)
+            elif op == "unmember":
+                self._group_documents.get(group_name, {}).pop(doc_id, None)
+                self._discard_membership(doc_id, group_name)
+            self._change_seq = seq
+        return True
+
+    def _log_changes(self, connection: sqlite3.Connection, changes: List[tuple]):
+        """在写事务中追加变更日志 (op, group_name, doc_id, description) 并清理过旧的记录
+
+        事务开始时内存索引已同步到最新，本事务的变更已直接写入内存索引，
+        因此已应用的序号直接前移到日志末尾。
+        """
+        if not changes:
+            return
+        connection.executemany(
+            "INSERT INTO changes (op, group_name, doc_id, description) VALUES (?, ?, ?, ?)", changes
+        )
+        seq = connection.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+        connection.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGE_LOG_KEEP,))
+        self._change_seq = seq
+
+    def _ensure_schema(self):
+        """建表；数据库为空时导入旧分组文件，或写入默认分组"""
+        with self._transaction(sync=False) as connection:
+            # executescript 会隐式提交，不能在事务中使用，逐条执行建表语句
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    connection.execute(statement)
+            # 建表前无法加载内存索引，提交后首次访问时加载
+            self._data_version = None
+            if connection.execute("SELECT 1 FROM meta WHERE key = 'initialized'").fetchone():
+                return
+
+            if self.groups_file.exists():
+                with open(self.groups_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._replace_all(connection, data)
+                print(f"已从 {self.groups_file.name} 导入 {len(data.get('groups', []))} 个分组")
+            elif not connection.execute("SELECT 1 FROM groups LIMIT 1").fetchone():
+                connection.execute("INSERT INTO groups (name, description) VALUES (?, ?)",
+                                   (DEFAULT_GROUP["name"], DEFAULT_GROUP["description"]))
+            connection.execute("INSERT INTO meta (key, value) VALUES ('initialized', '1')")
+
+    @staticmethod
+    def _replace_all(connection: sqlite3.Connection, data: Dict[str, Any]):
+        """用 {"groups": [...], "group_documents": {...}} 格式的数据替换全部分组"""
+        connection.execute("DELETE FROM groups")
+        connection.execute("DELETE FROM group_documents")
+        connection.execute("DELETE FROM deleting_groups")
+        # 其他进程读到整体替换记录后全量重新加载
+        connection.execute("INSERT INTO changes (op) VALUES ('reset')")
+        connection.executemany(
+            "INSERT OR IGNORE INTO groups (name, description) VALUES (?, ?)",
+            [(group["name"], group.get("description") or "") for group in data.get("groups", [])]
+        )
+        for group_name, doc_ids in data.get("group_documents", {}).items():
+            connection.executemany(
+                "INSERT OR IGNORE INTO group_documents (group_name, doc_id) VALUES (?, ?)",
+                [(group_name, doc_id) for doc_id in doc_ids]
+            )
+
+    # ---------------- 查询 ----------------
     def get_groups(self) -> List[str]:
         """获取所有知识库分组名称列表
-        
+
         Returns:
             分组名称列表
         """
-        data = self._load_groups_data()
-        return [group["name"] for group in data["groups"]]
-    
+        with self._lock:
+            self._sync()
+            return list(self._groups)
+
     def get_all_groups(self) -> List[Dict[str, Any]]:
         """获取所有知识库分组的完整信息
-        
+
         Returns:
             分组信息列表，每个分组包含name、description和document_count字段
         """
-        data = self._load_groups_data()
-        
-        # 为每个分组添加文档数量
-        groups_with_count = []
-        for group in data["groups"]:
-            group_name = group["name"]
-            # 获取该分组的文档数量
-            document_count = len(data["group_documents"].get(group_name, []))
-            # 添加文档数量到分组信息中
-            groups_with_count.append({
-                "name": group["name"],
-                "description": group["description"],
-                "document_count": document_count
-            })
-            
-        return groups_with_count
-    
-    def get_group(self, group_name: str) -> Dict[str, Any]:
+        with self._lock:
+            self._sync()
+            return [
+                {"name": name, "description": description,
+                 "document_count": len(self._group_documents.get(name, ()))}
+                for name, description in self._groups.items()
+            ]
+
+    def get_group(self, group_name: str, offset: int = 0, limit: int = None) -> Dict[str, Any]:
         """获取指定分组的信息
-        
+
         Args:
             group_name: 分组名称
-            
+            offset: 文档分页起始位置
+            limit: 返回文档数量，None 表示全部
+
         Returns:
-            分组信息字典，包含name、description和documents字段
+            分组信息字典，包含name、description、documents和total字段
         """
-        data = self._load_groups_data()
-        
-        # 查找分组信息
-        group_info = next((group for group in data["groups"] if group["name"] == group_name), None)
-        if not group_info:
-            return None
-        
-        # 获取该分组的文档ID列表
-        doc_ids = data["group_documents"].get(group_name, [])
-        
-        # 从Milvus获取文档详细信息（只获取必要字段，不包含摘要）
-        documents = []
-        for doc_id in doc_ids:
-            # 尝试从Milvus获取文档信息，只请求必要的字段
-            # 注意：knowledge_base.get_document_by_id方法已经包含了集合加载逻辑
-            doc_info = knowledge_base.get_document_by_id(doc_id, fields=['doc_id', 'section_title', 'title_path'])
-            if doc_info:
-                documents.append(doc_info)
-            else:
-                # 如果获取失败，返回一个包含doc_id的简单字典
-                documents.append({"doc_id": doc_id})
-        
+        with self._lock:
+            self._sync()
+            # 查找分组信息
+            if group_name not in self._groups:
+                return None
+            description = self._groups[group_name]
+
+            # 获取该分组的文档ID列表（分页）
+            group_documents = self._group_documents.get(group_name, {})
+            total = len(group_documents)
+            end = None if limit is None else offset + limit
+            doc_ids = list(islice(group_documents, offset, end))
+
+        # 批量从知识库获取文档详细信息（只获取必要字段，不包含摘要）
+        doc_infos = knowledge_base.get_documents_by_ids(doc_ids, fields=['doc_id', 'section_title', 'title_path'])
+        # 全部分块都被去重的文档没有存储条目，使用链接记录中的分块信息
+        missing = [doc_id for doc_id in doc_ids if doc_id not in doc_infos]
+        if missing:
+            for doc_id, document in knowledge_base.linked_documents(missing).items():
+                doc_infos[doc_id] = {field: document.get(field) for field in ('doc_id', 'section_title', 'title_path')}
+
+        # 获取失败的文档返回一个包含doc_id的简单字典
+        documents = [doc_infos.get(doc_id, {"doc_id": doc_id}) for doc_id in doc_ids]
+
         # 返回完整的分组信息
         return {
-            "name": group_info["name"],
-            "description": group_info["description"],
-            "documents": documents
+            "name": group_name,
+            "description": description,
+            "documents": documents,
+            "total": total
         }
-    
+
+    def get_documents_by_group(self, group_name: str) -> List[str]:
+        """获取指定分组的所有文档ID
+
+        Args:
+            group_name: 分组名称
+
+        Returns:
+            List[str]: 文档ID列表
+        """
+        with self._lock:
+            self._sync()
+            return list(self._group_documents.get(group_name, ()))
+
+    def get_document_groups(self, doc_id: str) -> List[str]:
+        """文档所属的全部分组"""
+        with self._lock:
+            self._sync()
+            return sorted(self._document_groups.get(doc_id, ()))
+
+    def has_document(self, group_name: str, doc_id: str) -> bool:
+        """文档是否属于指定分组"""
+        with self._lock:
+            self._sync()
+            return group_name in self._document_groups.get(doc_id, ())
+
+    def export_data(self) -> Dict[str, Any]:
+        """导出全部分组，格式同旧分组文件 {"groups": [...], "group_documents": {...}}"""
+        with self._lock:
+            self._sync()
+            return {
+                "groups": [{"name": name, "description": description} for name, description in self._groups.items()],
+                "group_documents": {group: list(documents) for group, documents in self._group_documents.items()},
+            }
+
+    # ---------------- 写入 ----------------
     def add_group(self, group_name: str, description: str = "") -> bool:
         """添加新的知识库分组
-        
+
         Args:
             group_name: 分组名称
             description: 分组描述
-            
+
         Returns:
             bool: 添加成功返回True，已存在返回False
         """
-        data = self._load_groups_data()
-        
-        # 检查分组是否已存在
-        for group in data["groups"]:
-            if group["name"] == group_name:
+        with self._transaction() as connection:
+            if group_name in self._groups:
                 return False
-        
-        # 添加新分组
-        data["groups"].append({
-            "name": group_name,
-            "description": description
-        })
-        
-        # 初始化该分组的文档列表
-        if group_name not in data["group_documents"]:
-            data["group_documents"][group_name] = []
-        
-        self._save_groups_data(data)
-        return True
-    
+            connection.execute("INSERT INTO groups (name, description) VALUES (?, ?)", (group_name, description))
+            self._log_changes(connection, [("group", group_name, None, description)])
+            self._groups[group_name] = description
+            self._group_documents.setdefault(group_name, {})
+            return True
+
     def delete_group(self, group_name: str) -> bool:
         """删除指定的知识库分组及其所有文档
-        
+
+        先在事务中把分组标记为正在删除（之后不再接受新文档），再从知识库删除文档，
+        删除完成后按最新的归属再检查一次，最后在事务中删除分组记录。
+
         Args:
             group_name: 分组名称
-            
+
         Returns:
             bool: 删除成功返回True，不存在返回False
         """
-        data = self._load_groups_data()
-        
-        # 检查分组是否存在
-        group_exists = False
-        for i, group in enumerate(data["groups"]):
-            if group["name"] == group_name:
-                # 从分组列表中删除
-                del data["groups"][i]
-                group_exists = True
-                break
-        
-        if not group_exists:
-            return False
-        
-        # 获取该分组的所有文档
-        if group_name in data["group_documents"]:
-            documents = data["group_documents"][group_name]
-            
-            # 从Milvus中删除所有文档
-            for doc_id in documents:
-                try:
-                    knowledge_base.delete_document(doc_id)
-                except Exception as e:
-                    print(f"删除Milvus文档失败 {doc_id}: {e}")
-            
-            # 从分组文档映射中删除
-            del data["group_documents"][group_name]
-        
+        with self._transaction() as connection:
+            if group_name not in self._groups:
+                return False
+            if group_name not in self._deleting:
+                connection.execute("INSERT OR IGNORE INTO deleting_groups (name) VALUES (?)", (group_name,))
+                self._log_changes(connection, [("deleting", group_name, None, None)])
+                self._deleting.add(group_name)
+
+        # 从知识库中批量删除所有文档（含标记之前已在进行的写入加入的文档），再删除分组对应的分区
+        deleted: Set[str] = set()
+        try:
+            while True:
+                with self._lock:
+                    self._sync()
+                    documents = [doc_id for doc_id in self._group_documents.get(group_name, ()) if doc_id not in deleted]
+                if not documents:
+                    break
+                knowledge_base.delete_documents(documents)
+                deleted.update(documents)
+            if deleted:
+                knowledge_base.drop_group(group_name)
+        except Exception as e:
+            print(f"删除分组文档失败 {group_name}: {e}")
+
         # 不再自动重新创建"未分类"分组，允许用户完全删除它
-        
-        self._save_groups_data(data)
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM groups WHERE name = ?", (group_name,))
+            connection.execute("DELETE FROM group_documents WHERE group_name = ?", (group_name,))
+            connection.execute("DELETE FROM deleting_groups WHERE name = ?", (group_name,))
+            self._log_changes(connection, [("group_delete", group_name, None, None)])
+            self._deleting.discard(group_name)
+            self._groups.pop(group_name, None)
+            for doc_id in self._group_documents.pop(group_name, {}):
+                self._discard_membership(doc_id, group_name)
         return True
-    
-    def get_documents_by_group(self, group_name: str) -> List[str]:
-        """获取指定分组的所有文档ID
-        
-        Args:
-            group_name: 分组名称
-            
+
+    def sync_storage_groups(self) -> int:
+        """按分组数据把知识库中已有的文档归入对应分组（分区）
+
+        分组检索功能上线前导入的文档不带分组信息，同步一次后才能按分组检索。
+
         Returns:
-            List[str]: 文档ID列表
+            更新的条目数
         """
-        data = self._load_groups_data()
-        return data["group_documents"].get(group_name, [])
-    
+        return knowledge_base.assign_groups(self.export_data()["group_documents"])
+
     def add_document_to_group(self, group_name: str, doc_id: str):
         """将文档添加到指定分组
-        
+
         Args:
             group_name: 分组名称
             doc_id: 文档ID
         """
-        data = self._load_groups_data()
-        
-        # 确保分组存在，不存在则创建
-        group_exists = False
-        for group in data["groups"]:
-            if group["name"] == group_name:
-                group_exists = True
-                break
-        
-        if not group_exists:
-            self.add_group(group_name)
-            data = self._load_groups_data()
-        
-        # 确保分组文档映射存在
-        if group_name not in data["group_documents"]:
-            data["group_documents"][group_name] = []
-        
-        # 添加文档ID（避免重复）
-        if doc_id not in data["group_documents"][group_name]:
-            data["group_documents"][group_name].append(doc_id)
-            self._save_groups_data(data)
-    
+        self.add_documents_to_group(group_name, [doc_id])
+
+    def add_documents_to_group(self, group_name: str, doc_ids: List[str]) -> int:
+        """在一个事务中将多个文档添加到指定分组，分组不存在则创建
+
+        Returns:
+            新加入的文档数（已在分组中的文档不重复添加）
+
+        Raises:
+            ValueError: 分组正在删除
+        """
+        with self._transaction() as connection:
+            if group_name in self._deleting:
+                raise ValueError(f"分组 {group_name} 正在删除，不能添加文档")
+            changes = []
+            if group_name not in self._groups:
+                connection.execute("INSERT INTO groups (name, description) VALUES (?, '')", (group_name,))
+                changes.append(("group", group_name, None, ""))
+                self._groups[group_name] = ""
+            group_documents = self._group_documents.setdefault(group_name, {})
+            added = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in group_documents]
+            connection.executemany(
+                "INSERT OR IGNORE INTO group_documents (group_name, doc_id) VALUES (?, ?)",
+                [(group_name, doc_id) for doc_id in added]
+            )
+            self._log_changes(connection, changes + [("member", group_name, doc_id, None) for doc_id in added])
+            for doc_id in added:
+                group_documents[doc_id] = None
+                self._document_groups.setdefault(doc_id, set()).add(group_name)
+            return len(added)
+
     def remove_document_from_group(self, doc_id: str):
         """从所有分组中移除指定文档
-        
+
         Args:
             doc_id: 文档ID
         """
-        data = self._load_groups_data()
-        
-        # 遍历所有分组，移除文档ID
-        for group_name, documents in data["group_documents"].items():
-            if doc_id in documents:
-                documents.remove(doc_id)
-        
-        self._save_groups_data(data)
+        self.remove_documents_from_groups([doc_id])
+
+    def remove_documents_from_groups(self, doc_ids: List[str]) -> int:
+        """在一个事务中从所有分组移除多个文档，只删除反向索引中存在的归属记录
+
+        Returns:
+            删除的归属记录数
+        """
+        with self._transaction() as connection:
+            memberships = [
+                (group_name, doc_id)
+                for doc_id in dict.fromkeys(doc_ids)
+                for group_name in self._document_groups.pop(doc_id, ())
+            ]
+            connection.executemany(
+                "DELETE FROM group_documents WHERE group_name = ? AND doc_id = ?", memberships
+            )
+            self._log_changes(connection, [("unmember", group_name, doc_id, None) for group_name, doc_id in memberships])
+            for group_name, doc_id in memberships:
+                self._group_documents.get(group_name, {}).pop(doc_id, None)
+            return len(memberships)
+
+    def _discard_membership(self, doc_id: str, group_name: str):
+        """从反向索引中移除一条归属（调用方持有锁）"""
+        groups = self._document_groups.get(doc_id)
+        if groups is not None:
+            groups.discard(group_name)
+            if not groups:
+                del self._document_groups[doc_id]
+
+    def import_data(self, data: Dict[str, Any]):
+        """在一个事务中用导出格式的数据替换全部分组（恢复快照时使用）"""
+        with self._transaction() as connection:
+            self._replace_all(connection, data)
+            # 提交后重新加载内存索引
+            self._data_version = None
 
 
 # 创建全局知识库分组管理器实例
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库词法索引 - 面向中文的字符二元组 BM25 倒排索引"""
+
+import re
+import math
+import heapq
+import hashlib
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Tuple, Optional, Set
+
+_CJK_CHAR = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+# 章节标题和标题路径中的词项权重（相对正文）
+TITLE_WEIGHT = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：中日韩连续字符切分为二元组（单字保留为一元），字母数字按词切分"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall((text or "").lower()):
+        if _CJK_CHAR.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def entry_key(document: Dict[str, Any]) -> str:
+    """条目标识：同一文档中内容完全相同的分块视为同一条目"""
+    raw = "\x1f".join(str(document.get(field, "")) for field in ("doc_id", "title_path", "section_title", "summary"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class LexicalIndex:
+    """BM25 倒排索引
+
+    正文（summary）与标题（section_title、title_path）合并为一个加权词频，
+    标题词项按 TITLE_WEIGHT 计。索引只保存在内存中，由知识库在启动后从
+    存储全量构建，之后随入库和删除增量更新。构建期间的增量更新会被记录，
+    构建完成后按顺序重放，保证与并发导入的数据一致。
+
+    每个条目另记录作用域（scope，由知识库给出，对应分组或分区）和粒度标记，
+    检索时可按作用域和粒度过滤。
+    """
+
+    STATE_EMPTY = "empty"
+    STATE_BUILDING = "building"
+    STATE_READY = "ready"
+    STATE_FAILED = "failed"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.state = self.STATE_EMPTY
+        self.last_error: Optional[str] = None
+
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._term_freqs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_entries: Dict[str, set] = {}
+        self._filters: Dict[str, Tuple[str, str]] = {}  # 条目 -> (作用域, 粒度)
+        # 构建期间的增量更新：("add", documents) / ("delete", doc_ids) / ("delete_entries", documents) /
+        # ("scope", doc_id -> 作用域) / ("clear", None)
+        self._pending: List[Tuple[str, Any]] = []
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == self.STATE_READY
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------------- 构建 ----------------
+    def begin_build(self):
+        """开始全量构建：清空索引并开始记录增量更新"""
+        with self._lock:
+            self._reset()
+            self._pending = []
+            self.state = self.STATE_BUILDING
+            self.last_error = None
+
+    def load(self, documents: List[Dict[str, Any]]):
+        """构建期间从存储加载一批条目"""
+        with self._lock:
+            for document in documents:
+                self._add_entry(document)
+
+    def finish_build(self):
+        """结束构建并重放构建期间的增量更新"""
+        with self._lock:
+            for op, payload in self._pending:
+                self._apply(op, payload)
+            self._pending = []
+            self.state = self.STATE_READY
+
+    def fail_build(self, error: Exception):
+        with self._lock:
+            self._reset()
+            self._pending = []
+            self.state = self.STATE_FAILED
+            self.last_error = str(error)
+
+    # ---------------- 增量更新 ----------------
+    def add_documents(self, documents: List[Dict[str, Any]]):
+        self._record("add", documents)
+
+    def delete_documents(self, doc_ids: List[str]):
+        self._record("delete", list(doc_ids))
+
+    def delete_entries(self, documents: List[Dict[str, Any]]):
+        """删除文档中的部分分块（增量更新时移除的分块）"""
+        self._record("delete_entries", list(documents))
+
+    def set_scopes(self, doc_scopes: Dict[str, str]):
+        """更新文档全部条目的作用域（文档归入其他分组后）"""
+        self._record("scope", dict(doc_scopes))
+
+    def clear(self):
+        self._record("clear", None)
+
+    def _record(self, op: str, payload: Any):
+        with self._lock:
+            if self.state == self.STATE_BUILDING:
+                self._pending.append((op, payload))
+            if self.state in (self.STATE_BUILDING, self.STATE_READY):
+                self._apply(op, payload)
+
+    def _apply(self, op: str, payload: Any):
+        if op == "add":
+            for document in payload:
+                self._add_entry(document)
+        elif op == "delete":
+            for doc_id in payload:
+                for key in self._doc_entries.pop(doc_id, set()):
+                    self._remove_entry(key)
+        elif op == "delete_entries":
+            for document in payload:
+                key = entry_key(document)
+                self._remove_entry(key)
+                self._doc_entries.get(document.get("doc_id"), set()).discard(key)
+        elif op == "scope":
+            for doc_id, scope in payload.items():
+                for key in self._doc_entries.get(doc_id, ()):
+                    self._filters[key] = (scope, self._filters[key][1])
+        elif op == "clear":
+            self._reset()
+
+    def _reset(self):
+        self._entries = {}
+        self._term_freqs = {}
+        self._lengths = {}
+        self._total_length = 0
+        self._postings = {}
+        self._doc_entries = {}
+        self._filters = {}
+
+    def _add_entry(self, document: Dict[str, Any]):
+        key = entry_key(document)
+        if key in self._entries:
+            return
+        term_freqs = Counter(tokenize(str(document.get("summary", ""))))
+        title_text = f"{document.get('section_title', '')} {document.get('title_path', '')}"
+        for token in tokenize(title_text):
+            term_freqs[token] += TITLE_WEIGHT
+
+        self._entries[key] = {
+            "doc_id": document.get("doc_id"),
+            "section_title": document.get("section_title"),
+            "summary": document.get("summary"),
+            "title_path": document.get("title_path"),
+        }
+        self._term_freqs[key] = term_freqs
+        self._filters[key] = (str(document.get("scope") or ""), str(document.get("granularity") or ""))
+        length = sum(term_freqs.values())
+        self._lengths[key] = length
+        self._total_length += length
+        for token, freq in term_freqs.items():
+            self._postings.setdefault(token, {})[key] = freq
+        self._doc_entries.setdefault(document.get("doc_id"), set()).add(key)
+
+    def _remove_entry(self, key: str):
+        self._entries.pop(key, None)
+        self._filters.pop(key, None)
+        for token in self._term_freqs.pop(key, {}):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= self._lengths.pop(key, 0)
+
+    # ---------------- 检索 ----------------
+    def search(self, query: str, top_k: int = 5, scopes: Optional[Set[str]] = None,
+               excluded_granularity: Optional[str] = None) -> List[Dict[str, Any]]:
+        """BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            scopes: 只返回这些作用域的条目，None 表示不限
+            excluded_granularity: 排除该粒度标记的条目
+
+        Returns:
+            结果列表，包含 doc_id, section_title, summary, title_path, score 字段
+        """
+        query_terms = Counter(tokenize(query))
+        with self._lock:
+            entry_count = len(self._entries)
+            if not query_terms or not entry_count:
+                return []
+            average_length = self._total_length / entry_count
+
+            scores: Dict[str, float] = {}
+            for token, query_freq in query_terms.items():
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (entry_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, freq in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[key] / average_length)
+                    scores[key] = scores.get(key, 0.0) + query_freq * idf * freq * (self.k1 + 1) / (freq + norm)
+
+            if scopes is not None or excluded_granularity is not None:
+                scores = {
+                    key: score for key, score in scores.items()
+                    if (scopes is None or self._filters[key][0] in scopes)
+                    and self._filters[key][1] != excluded_granularity
+                }
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [{**self._entries[key], "score": score} for key, score in best]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "entries": len(self._entries),
+            "terms": len(self._postings),
+            "last_error": self.last_error,
+        }
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """倒数排名融合：score = Σ 1 / (k + rank)
+
+    各路结果按 entry_key 对齐，保留每路的原始分数（vector_score / lexical_score 等由调用方写入结果）。
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            key = entry_key(result)
+            item = fused.get(key)
+            if item is None:
+                item = fused[key] = {**result, "score": 0.0}
+            else:
+                item.update({field: value for field, value in result.items() if field != "score"})
+            item["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda item: item["score"], reverse=True)[:top_k]
@@ -0,0 +1,573 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""进程内向量存储 - Milvus 禁用或单机部署时的知识库后端"""
+
+import os
+import json
+import threading
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .dedup_index import DedupIndex
+from .search_cache import SearchCache
+from .knowledge_base_backend import (
+    KnowledgeBaseBackend, DEFAULT_FIELDS, GRANULARITY_CHUNK, GRANULARITY_WINDOW, GRANULARITY_DOCUMENT,
+    LEVEL_FINE, EXCLUDED_GRANULARITY
+)
+
+# 向量文件初始容量（行），之后按需倍增
+INITIAL_CAPACITY = 1024
+# 已删除行占比超过该值时压缩存储
+COMPACT_RATIO = 0.3
+# 元数据字段（group 为所属分组，用于按分组检索）
+METADATA_FIELDS = ['doc_id', 'section_title', 'summary', 'title_path', 'group', 'granularity']
+
+# 粒度标记的整数编码，检索时按编码过滤
+GRANULARITY_CODES = {GRANULARITY_CHUNK: 0, GRANULARITY_WINDOW: 1, GRANULARITY_DOCUMENT: 2}
+
+
+class IVFIndex:
+    """倒排文件索引（粗量化 k-means + 桶内精确打分）
+
+    适用于较大的语料：检索时只对最相近的 nprobe 个聚类中心内的向量打分。
+    """
+
+    def __init__(self, nlist: int, nprobe: int, iterations: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[List[int]] = []
+        self.built_rows = 0
+
+    def build(self, vectors: np.ndarray, slots: np.ndarray):
+        """在给定的行上训练聚类中心并分桶"""
+        rng = np.random.default_rng(self.seed)
+        nlist = max(1, min(self.nlist, len(slots)))
+        data = np.asarray(vectors[slots], dtype=np.float32)
+
+        # 球面 k-means（向量已归一化，用内积作为相似度）
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = data[assignments == cluster]
+                if len(members):
+                    center = members.sum(axis=0)
+                    centroids[cluster] = center / max(np.linalg.norm(center), 1e-12)
+
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [[] for _ in range(nlist)]
+        for slot, cluster in zip(slots.tolist(), assignments.tolist()):
+            self.lists[cluster].append(slot)
+        self.built_rows = len(slots)
+
+    def add(self, vectors: np.ndarray, slots: List[int]):
+        """将新增行分配到最近的聚类中心"""
+        if self.centroids is None or not slots:
+            return
+        assignments = np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1)
+        for slot, cluster in zip(slots, assignments.tolist()):
+            self.lists[cluster].append(slot)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """返回候选行号"""
+        nprobe = min(self.nprobe, len(self.lists))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.fromiter(
+            (slot for cluster in nearest for slot in self.lists[cluster]),
+            dtype=np.int64
+        )
+
+
+class LocalKnowledgeBase(KnowledgeBaseBackend):
+    """进程内知识库
+
+    向量以归一化 float32 矩阵保存在内存映射文件 vectors.f32 中，元数据以追加写
+    的 metadata.jsonl 作为旁路文件（删除记录为墓碑，删除行过多时压缩）。
+    检索为向量化的余弦 top-k，语料较大时可启用 IVF 索引。
+    """
+
+    backend_name = "local"
+
+    def __init__(self, store_dir: str = None, embedding_service=None):
+        super().__init__()
+        if embedding_service is not None:
+            self.embedding_service = embedding_service
+        self.store_dir = store_dir or os.path.join(settings.data_dir, "local_vector_store")
+        self.meta_file = os.path.join(self.store_dir, "meta.json")
+        self.vectors_file = os.path.join(self.store_dir, "vectors.f32")
+        self.metadata_file = os.path.join(self.store_dir, "metadata.jsonl")
+        self.dedup_index = DedupIndex(os.path.join(self.store_dir, "dedup_links.jsonl"))
+        # 缓存代数与同一存储目录的其他 worker 共享
+        self.search_cache = SearchCache(generation_file=os.path.join(self.store_dir, "search_generation"))
+
+        self.index_type = settings.local_store_index
+        self.ivf_min_rows = settings.local_store_ivf_min_rows
+        self.nprobe = settings.local_store_nprobe
+
+        self._lock = threading.RLock()
+        self.dimension: Optional[int] = None
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._rows: List[Optional[Dict[str, Any]]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._granularity = np.zeros(0, dtype=np.int8)
+        self._doc_slots: Dict[str, List[int]] = {}
+        self._next_id = 1
+        self._deleted = 0
+        self._ivf: Optional[IVFIndex] = None
+        self._ivf_thread: Optional[threading.Thread] = None
+        # 行号布局版本：压缩或清空后递增，用于丢弃基于旧行号构建的 IVF 索引
+        self._layout = 0
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._load()
+
+    # ---------------- 持久化 ----------------
+    def _load(self):
+        """加载已有存储并回放元数据日志"""
+        if not os.path.exists(self.meta_file):
+            return
+        with open(self.meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self._check_model(meta)
+        self.dimension = int(meta["dimension"])
+        self._capacity = int(meta["capacity"])
+        self._map_vectors("r+")
+
+        if os.path.exists(self.metadata_file):
+            with open(self.metadata_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    if record.get("op") == "delete":
+                        self._apply_delete(record["doc_id"])
+                    elif record.get("op") == "delete_rows":
+                        self._apply_delete_rows(record["doc_id"], record["ids"])
+                    elif record.get("op") == "group":
+                        self._apply_group(record["doc_id"], record["group"])
+                    else:
+                        self._apply_add(record)
+
+        print(f"本地向量存储已加载: {self.get_document_count()} 条")
+
+    def _model_id(self) -> str:
+        return getattr(self.embedding_service, "model_id", None) or self.embedding_service.model_name
+
+    def _check_model(self, meta: Dict[str, Any]):
+        """已有存储的向量由其他嵌入模型生成时拒绝加载，避免混用不同模型的向量空间"""
+        saved = meta.get("model_id") or meta.get("model_name")
+        current = self._model_id() if meta.get("model_id") else self.embedding_service.model_name
+        if saved and saved != current:
+            raise ValueError(
+                f"本地向量存储 {self.store_dir} 由嵌入模型 {saved} 生成，与当前模型 {current} 不一致，"
+                f"请恢复原模型配置，或清空该目录后重新导入"
+            )
+
+    def _write_meta(self):
+        meta = {
+            "dimension": self.dimension,
+            "capacity": self._capacity,
+            "model_name": self.embedding_service.model_name,
+            "model_id": self._model_id(),
+        }
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_file, self.meta_file)
+
+    def _map_vectors(self, mode: str):
+        self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode=mode,
+                                  shape=(self._capacity, self.dimension))
+
+    def _ensure_capacity(self, rows: int):
+        """确保向量文件至少能容纳 rows 行"""
+        if self._vectors is None:
+            self._capacity = max(INITIAL_CAPACITY, rows)
+            self._map_vectors("w+")
+            self._write_meta()
+            return
+        if rows <= self._capacity:
+            return
+
+        new_capacity = self._capacity
+        while new_capacity < rows:
+            new_capacity *= 2
+        self._vectors.flush()
+        self._vectors = None
+        with open(self.vectors_file, 'r+b') as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self._capacity = new_capacity
+        self._map_vectors("r+")
+        self._write_meta()
+
+    def _append_log(self, records: List[Dict[str, Any]]):
+        with open(self.metadata_file, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _apply_add(self, record: Dict[str, Any]):
+        slot = int(record["slot"])
+        row = {"id": int(record["id"]), **{field: record.get(field, '') for field in METADATA_FIELDS}}
+        while len(self._rows) <= slot:
+            self._rows.append(None)
+        self._rows[slot] = row
+        if len(self._alive) <= slot:
+            # 按倍数扩容，避免逐行拼接
+            size = max(slot + 1, 2 * len(self._alive))
+            alive = np.zeros(size, dtype=bool)
+            alive[:len(self._alive)] = self._alive
+            self._alive = alive
+            granularity = np.zeros(size, dtype=np.int8)
+            granularity[:len(self._granularity)] = self._granularity
+            self._granularity = granularity
+        self._alive[slot] = True
+        self._granularity[slot] = GRANULARITY_CODES.get(row["granularity"], 0)
+        self._doc_slots.setdefault(row["doc_id"], []).append(slot)
+        self._next_id = max(self._next_id, row["id"] + 1)
+
+    def _apply_delete(self, doc_id: str) -> int:
+        slots = self._doc_slots.pop(doc_id, [])
+        for slot in slots:
+            self._rows[slot] = None
+            self._alive[slot] = False
+        # IVF 桶中保留已删除的行号，检索时按 alive 过滤，压缩时重建
+        self._deleted += len(slots)
+        return len(slots)
+
+    def _apply_delete_rows(self, doc_id: str, row_ids: List[int]) -> int:
+        removed = set(row_ids)
+        kept, deleted = [], 0
+        for slot in self._doc_slots.get(doc_id, []):
+            if self._rows[slot]["id"] in removed:
+                self._rows[slot] = None
+                self._alive[slot] = False
+                deleted += 1
+            else:
+                kept.append(slot)
+        if kept:
+            self._doc_slots[doc_id] = kept
+        else:
+            self._doc_slots.pop(doc_id, None)
+        self._deleted += deleted
+        return deleted
+
+    def _apply_group(self, doc_id: str, group: str) -> int:
+        slots = self._doc_slots.get(doc_id, [])
+        for slot in slots:
+            self._rows[slot]["group"] = group
+        return len(slots)
+
+    def _compact(self):
+        """重写存储，去掉已删除的行"""
+        alive_slots = np.flatnonzero(self._alive)
+        vectors = np.array(self._vectors[alive_slots], dtype=np.float32)
+        rows = [self._rows[slot] for slot in alive_slots.tolist()]
+
+        # 写入新文件后替换：进行中的检索仍持有旧文件的映射，不能原地截断
+        self._vectors.flush()
+        self._vectors = None
+        self._capacity = max(INITIAL_CAPACITY, len(rows))
+        tmp_vectors = self.vectors_file + ".tmp"
+        compacted = np.memmap(tmp_vectors, dtype=np.float32, mode="w+", shape=(self._capacity, self.dimension))
+        compacted[:len(rows)] = vectors
+        compacted.flush()
+        del compacted
+        os.replace(tmp_vectors, self.vectors_file)
+        self._map_vectors("r+")
+        self._write_meta()
+
+        records = [{"op": "add", "slot": slot, **row} for slot, row in enumerate(rows)]
+        tmp_file = self.metadata_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_file, self.metadata_file)
+
+        self._rows = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._granularity = np.zeros(0, dtype=np.int8)
+        self._doc_slots = {}
+        self._deleted = 0
+        self._ivf = None
+        self._layout += 1
+        for record in records:
+            self._apply_add(record)
+        print(f"本地向量存储已压缩: {len(rows)} 条")
+
+    # ---------------- 存储接口 ----------------
+    def _insert_batch(self, documents: List[Dict[str, Any]], embeddings):
+        """写入一批文档的向量和元数据"""
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(embeddings.shape[1])
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(f"嵌入维度 {embeddings.shape[1]} 与本地存储维度 {self.dimension} 不一致")
+
+            start = len(self._rows)
+            self._ensure_capacity(start + len(documents))
+            self._vectors[start:start + len(documents)] = embeddings
+            self._vectors.flush()
+
+            records = []
+            for offset, doc in enumerate(documents):
+                records.append({
+                    "op": "add",
+                    "slot": start + offset,
+                    "id": self._next_id + offset,
+                    **{field: str(doc.get(field) or '') for field in METADATA_FIELDS}
+                })
+            self._append_log(records)
+            for record in records:
+                self._apply_add(record)
+
+            if self._ivf is not None:
+                self._ivf.add(embeddings, list(range(start, start + len(documents))))
+
+    def _delete_documents(self, doc_ids: List[str]):
+        """批量删除多个文档，删除记录一次性追加到日志"""
+        with self._lock:
+            records = [{"op": "delete", "doc_id": doc_id} for doc_id in doc_ids if self._apply_delete(doc_id)]
+            if records:
+                self._append_log(records)
+            if self._deleted > max(1000, COMPACT_RATIO * len(self._rows)):
+                self._compact()
+
+    def _document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(self._rows[slot]) for slot in self._doc_slots.get(doc_id, [])]
+
+    def _delete_chunks(self, rows: List[Dict[str, Any]]):
+        """删除文档中的部分条目，按文档各追加一条删除记录"""
+        row_ids: Dict[str, List[int]] = {}
+        for row in rows:
+            row_ids.setdefault(row["doc_id"], []).append(int(row["id"]))
+        with self._lock:
+            records = [
+                {"op": "delete_rows", "doc_id": doc_id, "ids": ids}
+                for doc_id, ids in row_ids.items() if self._apply_delete_rows(doc_id, ids)
+            ]
+            if records:
+                self._append_log(records)
+            if self._deleted > max(1000, COMPACT_RATIO * len(self._rows)):
+                self._compact()
+
+    def _fetch_embeddings(self, doc_id: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        with self._lock:
+            slots = self._doc_slots.get(doc_id, [])
+            rows = [{field: self._rows[slot][field] for field in DEFAULT_FIELDS} for slot in slots]
+            return rows, np.array(self._vectors[slots], dtype=np.float32) if slots else None
+
+    def get_document_count(self) -> int:
+        """获取知识库中文档数量"""
+        return int(self._alive.sum())
+
+    def get_document_by_id(self, doc_id: str, fields: List[str] = DEFAULT_FIELDS) -> Optional[Dict[str, Any]]:
+        """根据文档 ID 获取文档信息，不存在则返回 None"""
+        with self._lock:
+            slots = self._doc_slots.get(doc_id)
+            if not slots:
+                return None
+            row = self._rows[slots[0]]
+            return {field: row.get(field) for field in fields if field in row}
+
+    def get_documents_by_ids(self, doc_ids: List[str], fields: List[str] = DEFAULT_FIELDS) -> Dict[str, Dict[str, Any]]:
+        """批量获取文档信息，返回 doc_id -> 文档信息"""
+        documents = {}
+        with self._lock:
+            for doc_id in doc_ids:
+                slots = self._doc_slots.get(doc_id)
+                if slots:
+                    row = self._rows[slots[0]]
+                    documents[doc_id] = {field: row.get(field) for field in fields if field in row}
+        return documents
+
+    def _clear_all_documents(self):
+        """清空知识库所有文档"""
+        with self._lock:
+            self._vectors = None
+            for path in (self.meta_file, self.vectors_file, self.metadata_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.dimension = None
+            self._capacity = 0
+            self._rows = []
+            self._alive = np.zeros(0, dtype=bool)
+            self._granularity = np.zeros(0, dtype=np.int8)
+            self._doc_slots = {}
+            self._deleted = 0
+            self._ivf = None
+            self._layout += 1
+
+    def assign_groups(self, group_documents: Dict[str, List[str]]) -> int:
+        """记录已有文档所属的分组，返回更新的条目数"""
+        updated = 0
+        with self._lock:
+            records = []
+            for group, doc_ids in group_documents.items():
+                for doc_id in doc_ids:
+                    slots = self._doc_slots.get(doc_id, [])
+                    if any(self._rows[slot]["group"] != group for slot in slots):
+                        updated += self._apply_group(doc_id, group)
+                        records.append({"op": "group", "doc_id": doc_id, "group": group})
+            if records:
+                self._append_log(records)
+        if updated:
+            self.search_cache.bump()
+            self.dedup_index.reset()
+            self.lexical_index.set_scopes({record["doc_id"]: record["group"] for record in records})
+        return updated
+
+    def iter_documents(self, fields: List[str] = DEFAULT_FIELDS, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """分批遍历全部条目"""
+        with self._lock:
+            rows = [row for row in self._rows if row is not None]
+        for start in range(0, len(rows), batch_size):
+            yield [{field: row.get(field) for field in fields if field in row} for row in rows[start:start + batch_size]]
+
+    def iter_embeddings(self, groups: List[str] = None,
+                        batch_size: int = 1000) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """分批遍历全部条目及其向量
+
+        存活条目的元数据和向量在锁内一次性复制，遍历期间的写入和压缩不影响结果。
+        """
+        with self._lock:
+            slots = np.flatnonzero(self._alive[:len(self._rows)])
+            rows = [{field: self._rows[slot][field] for field in METADATA_FIELDS} for slot in slots]
+            vectors = np.array(self._vectors[slots], dtype=np.float32) if len(slots) else None
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size], vectors[start:start + batch_size]
+
+    # ---------------- 检索 ----------------
+    def _ensure_ivf(self) -> Optional[IVFIndex]:
+        """返回当前可用的 IVF 索引
+
+        需要构建或重建（行数翻倍）时在后台线程中训练，期间沿用旧索引或精确检索，
+        不在锁内执行 k-means。调用方需持有锁。
+        """
+        if self.index_type != "ivf":
+            return None
+        alive = self.get_document_count()
+        if alive < self.ivf_min_rows:
+            self._ivf = None
+            return None
+        if (self._ivf is None or alive > 2 * self._ivf.built_rows) and self._ivf_thread is None:
+            end = len(self._rows)
+            self._ivf_thread = threading.Thread(
+                target=self._build_ivf,
+                args=(self._vectors, np.flatnonzero(self._alive[:end]), end, self._layout),
+                daemon=True, name="kb-ivf"
+            )
+            self._ivf_thread.start()
+        return self._ivf
+
+    def _build_ivf(self, vectors: np.ndarray, slots: np.ndarray, end: int, layout: int):
+        """在锁外训练 IVF 索引后换入，训练期间新增的行补充分桶"""
+        try:
+            nlist = settings.local_store_nlist or int(4 * np.sqrt(len(slots)))
+            ivf = IVFIndex(nlist=nlist, nprobe=self.nprobe)
+            ivf.build(vectors, slots)
+            with self._lock:
+                # 训练期间发生压缩或清空时行号已失效，丢弃结果
+                if layout != self._layout:
+                    return
+                added = np.flatnonzero(self._alive[end:len(self._rows)]) + end
+                if len(added):
+                    ivf.add(self._vectors[added], added.tolist())
+                self._ivf = ivf
+            print(f"本地向量存储IVF索引已构建: nlist={ivf.nlist}，{len(slots)} 条")
+        except Exception as e:
+            print(f"本地向量存储IVF索引构建失败，继续使用精确检索: {str(e)}")
+        finally:
+            with self._lock:
+                self._ivf_thread = None
+
+    def _search_by_embedding(self, query_embedding: List[float], top_k: int = 5, keyword: str = None,
+                             groups: List[str] = None, level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """使用已生成的查询向量执行检索
+
+        锁内只取快照（行数、向量映射、存活与粒度掩码），打分在锁外进行，
+        检索之间以及检索与写入之间不互相阻塞。
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        excluded = GRANULARITY_CODES[EXCLUDED_GRANULARITY[level]]
+
+        with self._lock:
+            if self._vectors is None or not self._rows:
+                return []
+            n = len(self._rows)
+            vectors = self._vectors
+            rows = self._rows
+            # 存活与粒度过滤
+            mask = self._alive[:n] & (self._granularity[:n] != excluded)
+            ivf = self._ensure_ivf()
+
+        if ivf is not None:
+            candidates = ivf.candidates(query)
+            candidates = candidates[candidates < n]
+            candidates = candidates[mask[candidates]]
+        else:
+            candidates = np.flatnonzero(mask)
+
+        # 分组过滤（快照之后被删除的行为 None）
+        if groups:
+            group_set = set(groups)
+            candidates = np.fromiter(
+                (slot for slot in candidates.tolist() if rows[slot] is not None and rows[slot]["group"] in group_set),
+                dtype=np.int64
+            )
+        # 标题关键词过滤
+        if keyword:
+            candidates = np.fromiter(
+                (slot for slot in candidates.tolist()
+                 if rows[slot] is not None and keyword in rows[slot]["section_title"]),
+                dtype=np.int64
+            )
+        if len(candidates) == 0:
+            return []
+
+        if ivf is not None:
+            # IVF 已缩小候选范围，只取候选行打分
+            scores = np.asarray(vectors[candidates]) @ query
+        else:
+            # 精确检索对连续的向量切片整体打分，再按掩码取候选
+            scores = (np.asarray(vectors[:n]) @ query)[candidates]
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        search_results = []
+        for position in top.tolist():
+            row = rows[int(candidates[position])]
+            if row is None:
+                continue
+            search_results.append({
+                'doc_id': row['doc_id'],
+                'section_title': row['section_title'],
+                'summary': row['summary'],
+                'title_path': row['title_path'],
+                'score': float(scores[position])
+            })
+        return search_results
+
+    def status(self) -> Dict[str, Any]:
+        """本地存储状态"""
+        return {
+            "backend": self.backend_name,
+            "state": "ready",
+            "ready": True,
+            "store_dir": self.store_dir,
+            "rows": self.get_document_count(),
+            "deleted_rows": self._deleted,
+            "index_type": "ivf" if self._ivf is not None else "flat",
+        }
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Milvus 连接与集合句柄管理"""
+
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional
+
+from pymilvus import connections, utility, Collection, CollectionSchema
+
+from ..config import settings
+
+
+# 未指定分区的数据写入默认分区
+DEFAULT_PARTITION = "_default"
+
+
+class MilvusNotReadyError(RuntimeError):
+    """Milvus 连接尚未就绪"""
+
+
+class MilvusCollectionManager:
+    """长连接集合句柄管理器
+
+    首次启动时建立连接、创建缺失的集合与索引并加载集合，之后缓存
+    Collection 句柄和索引状态，每次查询只剩检索 RPC 本身。后台线程定期
+    检查连接健康状况，连接断开时按指数退避重连并重新加载集合。
+
+    分区按需加载模式（lazy_partitions）下，连接时只加载默认分区，其余分区在
+    检索前加载；已加载分区超过 max_loaded_partitions 时释放最久未使用且未在
+    检索中的分区，限制查询节点内存。锁内只决定加载和释放哪些分区，load /
+    release RPC 在锁外执行，同一分区的并发请求等待同一次加载完成。
+    """
+
+    STATE_DISCONNECTED = "disconnected"
+    STATE_CONNECTING = "connecting"
+    STATE_READY = "ready"
+    STATE_RECONNECTING = "reconnecting"
+
+    def __init__(self, uri: str, collection_name: str,
+                 schema_factory: Callable[[], CollectionSchema],
+                 index_specs: Dict[str, Dict[str, Any]],
+                 alias: str = "default",
+                 health_check_interval: float = None,
+                 max_backoff: float = None,
+                 lazy_partitions: bool = None,
+                 max_loaded_partitions: int = None):
+        """
+        Args:
+            uri: Milvus 服务地址
+            collection_name: 集合名称
+            schema_factory: 集合不存在时用于创建集合的 schema 工厂
+            index_specs: 字段名 -> 索引参数，缺失的索引会在连接时创建
+            alias: 连接别名
+            health_check_interval: 健康检查间隔（秒）
+            max_backoff: 重连最大退避时间（秒）
+            lazy_partitions: 是否按需加载分区
+            max_loaded_partitions: 按需加载模式下同时加载的分区数上限
+        """
+        self.uri = uri
+        self.collection_name = collection_name
+        self.schema_factory = schema_factory
+        self.index_specs = index_specs
+        self.alias = alias
+        self.health_check_interval = health_check_interval or settings.milvus_health_check_interval
+        self.max_backoff = max_backoff or settings.milvus_reconnect_max_backoff
+        self.lazy_partitions = settings.milvus_lazy_partition_load if lazy_partitions is None else lazy_partitions
+        self.max_loaded_partitions = max_loaded_partitions or settings.milvus_max_loaded_partitions
+
+        self.state = self.STATE_DISCONNECTED
+        self.last_error: Optional[str] = None
+        self.reconnect_count = 0
+        self.indexed_fields = set()
+
+        # 分区状态：已存在的分区；按需加载模式下被检索使用的分区（分区名 -> 使用中的检索数，按最近使用排序）、
+        # 已加载完成的分区，以及正在加载或释放的分区（分区名 -> 完成事件）
+        self.partitions = set()
+        self.partition_loads = 0
+        self.partition_releases = 0
+        self._loaded_partitions: "OrderedDict[str, int]" = OrderedDict()
+        self._ready_partitions = set()
+        self._pending_partitions: Dict[str, threading.Event] = {}
+        self._partition_lock = threading.Lock()
+
+        self._collection: Optional[Collection] = None
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    # ---------------- 生命周期 ----------------
+    def start(self):
+        """建立连接并启动健康检查线程，首次连接失败时由后台线程继续重试"""
+        try:
+            self._setup()
+        except Exception as e:
+            self._mark_unhealthy(e)
+
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(
+                target=self._health_loop,
+                name=f"milvus-health-{self.collection_name}",
+                daemon=True
+            )
+            self._health_thread.start()
+
+    def stop(self):
+        """停止健康检查线程"""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _setup(self):
+        """连接服务器，确保集合和索引存在并加载集合"""
+        with self._lock:
+            if self.state != self.STATE_RECONNECTING:
+                self.state = self.STATE_CONNECTING
+
+            if self.alias in connections.list_connections():
+                connections.disconnect(self.alias)
+            connections.connect(alias=self.alias, uri=self.uri)
+            print(f"成功连接到Milvus服务器: {self.uri}")
+
+            if not utility.has_collection(self.collection_name, using=self.alias):
+                Collection(name=self.collection_name, schema=self.schema_factory(), using=self.alias)
+                print(f"成功创建集合: {self.collection_name}")
+            else:
+                print(f"集合已存在: {self.collection_name}")
+
+            collection = Collection(name=self.collection_name, using=self.alias)
+            self._ensure_indexes(collection)
+
+            # 只在建立连接时加载一次
+            self.partitions = {partition.name for partition in collection.partitions}
+            with self._partition_lock:
+                self._loaded_partitions.clear()
+                self._ready_partitions.clear()
+                if self.lazy_partitions:
+                    # 按需加载模式只加载默认分区，先释放之前整体加载的集合
+                    collection.release()
+                    collection.load(partition_names=[DEFAULT_PARTITION])
+                    self._loaded_partitions[DEFAULT_PARTITION] = 0
+                    self._ready_partitions.add(DEFAULT_PARTITION)
+                else:
+                    collection.load()
+            print(f"集合 {self.collection_name} 已加载")
+
+            self._collection = collection
+            self.state = self.STATE_READY
+            self.last_error = None
+
+    def _ensure_indexes(self, collection: Collection):
+        """创建缺失的索引并缓存索引状态"""
+        existing = {index.field_name for index in collection.indexes}
+        missing = [field_name for field_name in self.index_specs if field_name not in existing]
+        if missing and existing:
+            # 已有集合新增索引前先释放，随后统一重新加载
+            collection.release()
+        for field_name, index_params in self.index_specs.items():
+            if field_name not in existing:
+                collection.create_index(field_name=field_name, index_params=index_params)
+                print(f"成功为{field_name}创建索引: {index_params.get('index_type')}")
+                existing.add(field_name)
+        self.indexed_fields = existing
+
+    def reset(self):
+        """集合被删除或重建后重新初始化句柄"""
+        with self._lock:
+            self._collection = None
+            self._setup()
+
+    # ---------------- 句柄访问 ----------------
+    @property
+    def is_ready(self) -> bool:
+        return self.state == self.STATE_READY and self._collection is not None
+
+    def get_collection(self) -> Collection:
+        """获取已加载的集合句柄
+
+        Raises:
+            MilvusNotReadyError: 连接尚未就绪（正在重连中）
+        """
+        collection = self._collection
+        if collection is None or self.state != self.STATE_READY:
+            raise MilvusNotReadyError(f"Milvus连接未就绪: {self.state}，{self.last_error or ''}")
+        return collection
+
+    def report_failure(self, error: Exception):
+        """调用方检测到 RPC 失败时上报，立即触发健康检查"""
+        self._wakeup.set()
+        print(f"Milvus调用失败，触发健康检查: {error}")
+
+    # ---------------- 分区 ----------------
+    def ensure_partition(self, partition_name: str):
+        """分区不存在时创建（整体加载模式下同时加载新分区）"""
+        if partition_name in self.partitions:
+            return
+        with self._partition_lock:
+            collection = self.get_collection()
+            if not collection.has_partition(partition_name):
+                collection.create_partition(partition_name)
+                print(f"成功创建分区: {partition_name}")
+            if not self.lazy_partitions:
+                collection.partition(partition_name).load()
+            self.partitions.add(partition_name)
+
+    def drop_partition(self, partition_name: str):
+        """释放并删除分区"""
+        with self._partition_lock:
+            collection = self.get_collection()
+            if collection.has_partition(partition_name):
+                collection.partition(partition_name).release()
+                collection.drop_partition(partition_name)
+                print(f"成功删除分区: {partition_name}")
+            self._loaded_partitions.pop(partition_name, None)
+            self._ready_partitions.discard(partition_name)
+            self.partitions.discard(partition_name)
+
+    def partition_batches(self, partition_names: Optional[List[str]] = None) -> List[Optional[List[str]]]:
+        """将检索涉及的分区切分为多批，按需加载模式下每批不超过 max_loaded_partitions 个
+
+        整体加载模式下原样返回一批；partition_names 为 None 表示全部分区。
+        """
+        if not self.lazy_partitions:
+            return [partition_names]
+        names = sorted(self.partitions) if partition_names is None else list(partition_names)
+        size = max(self.max_loaded_partitions, 1)
+        return [names[start:start + size] for start in range(0, len(names), size)]
+
+    @contextmanager
+    def use_partitions(self, partition_names: Optional[List[str]] = None):
+        """检索期间保证分区已加载且不会被释放
+
+        整体加载模式下不做任何操作。按需加载模式下加载缺失的分区，
+        partition_names 为 None 表示全部分区（检索应按 partition_batches 分批）。
+        """
+        if not self.lazy_partitions:
+            yield
+            return
+
+        names = sorted(self.partitions) if partition_names is None else list(partition_names)
+        with self._partition_lock:
+            collection = self.get_collection()
+            # 先登记使用，避免加载期间被其他检索释放
+            for name in names:
+                self._loaded_partitions[name] = self._loaded_partitions.get(name, 0) + 1
+                self._loaded_partitions.move_to_end(name)
+        try:
+            for name in names:
+                self._load_partition(collection, name)
+            self._release_idle_partitions(collection)
+            yield
+        finally:
+            with self._partition_lock:
+                for name in names:
+                    if name in self._loaded_partitions:
+                        self._loaded_partitions[name] -= 1
+
+    def _load_partition(self, collection: Collection, name: str):
+        """加载分区；其他线程正在加载或释放该分区时等待其完成后再判断"""
+        while True:
+            with self._partition_lock:
+                if name in self._ready_partitions:
+                    return
+                pending = self._pending_partitions.get(name)
+                if pending is None:
+                    done = self._pending_partitions[name] = threading.Event()
+            if pending is not None:
+                pending.wait()
+                continue
+
+            try:
+                collection.partition(name).load()
+                with self._partition_lock:
+                    self._ready_partitions.add(name)
+                    self.partition_loads += 1
+            finally:
+                with self._partition_lock:
+                    self._pending_partitions.pop(name, None)
+                done.set()
+            return
+
+    def _release_idle_partitions(self, collection: Collection):
+        """已加载分区超过上限时释放最久未使用且未在检索中的分区"""
+        with self._partition_lock:
+            releasing = []
+            for name in list(self._loaded_partitions):
+                if len(self._ready_partitions) <= self.max_loaded_partitions:
+                    break
+                if self._loaded_partitions[name] == 0 and name not in self._pending_partitions:
+                    del self._loaded_partitions[name]
+                    if name in self._ready_partitions:
+                        self._ready_partitions.discard(name)
+                        self._pending_partitions[name] = threading.Event()
+                        releasing.append(name)
+
+        for name in releasing:
+            try:
+                collection.partition(name).release()
+            except Exception as e:
+                print(f"释放分区失败 {name}: {e}")
+            finally:
+                with self._partition_lock:
+                    self.partition_releases += 1
+                    self._pending_partitions.pop(name).set()
+
+    # ---------------- 健康检查 ----------------
+    def _mark_unhealthy(self, error: Exception):
+        with self._lock:
+            self.state = self.STATE_RECONNECTING
+            self.last_error = str(error)
+        print(f"Milvus连接不可用: {error}")
+
+    def _ping(self):
+        """检查服务器可达且集合仍存在"""
+        utility.get_server_version(using=self.alias)
+        if not utility.has_collection(self.collection_name, using=self.alias):
+            raise MilvusNotReadyError(f"集合 {self.collection_name} 不存在")
+
+    def _health_loop(self):
+        backoff = 1.0
+        while not self._stopped.is_set():
+            if self.state == self.STATE_READY:
+                self._wakeup.wait(self.health_check_interval)
+                self._wakeup.clear()
+                if self._stopped.is_set():
+                    break
+                try:
+                    self._ping()
+                    continue
+                except Exception as e:
+                    self._mark_unhealthy(e)
+
+            # 指数退避重连
+            try:
+                self._setup()
+                self.reconnect_count += 1
+                backoff = 1.0
+                print(f"Milvus重连成功（第 {self.reconnect_count} 次）")
+            except Exception as e:
+                self._mark_unhealthy(e)
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def status(self) -> Dict[str, Any]:
+        """返回连接就绪状态"""
+        return {
+            "state": self.state,
+            "ready": self.is_ready,
+            "uri": self.uri,
+            "collection": self.collection_name,
+            "indexed_fields": sorted(self.indexed_fields),
+            "partitions": len(self.partitions),
+            "lazy_partitions": self.lazy_partitions,
+            "loaded_partitions": len(self._ready_partitions) if self.lazy_partitions else len(self.partitions),
+            "partition_loads": self.partition_loads,
+            "partition_releases": self.partition_releases,
+            "reconnect_count": self.reconnect_count,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Milvus 版本化集合与后台重新嵌入迁移"""
+
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+
+from ..config import settings
+from .lexical_index import entry_key
+
+# 集合 schema 版本，字段变化时递增
+# v2: 新增 granularity 字段（超长条目的窗口条目与池化文档条目）
+SCHEMA_VERSION = 2
+GRANULARITY_SCHEMA_VERSION = 2
+# 未记录版本信息的旧集合字段与 v1 相同
+LEGACY_SCHEMA_VERSION = 1
+
+# 未记录版本信息的旧集合（schema 版本 0）由 all-MiniLM-L6-v2 生成
+LEGACY_MODEL_NAME = "all-MiniLM-L6-v2"
+LEGACY_RUNTIME = "torch"
+
+# 迁移复制的字段（源集合支持时另外复制 granularity）
+COPY_FIELDS = ['doc_id', 'section_title', 'summary', 'title_path']
+
+
+def versioned_collection_name(base_name: str, model_id: str, dimension: int,
+                              schema_version: int = SCHEMA_VERSION) -> str:
+    """版本化集合名称：基础名 + 模型标识 + 维度 + schema 版本
+
+    Milvus 集合名只允许字母、数字和下划线。
+    """
+    model_slug = re.sub(r"[^0-9a-zA-Z]+", "_", model_id).strip("_").lower()
+    return f"{base_name}__{model_slug}__d{dimension}__v{schema_version}"[:255]
+
+
+class CollectionRegistry:
+    """记录当前提供服务的集合（data/milvus_collections.json）
+
+    切换集合时原子替换该文件，重启后继续使用已切换的集合。
+    """
+
+    def __init__(self, registry_file: str = None):
+        self.registry_file = registry_file or os.path.join(settings.data_dir, "milvus_collections.json")
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.registry_file):
+            return None
+        with open(self.registry_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_active(self, collection: Dict[str, Any], previous: Dict[str, Any] = None):
+        data = {
+            "active": collection,
+            "previous": previous,
+            "updated_at": datetime.now().isoformat(),
+        }
+        os.makedirs(os.path.dirname(self.registry_file), exist_ok=True)
+        tmp_file = self.registry_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.registry_file)
+
+
+class CollectionMigration:
+    """后台重新嵌入迁移任务
+
+    从源集合分批读取 summary 等字段，用目标模型重新嵌入后写入目标集合，
+    源集合在迁移期间继续提供服务。迁移期间的新增和删除同时作用于目标集合：
+    新增条目由知识库双写（mirror_insert），复制时跳过；删除的文档记录下来，
+    复制时过滤并立即从目标集合删除。复制、双写和删除在同一把锁下写入目标
+    集合，避免已删除的数据被复制回来。复制完成后调用 on_complete 切换服务集合，
+    切换由知识库负责等待进行中的写入完成。
+    """
+
+    STATE_RUNNING = "running"
+    STATE_SWITCHING = "switching"
+    STATE_COMPLETED = "completed"
+    STATE_FAILED = "failed"
+    STATE_CANCELLED = "cancelled"
+
+    def __init__(self, source: Dict[str, Any], target: Dict[str, Any],
+                 read_batches: Callable[[int], Any],
+                 source_count: Callable[[], int],
+                 embed: Callable[[List[str]], Any],
+                 insert: Callable[[List[Dict[str, Any]], Any], None],
+                 delete: Callable[[List[str]], None],
+                 on_complete: Callable[[], None],
+                 on_abort: Callable[[], None] = None,
+                 batch_size: int = None,
+                 rows_per_second: float = None):
+        """
+        Args:
+            source: 源集合信息（name, model_name, runtime, dimension）
+            target: 目标集合信息
+            read_batches: 按批大小遍历源集合的生成器工厂
+            source_count: 源集合行数
+            embed: 使用目标模型生成嵌入
+            insert: 写入目标集合
+            delete: 从目标集合删除文档
+            on_complete: 复制完成后切换服务集合
+            on_abort: 迁移取消或失败后清理目标集合句柄
+            batch_size: 每批读取和嵌入的行数
+            rows_per_second: 限速（行/秒），0 表示不限速
+        """
+        self.source = source
+        self.target = target
+        self._read_batches = read_batches
+        self._source_count = source_count
+        self._embed = embed
+        self._insert = insert
+        self._delete = delete
+        self._on_complete = on_complete
+        self._on_abort = on_abort
+        self.batch_size = batch_size or settings.milvus_migration_batch_size
+        self.rows_per_second = (settings.milvus_migration_rows_per_second
+                                if rows_per_second is None else rows_per_second)
+
+        self.state = self.STATE_RUNNING
+        self.error: Optional[str] = None
+        self.total = 0
+        self.copied = 0
+        self.skipped = 0
+        self.mirrored = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._write_lock = threading.Lock()
+        self._mirrored_keys = set()
+        self._deleted_doc_ids = set()
+        self._cancelled = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------- 生命周期 ----------------
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="milvus-migration", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def active(self) -> bool:
+        return self.state in (self.STATE_RUNNING, self.STATE_SWITCHING)
+
+    # ---------------- 迁移期间的双写 ----------------
+    def mirror_insert(self, documents: List[Dict[str, Any]]):
+        """迁移期间新增的条目同时写入目标集合"""
+        embeddings = self._embed([str(doc.get('summary', '')) for doc in documents])
+        with self._write_lock:
+            self._insert(documents, embeddings)
+            self._mirrored_keys.update(entry_key(doc) for doc in documents)
+            self.mirrored += len(documents)
+
+    def mirror_delete(self, doc_ids: List[str]):
+        """迁移期间删除的文档同时从目标集合删除，并在复制时过滤"""
+        with self._write_lock:
+            self._deleted_doc_ids.update(doc_ids)
+            self._delete(doc_ids)
+
+    # ---------------- 复制 ----------------
+    def _throttle(self, rows: int, batch_started_at: float):
+        if self.rows_per_second and self.rows_per_second > 0:
+            remaining = rows / self.rows_per_second - (time.time() - batch_started_at)
+            if remaining > 0:
+                self._cancelled.wait(remaining)
+
+    def _run(self):
+        try:
+            self.total = self._source_count()
+            print(f"开始迁移集合 {self.source['name']} -> {self.target['name']}，共 {self.total} 条")
+            for batch in self._read_batches(self.batch_size):
+                if self._cancelled.is_set():
+                    self.state = self.STATE_CANCELLED
+                    print(f"集合迁移已取消: {self.target['name']}")
+                    self._abort()
+                    return
+                batch_started_at = time.time()
+                embeddings = self._embed([str(row.get('summary', '')) for row in batch])
+                with self._write_lock:
+                    keep = [
+                        index for index, row in enumerate(batch)
+                        if row.get('doc_id') not in self._deleted_doc_ids
+                        and entry_key(row) not in self._mirrored_keys
+                    ]
+                    if keep:
+                        self._insert([batch[i] for i in keep], embeddings[keep])
+                self.copied += len(keep)
+                self.skipped += len(batch) - len(keep)
+                self._throttle(len(batch), batch_started_at)
+
+            self.state = self.STATE_SWITCHING
+            self._on_complete()
+            self.state = self.STATE_COMPLETED
+            print(f"集合迁移完成，已切换到 {self.target['name']}（复制 {self.copied} 条，双写 {self.mirrored} 条）")
+        except Exception as e:
+            self.state = self.STATE_FAILED
+            self.error = str(e)
+            print(f"集合迁移失败: {e}")
+            self._abort()
+        finally:
+            self.finished_at = time.time()
+
+    def _abort(self):
+        if self._on_abort is None:
+            return
+        try:
+            self._on_abort()
+        except Exception as e:
+            print(f"清理迁移目标集合失败: {e}")
+
+    # ---------------- 进度 ----------------
+    def status(self) -> Dict[str, Any]:
+        processed = self.copied + self.skipped
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0
+        rate = processed / elapsed if elapsed > 0 else 0
+        remaining = max(self.total - processed, 0)
+        return {
+            "state": self.state,
+            "source": self.source,
+            "target": self.target,
+            "total": self.total,
+            "copied": self.copied,
+            "skipped": self.skipped,
+            "mirrored": self.mirrored,
+            "progress": round(min(processed / self.total, 1.0), 4) if self.total else (1.0 if self.state == self.STATE_COMPLETED else 0.0),
+            "rows_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate, 1) if rate and self.active else None,
+            "throttle_rows_per_second": self.rows_per_second,
+            "elapsed_seconds": round(elapsed, 1),
+            "error": self.error,
+        }
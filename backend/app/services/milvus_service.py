@@ -4,272 +4,451 @@
 
 import os
 import json
-import numpy as np
-from typing import List, Dict, Any, Optional
-
-# 设置Hugging Face国内镜像地址
-os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 
+import numpy as np
 from pymilvus import connections, utility, Collection, FieldSchema, CollectionSchema, DataType
-from sentence_transformers import SentenceTransformer
 
 # 导入应用配置
 from ..config import settings
+from .knowledge_base_backend import KnowledgeBaseBackend, DEFAULT_FIELDS, LEVEL_FINE, EXCLUDED_GRANULARITY
+from .embedding_service import EmbeddingService, encode_pooled
+from .milvus_connection import MilvusCollectionManager, DEFAULT_PARTITION
+from .search_cache import SearchCache
+from .milvus_migration import (
+    CollectionRegistry, CollectionMigration, versioned_collection_name,
+    SCHEMA_VERSION, GRANULARITY_SCHEMA_VERSION, LEGACY_SCHEMA_VERSION, LEGACY_MODEL_NAME, LEGACY_RUNTIME,
+    COPY_FIELDS
+)
+
+# 单次 query 可返回的最大行数（Milvus offset + limit 上限）
+MAX_QUERY_LIMIT = 16384
+
+# 迁移目标集合使用独立的连接别名，避免与服务中的连接互相重连
+MIGRATION_ALIAS = "migration"
+
+
+def quote_literal(value: Any) -> str:
+    """将值转为 Milvus 表达式中的字符串字面量（转义引号和反斜杠）"""
+    return json.dumps(str(value), ensure_ascii=False)
+
 
+def group_partition_name(group: Optional[str]) -> str:
+    """分组对应的分区名称（分区名只允许字母、数字和下划线），未分组的数据使用默认分区"""
+    if not group:
+        return DEFAULT_PARTITION
+    return "g_" + hashlib.sha1(str(group).encode("utf-8")).hexdigest()[:16]
 
-class MilvusKnowledgeBase:
-    """Milvus 知识库管理服务"""
+
+class MilvusKnowledgeBase(KnowledgeBaseBackend):
+    """Milvus 知识库管理服务
+    
+    集合按 (基础名, 嵌入模型, 维度, schema 版本) 版本化，当前提供服务的集合
+    记录在 CollectionRegistry 中。配置的嵌入模型与服务集合不一致时，继续用
+    原模型和原集合提供服务，同时在后台把已有条目重新嵌入到新集合，完成后
+    原子切换。
+    
+    每个知识库分组对应集合中的一个分区，入库时按条目的 group 字段写入对应分区，
+    按分组检索时只检索这些分区，耗时与分组大小而不是整个知识库的大小相关。
+    """
+    
+    backend_name = "milvus"
     
     def __init__(self):
         """初始化 Milvus 连接和模型"""
-        # 检查是否启用Milvus
-        self.enable_milvus = settings.enable_milvus
-        if not self.enable_milvus:
-            print("Milvus功能已禁用")
-            return
-            
+        super().__init__()
+        
         # Milvus 连接配置
         self.milvus_uri = settings.milvus_uri
-        self.collection_name = settings.milvus_collection_name
+        self.base_collection_name = settings.milvus_collection_name
         self.index_type = settings.milvus_index_type
         self.index_params = settings.milvus_index_params
         self.search_params = settings.milvus_search_params
         
-        # 全局集合实例
-        self.collection = None
-        
-        # 初始化嵌入模型
-        # self.embedding_model = SentenceTransformer('Qwen/Qwen3-Embedding-0.6')
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # 连接Milvus服务器
-        self.connect()
+        # 缓存代数与连接同一集合的其他 worker 共享
+        self.search_cache = SearchCache(
+            generation_file=os.path.join(settings.data_dir, f"{self.base_collection_name}.search_generation")
+        )
         
-        # 创建集合（如果不存在）
-        self.create_collection()
+        # 配置的嵌入模型对应的目标集合，以及当前提供服务的集合
+        self.registry = CollectionRegistry()
+        self._schema_versions: Dict[str, int] = {}  # 集合名称 -> schema 版本
+        self.target_service = self.embedding_service
+        self.target_info = self._collection_info(self.target_service)
+        self.active_info = self._resolve_active_collection()
+        self.collection_name = self.active_info["name"]
+        if not self._matches_target(self.active_info):
+            # 迁移完成前查询仍需使用生成旧集合向量的模型
+            self.embedding_service = EmbeddingService(
+                model_name=self.active_info["model_name"],
+                runtime=self.active_info["runtime"],
+                model_path=self.active_info.get("model_path") or self.active_info["model_name"],
+                onnx_file=self.active_info.get("onnx_file"),
+                use_cache=False
+            )
         
-        # 初始化集合实例
-        self._init_collection()
+        # 长连接集合句柄管理器：连接、建集合、建索引、加载集合只做一次
+        self.collection_manager = self._create_manager(self.active_info)
+        self.collection_manager.start()
+        
+        # 迁移状态；切换集合时等待进行中的写入完成
+        self.migration: Optional[CollectionMigration] = None
+        self._migration_lock = threading.Lock()
+        self._writes = threading.Condition()
+        self._active_writes = 0
+        self._switching = False
+        
+        if not self._matches_target(self.active_info):
+            print(f"嵌入模型已变更: {self.active_info['name']} -> {self.target_info['name']}")
+            if settings.milvus_auto_migrate:
+                try:
+                    self.start_migration()
+                except Exception as e:
+                    print(f"启动集合迁移失败: {e}")
     
-    def _init_collection(self):
-        """初始化集合实例"""
-        if not self.enable_milvus:
-            return
-        
-        self.collection = Collection(name=self.collection_name)
-        # 直接加载集合，不检查is_loaded属性（因为SDK版本不支持）
-        self.collection.load()
-        print(f"集合 {self.collection_name} 已加载")
-    
-    def connect(self):
-        """连接到Milvus服务器"""
-        # 检查是否已存在连接
-        if "default" in connections.list_connections():
-            connections.disconnect("default")
-        
-        # 连接到Milvus服务器
-        connections.connect(
-            alias="default",
-            uri=self.milvus_uri
-        )
-        print(f"成功连接到Milvus服务器: {self.milvus_uri}")
+    @property
+    def collection(self) -> Collection:
+        """已加载的集合句柄"""
+        return self.collection_manager.get_collection()
+    
+    # ---------------- 集合版本 ----------------
+    def _collection_info(self, service: EmbeddingService) -> Dict[str, Any]:
+        """嵌入服务对应的版本化集合信息"""
+        dimension = service.dimension
+        return {
+            "name": versioned_collection_name(self.base_collection_name, service.model_id, dimension),
+            "model_name": service.model_name,
+            "runtime": service.runtime,
+            "model_path": service.model_path or settings.embedding_model_path or None,
+            "model_id": service.model_id,
+            "onnx_file": service.onnx_file,
+            "dimension": dimension,
+            "schema_version": SCHEMA_VERSION,
+        }
     
-    def create_collection(self):
-        """创建知识库集合"""
-        # 向量维度设置为与嵌入模型匹配
-        # all-MiniLM-L6-v2 的维度是 384
-        embedding_dimension = 384
+    def _matches_target(self, info: Dict[str, Any]) -> bool:
+        return (info.get("model_id") == self.target_info["model_id"]
+                and info.get("dimension") == self.target_info["dimension"]
+                and info.get("schema_version") == SCHEMA_VERSION)
+    
+    def _resolve_active_collection(self) -> Dict[str, Any]:
+        """确定当前提供服务的集合
         
-        # 如果集合不存在则创建
-        if not utility.has_collection(self.collection_name):
-            # 定义字段
-            fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),  # 自增主键
-                FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=512),  # 原始文档唯一标识
-                FieldSchema(name="section_title", dtype=DataType.VARCHAR, max_length=512),  # 章节标题
-                FieldSchema(name="summary", dtype=DataType.VARCHAR, max_length=8192),  # 章节概述
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=embedding_dimension),  # 向量嵌入
-                FieldSchema(name="title_path", dtype=DataType.VARCHAR, max_length=1024)  # 章节层级
-            ]
-            
-            # 创建集合模式
-            schema = CollectionSchema(fields=fields, description="投标知识库")
-            
-            # 创建集合
-            collection = Collection(name=self.collection_name, schema=schema)
-            print(f"成功创建集合: {self.collection_name}")
-            
-            # 创建向量索引，添加度量类型（对于SentenceTransformer向量通常使用COSINE）
-            collection.create_index(
-                field_name="embedding",
-                index_params={"index_type": self.index_type, "metric_type": "COSINE", **self.index_params}
-            )
-            print(f"成功创建向量索引: {self.index_type}")
-            
-            # 为section_title字段创建倒排索引，支持关键词检索
-            collection.create_index(
-                field_name="section_title",
-                index_params={"index_type": "Trie"}
-            )
-            print("成功为section_title创建倒排索引: Trie")
-            
-            # 加载集合
-            collection.load()
-            print(f"集合 {self.collection_name} 已加载")
+        优先使用注册表记录；没有记录时，未版本化的旧集合（固定使用 all-MiniLM-L6-v2，
+        384 维）存在则沿用旧集合，否则直接使用目标集合。
+        """
+        registry = self.registry.load()
+        if registry and registry.get("active"):
+            return registry["active"]
+        
+        if self._legacy_collection_exists():
+            active = {
+                "name": self.base_collection_name,
+                "model_name": LEGACY_MODEL_NAME,
+                "runtime": LEGACY_RUNTIME,
+                "model_path": None,
+                "model_id": LEGACY_MODEL_NAME,
+                "dimension": 384,
+                "schema_version": LEGACY_SCHEMA_VERSION,
+            }
         else:
-            print(f"集合已存在: {self.collection_name}")
-            # 确保已存在的集合也被加载
-            collection = Collection(name=self.collection_name)
-            collection.load()
-            print(f"集合 {self.collection_name} 已加载")
-    
-    def add_documents(self, documents: List[Dict[str, Any]]):
-        """向知识库添加文档
+            active = self.target_info
+        self.registry.save_active(active)
+        return active
+    
+    def _legacy_collection_exists(self) -> bool:
+        """检查旧集合是否存在，Milvus 不可达时按存在处理，避免旧数据被忽略"""
+        try:
+            connections.connect(alias=MIGRATION_ALIAS, uri=self.milvus_uri)
+            return utility.has_collection(self.base_collection_name, using=MIGRATION_ALIAS)
+        except Exception as e:
+            print(f"检查旧集合失败，沿用旧集合: {e}")
+            return True
+    
+    def _create_manager(self, info: Dict[str, Any], alias: str = "default") -> MilvusCollectionManager:
+        schema_version = info.get("schema_version", LEGACY_SCHEMA_VERSION)
+        self._schema_versions[info["name"]] = schema_version
+        return MilvusCollectionManager(
+            uri=self.milvus_uri,
+            collection_name=info["name"],
+            schema_factory=lambda: self._build_schema(info["dimension"], schema_version),
+            index_specs=self._index_specs(),
+            alias=alias
+        )
+    
+    def _build_schema(self, dimension: int, schema_version: int = SCHEMA_VERSION) -> CollectionSchema:
+        """知识库集合模式
         
         Args:
-            documents: 文档列表，每个文档包含 doc_id, section_title, summary, title_path 字段
+            dimension: 向量维度，与生成该集合向量的嵌入模型一致
+            schema_version: 集合的 schema 版本
         """
-        if not documents:
-            return
-        
-        # 生成文本嵌入 - 使用 summary 作为嵌入源
-        summaries = [str(doc['summary']) for doc in documents]
-        embeddings = self.embedding_model.encode(summaries, convert_to_numpy=True).tolist()
-        
-        # 准备插入数据
-        data = [
-            [str(doc.get('doc_id', '')) for doc in documents],
-            [str(doc.get('section_title', '')) for doc in documents],
-            [str(doc.get('summary', '')) for doc in documents],
-            embeddings,
-            [str(doc.get('title_path', '')) for doc in documents]
+        # 定义字段
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),  # 自增主键
+            FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=512),  # 原始文档唯一标识
+            FieldSchema(name="section_title", dtype=DataType.VARCHAR, max_length=512),  # 章节标题
+            FieldSchema(name="summary", dtype=DataType.VARCHAR, max_length=8192),  # 章节概述
+            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dimension),  # 向量嵌入
+            FieldSchema(name="title_path", dtype=DataType.VARCHAR, max_length=1024)  # 章节层级
         ]
+        if schema_version >= GRANULARITY_SCHEMA_VERSION:
+            fields.append(FieldSchema(name="granularity", dtype=DataType.VARCHAR, max_length=16))  # 条目粒度
         
-        # 插入数据
-        collection = Collection(name=self.collection_name)
-        collection.insert(data)
-        print(f"成功添加 {len(documents)} 个文档到知识库")
+        # 创建集合模式
+        return CollectionSchema(fields=fields, description="投标知识库")
     
-    def search(self, query: str, top_k: int = 5, keyword: str = None) -> List[Dict[str, Any]]:
-        """搜索知识库 - 混合检索（向量 + 标题关键词）
-        
-        Args:
-            query: 查询文本
-            top_k: 返回结果数量
-            keyword: 标题关键词，用于精确匹配章节标题
-            
-        Returns:
-            搜索结果列表，包含 doc_id, section_title, summary, title_path, score 字段
-        """
-        # 生成查询嵌入
-        query_embedding = self.embedding_model.encode([query], convert_to_numpy=True).tolist()
-        
-        # 加载集合
-        collection = Collection(name=self.collection_name)
-        
-        # 检查索引是否存在，如果不存在则创建
-        indexes = collection.indexes
-        if len(indexes) < 2:  # 需要向量索引和标题倒排索引
-            print("索引不存在，正在创建...")
-            # 创建向量索引
-            collection.create_index(
-                field_name="embedding",
-                index_params={"index_type": self.index_type, "metric_type": "COSINE", **self.index_params}
-            )
-            print(f"成功创建向量索引: {self.index_type}")
+    def _index_specs(self) -> Dict[str, Dict[str, Any]]:
+        """集合所需索引"""
+        return {
+            # 向量索引，度量类型使用COSINE（适用于SentenceTransformer向量）
+            "embedding": {"index_type": self.index_type, "metric_type": "COSINE", **self.index_params},
+            # section_title倒排索引，支持关键词检索
+            "section_title": {"index_type": "Trie"},
+            # doc_id标量索引，支持按文档批量删除和查询
+            "doc_id": {"index_type": "Trie"},
+        }
+    
+    def _supports_granularity(self, manager: MilvusCollectionManager = None) -> bool:
+        """集合是否包含 granularity 字段"""
+        manager = manager or self.collection_manager
+        schema_version = self._schema_versions.get(manager.collection_name, LEGACY_SCHEMA_VERSION)
+        return schema_version >= GRANULARITY_SCHEMA_VERSION
+    
+    def _granularity_fields(self) -> List[str]:
+        """旧 schema 的服务集合（迁移完成前）不拆分超长条目"""
+        return ['granularity'] if self._supports_granularity() else []
+    
+    def _copy_fields(self, manager: MilvusCollectionManager = None) -> List[str]:
+        """迁移和移动分区时复制的字段"""
+        return COPY_FIELDS + (['granularity'] if self._supports_granularity(manager) else [])
+    
+    def _call(self, operation, *args, manager: MilvusCollectionManager = None, **kwargs):
+        """在缓存的集合句柄上执行操作，失败时通知管理器检查连接"""
+        manager = manager or self.collection_manager
+        collection = manager.get_collection()
+        try:
+            return operation(collection, *args, **kwargs)
+        except Exception as e:
+            manager.report_failure(e)
+            raise
+    
+    def _query(self, operation, manager: MilvusCollectionManager = None):
+        """执行需要全部分区已加载的查询（按需加载模式下先加载全部分区）"""
+        manager = manager or self.collection_manager
+        with manager.use_partitions():
+            return self._call(operation, manager=manager)
+    
+    def _doc_id_batches(self, doc_ids: List[str]):
+        """将 doc_id 列表切分为多个 doc_id in [...] 表达式"""
+        batch_size = max(settings.milvus_expr_batch_size, 1)
+        unique_ids = list(dict.fromkeys(str(doc_id) for doc_id in doc_ids))
+        for start in range(0, len(unique_ids), batch_size):
+            batch = unique_ids[start:start + batch_size]
+            yield batch, f"doc_id in {json.dumps(batch, ensure_ascii=False)}"
+    
+    def status(self) -> Dict[str, Any]:
+        """知识库连接状态"""
+        return {
+            "backend": self.backend_name,
+            **self.collection_manager.status(),
+            "embedding_model": self.active_info["model_id"],
+            "dimension": self.active_info["dimension"],
+            "migration": self.migration_status(),
+        }
+    
+    # ---------------- 写入 ----------------
+    @contextmanager
+    def _write_guard(self):
+        """登记进行中的写入，切换集合期间新的写入等待切换完成"""
+        with self._writes:
+            self._writes.wait_for(lambda: not self._switching)
+            self._active_writes += 1
+        try:
+            yield
+        finally:
+            with self._writes:
+                self._active_writes -= 1
+                self._writes.notify_all()
+    
+    def add_documents(self, documents: List[Dict[str, Any]], progress_callback=None,
+                      deduplicate: bool = True) -> Dict[str, float]:
+        """添加文档，嵌入和插入使用同一个服务集合"""
+        with self._write_guard():
+            return super().add_documents(documents, progress_callback, deduplicate)
+    
+    def _insert_batch(self, documents: List[Dict[str, Any]], embeddings):
+        """插入一批文档，迁移期间同时写入目标集合"""
+        self._insert_into(self.collection_manager, documents, embeddings)
+        migration = self.migration
+        if migration is not None and migration.active:
+            migration.mirror_insert(documents)
+    
+    def _insert_into(self, manager: MilvusCollectionManager, documents: List[Dict[str, Any]], embeddings):
+        """向指定集合插入一批文档，按条目所属分组写入对应分区"""
+        partitions: Dict[str, List[int]] = {}
+        for index, doc in enumerate(documents):
+            name = doc.get('partition') or group_partition_name(doc.get('group'))
+            partitions.setdefault(name, []).append(index)
+        
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        for name, indices in partitions.items():
+            manager.ensure_partition(name)
+            batch = [documents[i] for i in indices]
+            # 准备插入数据
+            data = [
+                [str(doc.get('doc_id', '')) for doc in batch],
+                [str(doc.get('section_title', '')) for doc in batch],
+                [str(doc.get('summary', '')) for doc in batch],
+                embeddings[indices].tolist(),
+                [str(doc.get('title_path', '')) for doc in batch]
+            ]
+            if self._supports_granularity(manager):
+                data.append([str(doc.get('granularity') or '') for doc in batch])
             
-            # 创建标题倒排索引
-            collection.create_index(
-                field_name="section_title",
-                index_params={"index_type": "Trie"}
-            )
-            print("成功为section_title创建倒排索引: Trie")
+            # 插入数据
+            self._call(lambda collection: collection.insert(data, partition_name=name), manager=manager)
+    
+    def _search_by_embedding(self, query_embedding: List[float], top_k: int = 5, keyword: str = None,
+                             groups: List[str] = None, level: str = LEVEL_FINE) -> List[Dict[str, Any]]:
+        """使用已生成的查询向量执行检索"""
+        return self._search_by_embeddings([query_embedding], top_k, keyword, groups, level)[0]
+    
+    def _search_by_embeddings(self, query_embeddings: List[List[float]], top_k: int = 5, keyword: str = None,
+                              groups: List[str] = None, level: str = LEVEL_FINE) -> List[List[Dict[str, Any]]]:
+        """多向量检索，每 settings.milvus_search_batch_size 个查询向量只需一次 search RPC
         
-        # 加载集合
-        collection.load()
+        指定 groups 时只检索这些分组的分区；集合包含 granularity 字段时按 level 过滤粒度。
+        """
+        manager = self.collection_manager
+        partition_names = None
+        if groups:
+            partition_names = [
+                name for name in dict.fromkeys(group_partition_name(group) for group in groups)
+                if name in manager.partitions
+            ]
+            if not partition_names:
+                return [[] for _ in query_embeddings]
         
         # 构建查询表达式
         expr_parts = []
         if keyword:
-            expr_parts.append(f"section_title LIKE '%{keyword}%'")
+            expr_parts.append(f"section_title LIKE {quote_literal(f'%{keyword}%')}")
+        if self._supports_granularity(manager):
+            expr_parts.append(f"granularity != {quote_literal(EXCLUDED_GRANULARITY[level])}")
         
         expr = " AND ".join(expr_parts) if expr_parts else None
         
-        # 执行搜索 - 混合检索
-        results = collection.search(
-            data=[query_embedding[0]],
-            anns_field="embedding",
-            param=self.search_params,
-            limit=top_k,
-            output_fields=['doc_id', 'section_title', 'summary', 'title_path'],
-            expr=expr  # 添加过滤条件
-        )
+        # 写入后的一段时间内使用强一致读，避免读到写入前的数据并以新代数写入缓存
+        search_kwargs = {}
+        if self.search_cache.seconds_since_bump() < settings.milvus_strong_consistency_seconds:
+            search_kwargs["consistency_level"] = "Strong"
         
-        # 处理搜索结果
         search_results = []
-        for hits in results:
-            for hit in hits:
-                search_results.append({
-                    'doc_id': hit.entity.get('doc_id'),
-                    'section_title': hit.entity.get('section_title'),
-                    'summary': hit.entity.get('summary'),
-                    'title_path': hit.entity.get('title_path'),
-                    'score': hit.score
-                })
+        batch_size = max(settings.milvus_search_batch_size, 1)
+        # 按需加载模式下分区按批检索，同时加载的分区数不超过上限，各批结果按分数合并
+        partition_batches = manager.partition_batches(partition_names)
+        for start in range(0, len(query_embeddings), batch_size):
+            batch = [list(map(float, embedding)) for embedding in query_embeddings[start:start + batch_size]]
+            batch_results = [[] for _ in batch]
+            for partitions in partition_batches:
+                # 执行搜索 - 混合检索
+                with manager.use_partitions(partitions):
+                    results = self._call(
+                        lambda collection: collection.search(
+                            data=batch,
+                            anns_field="embedding",
+                            param=self.search_params,
+                            limit=top_k,
+                            output_fields=['doc_id', 'section_title', 'summary', 'title_path'],
+                            expr=expr,  # 添加过滤条件
+                            partition_names=partitions,
+                            **search_kwargs
+                        ),
+                        manager=manager
+                    )
+                
+                # 处理搜索结果，每个查询向量对应一组命中
+                for index, hits in enumerate(results):
+                    batch_results[index].extend(
+                        {
+                            'doc_id': hit.entity.get('doc_id'),
+                            'section_title': hit.entity.get('section_title'),
+                            'summary': hit.entity.get('summary'),
+                            'title_path': hit.entity.get('title_path'),
+                            'score': hit.score
+                        }
+                        for hit in hits
+                    )
+            
+            if len(partition_batches) > 1:
+                batch_results = [sorted(hits, key=lambda hit: hit['score'], reverse=True)[:top_k]
+                                 for hits in batch_results]
+            search_results.extend(batch_results)
         
         return search_results
     
-    def get_reference_sections(self, section_title: str, section_content: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        """获取用于生成章节内容的参考章节
-        
-        根据输入的章节标题和内容，在知识库中搜索相似的章节，
-        结合标题关键词匹配和内容向量相似性，返回最相关的章节供参考。
-        
-        Args:
-            section_title: 要生成的章节标题
-            section_content: 要生成的章节内容（或大纲）
-            top_k: 返回参考章节数量
-            
-        Returns:
-            参考章节列表，包含 doc_id, section_title, summary, title_path, score 字段
-        """
-        # 提取标题中的关键词（这里简化处理，直接使用整个标题作为关键词）
-        # 更复杂的实现可以使用NLP工具提取关键词
-        title_keyword = section_title
-        
-        # 使用章节内容生成查询向量
-        query_text = f"{section_title} {section_content}"
-        
-        # 使用混合检索获取参考章节
-        reference_sections = self.search(query_text, top_k=top_k, keyword=title_keyword)
-        
-        print(f"为章节 '{section_title}' 找到 {len(reference_sections)} 个参考章节")
-        
-        return reference_sections
+    def _delete_documents(self, doc_ids: List[str]):
+        """批量删除文档，迁移期间同时从目标集合删除"""
+        with self._write_guard():
+            self._delete_from(self.collection_manager, doc_ids)
+            migration = self.migration
+            if migration is not None and migration.active:
+                migration.mirror_delete(doc_ids)
     
-    def delete_document(self, doc_id: str):
-        """删除指定 ID 的文档"""
-        if not self.enable_milvus:
-            return
-        
-        # 直接创建新的Collection实例并立即加载
-        collection = Collection(name=self.collection_name)
-        collection.load()  # 强制加载集合
-        print(f"集合 {self.collection_name} 已加载，准备删除文档")
-        
-        # 执行删除操作
-        collection.delete(f"doc_id == '{doc_id}'")
-        print(f"成功删除文档: {doc_id}")
-        
-        # 不需要卸载集合，保持加载状态
+    def upsert_document(self, doc_id: str, documents: List[Dict[str, Any]],
+                        progress_callback=None) -> Dict[str, Any]:
+        """增量更新文档；迁移期间按主键删除无法同步到目标集合，改为整篇替换"""
+        migration = self.migration
+        if migration is not None and migration.active:
+            deleted = len(self._document_chunks(doc_id))
+            self.delete_documents([doc_id])
+            result = self.add_documents([{**doc, 'doc_id': doc_id} for doc in documents], progress_callback)
+            return {**result, "added": len(documents), "deleted": deleted, "unchanged": 0}
+        return super().upsert_document(doc_id, documents, progress_callback)
+    
+    def _document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """文档已存储的全部分块（含主键 id）"""
+        return self._query(
+            lambda collection: collection.query(
+                expr=f"doc_id == {quote_literal(doc_id)}", output_fields=['id', *DEFAULT_FIELDS, *self._granularity_fields()],
+                limit=MAX_QUERY_LIMIT, consistency_level="Strong"
+            )
+        )
+    
+    def _delete_chunks(self, rows: List[Dict[str, Any]]):
+        """按主键分批删除部分分块"""
+        batch_size = max(settings.milvus_expr_batch_size, 1)
+        ids = [int(row['id']) for row in rows]
+        with self._write_guard():
+            for start in range(0, len(ids), batch_size):
+                expr = f"id in {ids[start:start + batch_size]}"
+                self._call(lambda collection: collection.delete(expr))
+    
+    def _delete_from(self, manager: MilvusCollectionManager, doc_ids: List[str]):
+        """从指定集合删除文档，每批 doc_id 只需一次删除 RPC"""
+        # 执行删除操作（集合已在连接时加载）
+        for _, expr in self._doc_id_batches(doc_ids):
+            self._call(lambda collection: collection.delete(expr), manager=manager)
+    
+    def _fetch_embeddings(self, doc_id: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """查询文档全部分块及其向量"""
+        rows = self._query(
+            lambda collection: collection.query(
+                expr=f"doc_id == {quote_literal(doc_id)}", output_fields=[*DEFAULT_FIELDS, 'embedding'], limit=MAX_QUERY_LIMIT
+            )
+        )
+        embeddings = np.asarray([row.pop('embedding') for row in rows], dtype=np.float32)
+        return [{field: row.get(field) for field in DEFAULT_FIELDS} for row in rows], embeddings
     
     def get_document_count(self) -> int:
         """获取知识库中文档数量"""
-        collection = Collection(name=self.collection_name)
-        collection.load()
-        return collection.num_entities
+        return self._call(lambda collection: collection.num_entities)
     
-    def get_document_by_id(self, doc_id: str, fields: List[str] = ['doc_id', 'section_title', 'summary', 'title_path']) -> Optional[Dict[str, Any]]:
+    def get_document_by_id(self, doc_id: str, fields: List[str] = DEFAULT_FIELDS) -> Optional[Dict[str, Any]]:
         """根据文档 ID 获取文档信息
         
         Args:
@@ -279,39 +458,259 @@ class MilvusKnowledgeBase:
         Returns:
             文档信息字典，如果不存在则返回 None
         """
-        collection = Collection(name=self.collection_name)
-        # 确保集合已加载
-        collection.load()
-        
         # 构建查询条件
-        expr = f"doc_id == '{doc_id}'"
+        expr = f"doc_id == {quote_literal(doc_id)}"
         
-        # 执行查询
-        results = collection.query(
-            expr=expr,
-            output_fields=fields
+        # 执行查询，只需要首个分块
+        results = self._query(
+            lambda collection: collection.query(expr=expr, output_fields=fields, limit=1)
         )
         
         if results and len(results) > 0:
             return results[0]
         return None
     
+    def get_documents_by_ids(self, doc_ids: List[str], fields: List[str] = DEFAULT_FIELDS) -> Dict[str, Dict[str, Any]]:
+        """批量获取文档信息
+        
+        每批 doc_id 使用一次 doc_id in [...] 查询。一个文档包含多个分块，
+        结果行数达到单次查询上限时，未命中的少数文档再逐个补查。
+        
+        Args:
+            doc_ids: 文档 ID 列表
+            fields: 需要返回的字段列表
+            
+        Returns:
+            doc_id -> 文档信息（首个分块），不存在的文档不出现在结果中
+        """
+        output_fields = list(fields) if 'doc_id' in fields else ['doc_id', *fields]
+        documents: Dict[str, Dict[str, Any]] = {}
+        for batch, expr in self._doc_id_batches(doc_ids):
+            rows = self._query(
+                lambda collection: collection.query(expr=expr, output_fields=output_fields, limit=MAX_QUERY_LIMIT)
+            )
+            for row in rows:
+                documents.setdefault(row['doc_id'], row)
+            if len(rows) >= MAX_QUERY_LIMIT:
+                for doc_id in batch:
+                    if doc_id not in documents:
+                        document = self.get_document_by_id(doc_id, output_fields)
+                        if document:
+                            documents[doc_id] = document
+        
+        if 'doc_id' not in fields:
+            documents = {
+                doc_id: {key: value for key, value in document.items() if key in fields}
+                for doc_id, document in documents.items()
+            }
+        return documents    
+    
+    def iter_documents(self, fields: List[str] = DEFAULT_FIELDS, batch_size: int = 1000,
+                       partition_names: List[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """使用查询迭代器分批遍历全部条目（或指定分区的条目）"""
+        manager = self.collection_manager
+        with manager.use_partitions(partition_names):
+            iterator = self._call(
+                lambda collection: collection.query_iterator(
+                    batch_size=batch_size, expr="id >= 0", output_fields=fields, partition_names=partition_names
+                ),
+                manager=manager
+            )
+            try:
+                while True:
+                    batch = iterator.next()
+                    if not batch:
+                        break
+                    yield batch
+            finally:
+                iterator.close()
+    
+    def _iter_dedup_rows(self) -> Iterator[List[Dict[str, Any]]]:
+        """去重作用域为分区，遍历时记录条目所在分区"""
+        return self._iter_partition_rows(DEFAULT_FIELDS + self._granularity_fields(), 1000)
+    
+    def _dedup_scope(self, document: Dict[str, Any]) -> str:
+        return document.get('partition') or group_partition_name(document.get('group'))
+    
+    def _iter_partition_rows(self, fields: List[str], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """逐个分区遍历条目，并记录条目所在分区（迁移时写入目标集合的同名分区）"""
+        for name in sorted(self.collection_manager.partitions):
+            for batch in self.iter_documents(fields, batch_size, partition_names=[name]):
+                yield [{**row, 'partition': name} for row in batch]
     
-    def clear_all_documents(self):
-        """清空知识库所有文档"""
-        collection = Collection(name=self.collection_name)
-        collection.drop()
-        print("删除集合成功")
+    def iter_embeddings(self, groups: List[str] = None,
+                        batch_size: int = 1000) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """逐个分区遍历条目及其向量，按分区名称还原条目所属分组（未知分区视为未分组）"""
+        partition_groups = {group_partition_name(group): group for group in groups or []}
+        fields = [*DEFAULT_FIELDS, *self._granularity_fields(), 'embedding']
+        for batch in self._iter_partition_rows(fields, batch_size):
+            embeddings = np.asarray([row.pop('embedding') for row in batch], dtype=np.float32)
+            for row in batch:
+                row['group'] = partition_groups.get(row.pop('partition'), '')
+            yield batch, embeddings
+    
+    def load_entries(self, documents: List[Dict[str, Any]], embeddings):
+        """写入一批已有向量的条目，切换集合期间等待切换完成"""
+        with self._write_guard():
+            super().load_entries(documents, embeddings)
+    
+    # ---------------- 分组分区 ----------------
+    def assign_groups(self, group_documents: Dict[str, List[str]]) -> int:
+        """把默认分区中已归属分组的文档移动到分组分区（分区功能之前导入的数据）
         
-        # 重新创建集合
-        self.create_collection()
+        Args:
+            group_documents: 分组名称 -> 文档ID列表
+            
+        Returns:
+            移动的条目数
+        """
+        migration = self.migration
+        if migration is not None and migration.active:
+            raise ValueError("集合迁移正在进行，请在迁移完成后再同步分组分区")
+        
+        moved = 0
+        moved_scopes: Dict[str, str] = {}
+        output_fields = ['id', *self._copy_fields(), 'embedding']
+        with self._write_guard():
+            manager = self.collection_manager
+            with manager.use_partitions([DEFAULT_PARTITION]):
+                for group, doc_ids in group_documents.items():
+                    for _, expr in self._doc_id_batches(doc_ids):
+                        while True:
+                            rows = self._call(
+                                lambda collection: collection.query(
+                                    expr=expr, output_fields=output_fields,
+                                    partition_names=[DEFAULT_PARTITION], limit=MAX_QUERY_LIMIT,
+                                    consistency_level="Strong"  # 下一轮查询不能再看到已移动的条目
+                                ),
+                                manager=manager
+                            )
+                            if not rows:
+                                break
+                            embeddings = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+                            self._insert_into(manager, [{**row, 'group': group} for row in rows], embeddings)
+                            ids = [int(row['id']) for row in rows]
+                            self._call(
+                                lambda collection: collection.delete(f"id in {ids}", partition_name=DEFAULT_PARTITION),
+                                manager=manager
+                            )
+                            moved += len(rows)
+                            moved_scopes.update((row['doc_id'], group_partition_name(group)) for row in rows)
+                            if len(rows) < MAX_QUERY_LIMIT:
+                                break
+        if moved:
+            self.search_cache.bump()
+            self.dedup_index.reset()
+            self.lexical_index.set_scopes(moved_scopes)
+            print(f"已将 {moved} 个条目移动到分组分区")
+        return moved
+    
+    def drop_group(self, group: str):
+        """删除分组对应的分区（分组文档已删除后调用）"""
+        name = group_partition_name(group)
+        if name == DEFAULT_PARTITION:
+            return
+        with self._write_guard():
+            if name in self.collection_manager.partitions:
+                self.collection_manager.drop_partition(name)
+                self.search_cache.bump()
+    
+    def _clear_all_documents(self):
+        """清空知识库所有文档，进行中的迁移随之取消"""
+        self.cancel_migration()
+        with self._write_guard():
+            self._call(lambda collection: collection.drop())
+            print("删除集合成功")
+            
+            # 重新创建集合、索引并加载
+            self.collection_manager.reset()
+    
+    # ---------------- 集合迁移 ----------------
+    def migration_status(self) -> Optional[Dict[str, Any]]:
+        """当前（或最近一次）迁移的进度"""
+        if self.migration is None:
+            if self._matches_target(self.active_info):
+                return None
+            return {"state": "pending", "source": self.active_info, "target": self.target_info}
+        return self.migration.status()
+    
+    def start_migration(self, batch_size: int = None, rows_per_second: float = None) -> Dict[str, Any]:
+        """开始把服务集合重新嵌入到配置的嵌入模型对应的目标集合
         
-        # 加载重新创建的集合
-        collection = Collection(name=self.collection_name)
-        collection.load()
-        print(f"集合 {self.collection_name} 已加载")
-        print("成功清空知识库")
-
-
-# 创建全局知识库实例
-knowledge_base = MilvusKnowledgeBase()
\ No newline at end of file
+        目标集合中上次未完成迁移留下的数据会先被删除。迁移期间旧集合继续提供
+        服务，新增和删除同时作用于两个集合。
+        
+        Args:
+            batch_size: 每批读取并重新嵌入的条目数
+            rows_per_second: 限速（行/秒），0 表示不限速
+            
+        Raises:
+            ValueError: 服务集合已与嵌入模型一致，或迁移正在进行
+        """
+        with self._migration_lock:
+            if self.migration is not None and self.migration.active:
+                raise ValueError("集合迁移正在进行")
+            if self._matches_target(self.active_info):
+                raise ValueError("当前集合已与嵌入模型一致，无需迁移")
+            
+            target_info = self.target_info
+            connections.connect(alias=MIGRATION_ALIAS, uri=self.milvus_uri)
+            if utility.has_collection(target_info["name"], using=MIGRATION_ALIAS):
+                utility.drop_collection(target_info["name"], using=MIGRATION_ALIAS)
+                print(f"删除未完成迁移的目标集合: {target_info['name']}")
+            target_manager = self._create_manager(target_info, alias=MIGRATION_ALIAS)
+            target_manager.start()
+            if not target_manager.is_ready:
+                target_manager.stop()
+                raise RuntimeError(f"创建目标集合失败: {target_manager.last_error}")
+            
+            self.migration = CollectionMigration(
+                source=self.active_info,
+                target=target_info,
+                read_batches=lambda size: self._iter_partition_rows(self._copy_fields(), size),
+                source_count=self.get_document_count,
+                embed=lambda texts: encode_pooled(self.target_service.encode, texts),
+                insert=lambda documents, embeddings: self._insert_into(target_manager, documents, embeddings),
+                delete=lambda doc_ids: self._delete_from(target_manager, doc_ids),
+                on_complete=lambda: self._switch_collection(target_manager, target_info),
+                on_abort=target_manager.stop,
+                batch_size=batch_size,
+                rows_per_second=rows_per_second
+            )
+            self.migration.start()
+            return self.migration.status()
+    
+    def cancel_migration(self) -> Optional[Dict[str, Any]]:
+        """取消进行中的迁移，旧集合继续提供服务"""
+        migration = self.migration
+        if migration is not None and migration.active:
+            migration.cancel()
+        return self.migration_status()
+    
+    def _switch_collection(self, target_manager: MilvusCollectionManager, target_info: Dict[str, Any]):
+        """原子切换服务集合：等待进行中的写入完成后替换集合句柄和嵌入服务"""
+        with self._writes:
+            self._switching = True
+            self._writes.wait_for(lambda: self._active_writes == 0)
+            previous_manager, previous_info = self.collection_manager, self.active_info
+            try:
+                self.collection_manager = target_manager
+                self.embedding_service = self.target_service
+                self.active_info = target_info
+                self.collection_name = target_info["name"]
+            finally:
+                self._switching = False
+                self._writes.notify_all()
+        
+        previous_manager.stop()
+        self.search_cache.bump()
+        try:
+            self.registry.save_active(target_info, previous=previous_info)
+        except Exception as e:
+            print(f"保存集合注册表失败: {e}")
+        if not settings.milvus_keep_old_collection:
+            try:
+                utility.drop_collection(previous_info["name"], using=previous_manager.alias)
+                print(f"删除旧集合: {previous_info['name']}")
+            except Exception as e:
+                print(f"删除旧集合失败: {e}")
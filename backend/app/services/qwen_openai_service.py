@@ -76,11 +76,56 @@ class OpenAIService:
         if not isinstance(outline, dict) or "outline" not in outline:
             raise Exception("无效的outline数据格式")
         result_outline = copy.deepcopy(outline)
-        await self._process_outline_recursive(result_outline["outline"], [], project_overview)
+        # 一次批量检索全部叶子章节的参考资料
+        references = await self._prefetch_references(result_outline["outline"], project_overview)
+        await self._process_outline_recursive(result_outline["outline"], [], project_overview, references)
         return result_outline
 
+    # ---------------- 知识库参考资料 ----------------
+    @staticmethod
+    def _reference_query(chapter: dict, project_overview: str = "") -> str:
+        """章节的知识库检索文本"""
+        return f"{chapter.get('title', '未命名章节')} {chapter.get('description', '')} {project_overview[:500]}"
+
+    @staticmethod
+    def _leaf_chapters(chapters: list) -> list:
+        leaves = []
+        for chapter in chapters:
+            if chapter.get("children"):
+                leaves.extend(OpenAIService._leaf_chapters(chapter["children"]))
+            else:
+                leaves.append(chapter)
+        return leaves
+
+    async def _prefetch_references(self, chapters: list, project_overview: str = "") -> Dict[str, list]:
+        """批量检索提纲全部叶子章节的参考资料候选
+
+        所有章节的检索文本在一次 encode 中生成嵌入，再以多向量检索提交，
+        返回 章节ID -> 候选列表，供各章节生成时读取。知识库未就绪或检索失败时
+        返回空字典，章节生成时再各自检索（或跳过）。
+        """
+        from ..services.knowledge_base_async import async_knowledge_base
+        from ..services.reranker_service import reranker_service
+        from ..services.warmup import warmup_manager
+        from ..config import settings
+
+        leaves = [chapter for chapter in self._leaf_chapters(chapters) if "id" in chapter]
+        if not leaves or not warmup_manager.ready_or_warm("knowledge_base", "embedding_model"):
+            return {}
+        top_k = settings.reranker_candidates if reranker_service.available else settings.kb_reference_candidates
+        try:
+            results = await async_knowledge_base.batch_search(
+                [self._reference_query(chapter, project_overview) for chapter in leaves], top_k=top_k
+            )
+        except Exception as e:
+            print(f"批量检索知识库失败: {str(e)}")
+            return {}
+        print(f"批量检索 {len(leaves)} 个章节的知识库参考内容")
+        return {chapter["id"]: result for chapter, result in zip(leaves, results)}
+
     async def _process_outline_recursive(
-            self, chapters: list, parent_chapters: list = None, project_overview: str = ""
+            self, chapters: list, parent_chapters: list = None, project_overview: str = "",
+            references: Dict[str, list] = None
     ):
         for chapter in chapters:
             chapter_id = chapter.get("id", "unknown")
@@ -92,13 +137,16 @@ class OpenAIService:
             if is_leaf:
                 content = ""
                 async for ck in self._generate_chapter_content(
-                        chapter, current_parent_chapters[:-1], chapters, project_overview
+                        chapter, current_parent_chapters[:-1], chapters, project_overview,
+                        reference_candidates=(references or {}).get(chapter_id)
                 ):
                     content += ck
                 if content:
                     chapter["content"] = content
             else:
-                await self._process_outline_recursive(chapter["children"], current_parent_chapters, project_overview)
+                await self._process_outline_recursive(
+                    chapter["children"], current_parent_chapters, project_overview, references
+                )
 
     async def _generate_chapter_content(
             self,
@@ -107,7 +155,13 @@ class OpenAIService:
             sibling_chapters: list = None,
             project_overview: str = "",
             prompt: str = None,
+            reference_candidates: list = None,
     ) -> AsyncGenerator[str, None]:
+        """生成章节内容
+
+        reference_candidates 为批量预取的知识库候选（见 _prefetch_references），
+        未提供时单独检索。
+        """
         try:
             chapter_id = chapter.get("id", "unknown")
             chapter_title = chapter.get("title", "未命名章节")
@@ -124,20 +178,43 @@ class OpenAIService:
 7. 可以参考知识库中的相关内容，但要确保生成的内容符合当前章节的需求，不要直接复制知识库内容
 """
 
-            # 搜索知识库获取相关参考资料
+            # 搜索知识库获取相关参考资料，MMR 去冗余后按 token 预算打包
             knowledge_base_content = ""
             try:
-                from ..services.milvus_service import knowledge_base
-                search_query = f"{chapter_title} {chapter_description} {project_overview[:500]}"
-                search_results = knowledge_base.search(search_query, top_k=3)
-                
+                from ..services.knowledge_base_async import async_knowledge_base
+                from ..services.reranker_service import reranker_service
+                from ..services.reference_packer import reference_packer
+                from ..services.warmup import warmup_manager
+                from ..config import settings
+                search_query = self._reference_query(chapter, project_overview)
+                if reference_candidates is not None:
+                    # 使用批量预取的候选，重排序可用时仍按本章节重排序
+                    if reranker_service.available:
+                        search_results = await reranker_service.rerank_async(
+                            search_query, reference_candidates, top_k=settings.kb_reference_candidates
+                        )
+                    else:
+                        search_results = reference_candidates[:settings.kb_reference_candidates]
+                elif not warmup_manager.ready_or_warm("knowledge_base", "embedding_model"):
+                    # 知识库仍在初始化，本章节不使用参考内容，避免阻塞生成
+                    print("知识库尚未就绪，跳过知识库参考内容")
+                    search_results = []
+                elif reranker_service.available:
+                    # 多召回候选，由交叉编码器重排序后参与打包
+                    candidates = await async_knowledge_base.search(search_query, top_k=settings.reranker_candidates)
+                    search_results = await reranker_service.rerank_async(
+                        search_query, candidates, top_k=settings.kb_reference_candidates
+                    )
+                else:
+                    search_results = await async_knowledge_base.search(
+                        search_query, top_k=settings.kb_reference_candidates
+                    )
+
                 if search_results:
-                    knowledge_base_content = "知识库参考内容：\n"
-                    for i, result in enumerate(search_results):
-                        print(result)
-                        knowledge_base_content += f"参考{i+1} (相关性: {result['score']:.2f})：\n"
-                        knowledge_base_content += f"标题: {result['title']}\n"
-                        knowledge_base_content += f"内容: {result['content'][:500]}...\n\n"
+                    packed = await reference_packer.pack_async(search_query, search_results)
+                    knowledge_base_content = packed["text"]
+                    print(f"章节 {chapter_id} 参考内容: 候选 {packed['candidates']}，选取 {len(packed['references'])}，"
+                          f"冗余 {packed['redundant']}，约 {packed['tokens']}/{packed['budget']} tokens")
             except Exception as e:
                 # 如果知识库搜索失败，继续生成内容
                 print(f"知识库搜索失败: {str(e)}")
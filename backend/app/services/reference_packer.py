@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""参考资料打包 - MMR 去冗余并按 token 预算选取知识库检索结果"""
+
+import threading
+from collections import deque
+from typing import List, Dict, Any
+
+import numpy as np
+
+from ..config import settings
+from ..utils.chunk_util import estimate_tokens
+
+REFERENCE_HEADER = "知识库参考内容：\n"
+
+
+def format_reference(index: int, reference: Dict[str, Any]) -> str:
+    """单条参考内容在提示词中的文本"""
+    title = reference.get("title_path") or reference.get("section_title") or ""
+    return (f"参考{index} (相关性: {reference.get('relevance', reference.get('score', 0.0)):.2f})：\n"
+            f"标题: {title}\n"
+            f"内容: {reference.get('summary') or ''}\n\n")
+
+
+class ReferencePacker:
+    """参考资料打包
+
+    对检索候选按最大边际相关性（MMR）逐个挑选：每一步选取
+    λ·相关性 − (1−λ)·与已选条目的最大相似度 最高的候选，与已选条目过于相似
+    （超过 redundancy_threshold）的候选直接丢弃；放不进剩余 token 预算的候选
+    跳过，继续尝试后面的候选，直到预算用完或达到条目上限。
+
+    候选的向量使用知识库中已存储的向量，只有找不到对应条目的候选才重新编码。
+    相关性优先使用重排序分数（归一化到 0~1），否则使用与查询向量的余弦相似度。
+    """
+
+    def __init__(self, token_budget: int = None, mmr_lambda: float = None,
+                 redundancy_threshold: float = None, max_references: int = None):
+        self.token_budget = token_budget or settings.kb_reference_token_budget
+        self.mmr_lambda = settings.kb_reference_mmr_lambda if mmr_lambda is None else mmr_lambda
+        self.redundancy_threshold = (settings.kb_reference_redundancy_threshold
+                                     if redundancy_threshold is None else redundancy_threshold)
+        self.max_references = max_references or settings.kb_reference_max_items
+
+        self._stats_lock = threading.Lock()
+        self._packed = 0
+        self._recent_tokens = deque(maxlen=1000)
+        self._recent_selected = deque(maxlen=1000)
+        self._redundant = 0
+
+    def pack(self, query_embedding, candidates: List[Dict[str, Any]], candidate_embeddings) -> Dict[str, Any]:
+        """按 MMR 与 token 预算选取参考内容
+
+        Args:
+            query_embedding: 查询向量
+            candidates: 检索（或重排序）候选，包含 section_title, summary, title_path, score 字段
+            candidate_embeddings: 与 candidates 一一对应的向量矩阵
+
+        Returns:
+            references（选中的候选，附 relevance 字段，按选取顺序）、text（提示词文本）、
+            tokens（估算的 token 数）、budget、candidates、redundant（因冗余丢弃的候选数）
+        """
+        result = {"references": [], "text": "", "tokens": 0, "budget": self.token_budget,
+                  "candidates": len(candidates), "redundant": 0}
+        keep = [i for i, candidate in enumerate(candidates) if str(candidate.get("summary") or "").strip()]
+        if keep:
+            self._select(query_embedding, [candidates[i] for i in keep],
+                         np.asarray(candidate_embeddings, dtype=np.float32)[keep], result)
+        with self._stats_lock:
+            self._packed += 1
+            self._recent_tokens.append(result["tokens"])
+            self._recent_selected.append(len(result["references"]))
+            self._redundant += result["redundant"]
+        return result
+
+    def _select(self, query_embedding, candidates: List[Dict[str, Any]], vectors: np.ndarray, result: Dict[str, Any]):
+        """MMR 选取，选中的条目与文本写入 result"""
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        relevance = self._relevance(candidates, vectors @ query)
+        similarity = vectors @ vectors.T
+
+        remaining = self.token_budget - estimate_tokens(REFERENCE_HEADER)
+        pending = list(range(len(candidates)))
+        selected: List[int] = []
+        max_similarity = np.full(len(candidates), -1.0, dtype=np.float32)
+        text = REFERENCE_HEADER
+        while pending and len(selected) < self.max_references:
+            scores = [self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * max(max_similarity[i], 0.0)
+                      for i in pending]
+            best = pending.pop(int(np.argmax(scores)))
+            if selected and max_similarity[best] >= self.redundancy_threshold:
+                result["redundant"] += 1
+                continue
+            reference = {**candidates[best], "relevance": round(float(relevance[best]), 4)}
+            passage = format_reference(len(selected) + 1, reference)
+            cost = estimate_tokens(passage)
+            if cost > remaining:
+                continue
+            remaining -= cost
+            text += passage
+            selected.append(best)
+            result["references"].append(reference)
+            max_similarity = np.maximum(max_similarity, similarity[best])
+
+        if selected:
+            result["text"] = text
+            result["tokens"] = self.token_budget - remaining
+
+    @staticmethod
+    def _relevance(candidates: List[Dict[str, Any]], cosine: np.ndarray) -> np.ndarray:
+        """候选相关性：全部带重排序分数时按重排序分数归一化，否则为余弦相似度"""
+        if all("rerank_score" in candidate for candidate in candidates):
+            scores = np.asarray([candidate["rerank_score"] for candidate in candidates], dtype=np.float32)
+            spread = float(scores.max() - scores.min())
+            return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        return cosine
+
+    async def pack_async(self, query: str, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """获取查询向量与候选的已存储向量后打包（已存储向量缺失的候选才重新编码）"""
+        if not candidates:
+            return self.pack([], [], [])
+        from .knowledge_base_async import async_knowledge_base
+        query_embedding, candidate_embeddings = await async_knowledge_base.reference_embeddings(query, candidates)
+        return self.pack(query_embedding, candidates, candidate_embeddings)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回打包统计信息"""
+        with self._stats_lock:
+            tokens = list(self._recent_tokens)
+            selected = list(self._recent_selected)
+            return {
+                "token_budget": self.token_budget,
+                "mmr_lambda": self.mmr_lambda,
+                "packed": self._packed,
+                "redundant_dropped": self._redundant,
+                "tokens_avg": round(sum(tokens) / len(tokens), 1) if tokens else 0,
+                "references_avg": round(sum(selected) / len(selected), 2) if selected else 0,
+            }
+
+
+# 全局参考资料打包实例
+reference_packer = ReferencePacker()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""重排序服务 - 使用 CPU 交叉编码器对检索候选重新打分"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional
+
+# 设置Hugging Face国内镜像地址
+os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
+
+from ..config import settings
+
+
+class RerankerService:
+    """交叉编码器重排序服务
+
+    检索阶段多召回一些候选（settings.reranker_candidates），这里按批把
+    (查询, 候选正文) 对送入交叉编码器打分，截取前 top_k 个。打分在专用
+    线程中执行，每批之间检查截止时间；超过单次查询的时间预算时放弃打分，
+    直接按原检索顺序返回前 top_k 个候选。
+
+    模型在预热时或后台线程中加载，不占用查询的时间预算：模型尚未加载时
+    本次查询按检索顺序返回，同时开始后台加载。只有模型加载失败才会停用重排序，
+    单次打分出错只回退当次查询。
+    """
+
+    def __init__(self, model_name: str = None, enabled: bool = None, batch_size: int = None,
+                 budget_ms: float = None, max_length: int = None):
+        self.model_name = model_name or settings.reranker_model_name
+        self.enabled = settings.reranker_enabled if enabled is None else enabled
+        self.batch_size = batch_size or settings.reranker_batch_size
+        self.budget_ms = settings.reranker_budget_ms if budget_ms is None else budget_ms
+        self.max_length = max_length or settings.reranker_max_length
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._loading: Optional[threading.Thread] = None
+        self.load_error: Optional[str] = None
+        # 单线程执行，避免多个查询同时占满 CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self._reranked = 0
+        self._fallbacks = 0
+        self._recent_latencies = deque(maxlen=1000)
+
+    # ---------------- 模型 ----------------
+    def _load_model(self):
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+
+    @property
+    def model(self):
+        """交叉编码器（首次使用时加载，加载失败时记录 load_error 并停用重排序）"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    try:
+                        self._model = self._load_model()
+                    except Exception as e:
+                        self.load_error = str(e)
+                        print(f"重排序模型加载失败，使用检索顺序: {e}")
+                        raise
+                    self.load_error = None
+                    print(f"重排序模型已加载: {self.model_name}")
+        return self._model
+
+    def start_loading(self) -> bool:
+        """在后台线程中加载模型，已加载返回 True"""
+        if self._model is not None:
+            return True
+        with self._model_lock:
+            if self._loading is None or not self._loading.is_alive():
+                self._loading = threading.Thread(target=self._load_in_background, name="reranker-load", daemon=True)
+                self._loading.start()
+        return False
+
+    def _load_in_background(self):
+        try:
+            self.model
+        except Exception:
+            pass  # 已记录到 load_error
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def available(self) -> bool:
+        """已启用且模型未加载失败"""
+        return self.enabled and self.load_error is None
+
+    # ---------------- 重排序 ----------------
+    def _score(self, query: str, candidates: List[Dict[str, Any]], deadline: float) -> Optional[List[float]]:
+        """分批打分，超过截止时间返回 None"""
+        model = self.model
+        scores: List[float] = []
+        for start in range(0, len(candidates), self.batch_size):
+            if time.perf_counter() > deadline:
+                return None
+            batch = candidates[start:start + self.batch_size]
+            pairs = [
+                (query, f"{candidate.get('section_title', '')}\n{candidate.get('summary', '')}")
+                for candidate in batch
+            ]
+            scores.extend(float(score) for score in model.predict(pairs, batch_size=self.batch_size))
+        return scores
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], top_k: int = 3,
+               budget_ms: float = None) -> List[Dict[str, Any]]:
+        """对候选重新排序并截取前 top_k 个
+
+        Args:
+            query: 查询文本
+            candidates: 检索返回的候选列表（按检索分数排序）
+            top_k: 返回结果数量
+            budget_ms: 时间预算（毫秒），默认使用 settings.reranker_budget_ms
+
+        Returns:
+            重排序后的结果，包含 rerank_score 字段；未启用、模型不可用或超出预算时
+            返回按原顺序截取的前 top_k 个候选
+        """
+        if not self.available or len(candidates) <= 1:
+            return candidates[:top_k]
+        if not self.start_loading():
+            # 模型加载不计入查询的时间预算，加载完成前使用检索顺序
+            self._record(0.0, False)
+            return candidates[:top_k]
+
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        started_at = time.perf_counter()
+        future = self._executor.submit(self._score, query, candidates, started_at + budget)
+        try:
+            scores = future.result(timeout=budget)
+            if scores is None:
+                print("重排序超出时间预算，使用检索顺序")
+        except FutureTimeoutError:
+            scores = None
+            print(f"重排序超出时间预算 ({budget * 1000:.0f}ms)，使用检索顺序")
+        except Exception as e:
+            # 打分失败只回退本次查询，不停用重排序
+            print(f"重排序打分失败，使用检索顺序: {e}")
+            scores = None
+
+        latency_ms = (time.perf_counter() - started_at) * 1000
+        self._record(latency_ms, scores is not None)
+        if scores is None:
+            return candidates[:top_k]
+
+        ranked = sorted(zip(scores, range(len(candidates))), key=lambda item: item[0], reverse=True)
+        return [{**candidates[index], "rerank_score": score} for score, index in ranked[:top_k]]
+
+    async def rerank_async(self, query: str, candidates: List[Dict[str, Any]], top_k: int = 3,
+                           budget_ms: float = None) -> List[Dict[str, Any]]:
+        """异步重排序，等待期间不阻塞事件循环。参数与返回值同 rerank"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.rerank, query, candidates, top_k, budget_ms)
+
+    # ---------------- 统计 ----------------
+    def _record(self, latency_ms: float, succeeded: bool):
+        with self._stats_lock:
+            if succeeded:
+                self._reranked += 1
+            else:
+                self._fallbacks += 1
+            self._recent_latencies.append(latency_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回重排序统计信息"""
+        with self._stats_lock:
+            latencies = sorted(self._recent_latencies)
+            return {
+                "enabled": self.enabled,
+                "model_name": self.model_name,
+                "load_error": self.load_error,
+                "budget_ms": self.budget_ms,
+                "reranked": self._reranked,
+                "fallbacks": self._fallbacks,
+                "latency_ms_p50": round(latencies[len(latencies) // 2], 3) if latencies else 0,
+                "latency_ms_max": round(latencies[-1], 3) if latencies else 0,
+            }
+
+
+# 创建全局重排序服务实例（模型在预热或首次重排序时于后台加载）
+reranker_service = RerankerService()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""检索结果缓存 - 按集合代数失效的 LRU + TTL 缓存"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+
+class _CacheEntry:
+    __slots__ = ("results", "generation", "expires_at", "latency_ms")
+
+    def __init__(self, results: List[Dict[str, Any]], generation: int, expires_at: float, latency_ms: float):
+        self.results = results
+        self.generation = generation
+        self.expires_at = expires_at
+        self.latency_ms = latency_ms
+
+
+class SearchCache:
+    """向量检索结果缓存
+
+    键为 (查询向量摘要, top_k, 过滤表达式, 分组)。知识库维护一个集合代数，
+    add_documents / delete_document / clear_all_documents 完成写入后递增代数。
+    检索开始前读取代数，结果按该代数写入缓存；命中时代数与当前不一致的条目
+    视为过期并丢弃，因此写入之后不会返回写入之前的结果。条目另有 TTL，
+    超出 max_entries 时淘汰最久未使用的条目。
+
+    指定 generation_file 时代数在进程间共享：递增代数即向该文件追加一个字节，
+    代数为文件长度，每次查询读取，其他 worker 的写入同样使本进程的缓存失效。
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, enabled: bool = None,
+                 generation_file: str = None):
+        self.max_entries = max_entries or settings.search_cache_max_entries
+        self.ttl_seconds = settings.search_cache_ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.enabled = settings.search_cache_enabled if enabled is None else enabled
+
+        self.generation_file = generation_file
+        if generation_file:
+            os.makedirs(os.path.dirname(generation_file) or ".", exist_ok=True)
+        self._generation = 0
+        self._bumped_at = 0.0
+        self._entries: "OrderedDict[Tuple, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+        self.saved_ms = 0.0
+
+    # ---------------- 键与代数 ----------------
+    @staticmethod
+    def make_key(query_embedding, top_k: int, filter_expr: Optional[str] = None,
+                 groups: Optional[List[str]] = None, level: str = "") -> Tuple:
+        """生成缓存键，查询向量按 float32 字节取摘要，level 为检索粒度"""
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        digest = hashlib.sha1(vector.tobytes()).digest()
+        return digest, int(top_k), filter_expr or "", tuple(sorted(set(groups or ()))), level or ""
+
+    def _state(self) -> Tuple[int, float]:
+        """当前代数及最近一次递增的时间"""
+        if not self.generation_file:
+            return self._generation, self._bumped_at
+        try:
+            stat = os.stat(self.generation_file)
+        except FileNotFoundError:
+            return 0, 0.0
+        return stat.st_size, stat.st_mtime
+
+    @property
+    def generation(self) -> int:
+        return self._state()[0]
+
+    def seconds_since_bump(self) -> float:
+        """距最近一次写入（任一进程）的秒数，用于判断检索是否需要强一致读"""
+        return time.time() - self._state()[1]
+
+    def bump(self):
+        """集合内容变化后递增代数，之前缓存的结果全部失效"""
+        with self._lock:
+            if self.generation_file:
+                with open(self.generation_file, 'ab') as f:
+                    f.write(b'.')
+            else:
+                self._generation += 1
+                self._bumped_at = time.time()
+            self._entries.clear()
+
+    # ---------------- 读写接口 ----------------
+    def get(self, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        """查询缓存，未命中、过期或代数不一致时返回 None"""
+        if not self.enabled:
+            return None
+        generation = self.generation
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.generation != generation:
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += entry.latency_ms
+            return [dict(hit) for hit in entry.results]
+
+    def put(self, key: Tuple, results: List[Dict[str, Any]], generation: int, latency_ms: float):
+        """写入检索结果
+
+        Args:
+            key: make_key 生成的键
+            results: 检索结果
+            generation: 检索开始前读取的代数，检索期间发生写入时结果不会被缓存
+            latency_ms: 本次检索耗时，命中时计入节省的时间
+        """
+        if not self.enabled:
+            return
+        current = self.generation
+        with self._lock:
+            if generation != current:
+                return
+            self._entries[key] = _CacheEntry(
+                [dict(hit) for hit in results], generation, time.monotonic() + self.ttl_seconds, latency_ms
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # ---------------- 统计 ----------------
+    def stats(self) -> Dict[str, Any]:
+        generation = self.generation
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "generation": generation,
+                "shared": bool(self.generation_file),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "saved_ms": round(self.saved_ms, 1),
+            }
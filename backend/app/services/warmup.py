@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""知识库组件预热与就绪状态"""
+
+import time
+import asyncio
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
+
+from .knowledge_base import knowledge_base
+from .embedding_service import embedding_service
+from .reranker_service import reranker_service
+
+
+class WarmupComponent:
+    """一个需要预热的组件"""
+
+    STATE_PENDING = "pending"
+    STATE_WARMING = "warming"
+    STATE_READY = "ready"
+    STATE_FAILED = "failed"
+    STATE_DISABLED = "disabled"
+    # 未启用启动预热且尚未被使用，首次使用时初始化，不影响就绪状态
+    STATE_LAZY = "lazy"
+
+    def __init__(self, name: str, warm: Callable[[], None], probe: Callable[[], bool], enabled: bool = True):
+        self.name = name
+        self.warm = warm
+        self.probe = probe
+        self.enabled = enabled
+        self.state = self.STATE_PENDING if enabled else self.STATE_DISABLED
+        self.error: Optional[str] = None
+        self.started_at: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self.done = threading.Event()
+
+    def refresh(self):
+        """组件可能在预热之外被按需初始化，以实际状态为准"""
+        if self.state in (self.STATE_PENDING, self.STATE_FAILED) and self.probe():
+            self.state = self.STATE_READY
+            self.error = None
+            self.done.set()
+
+    def status(self, lazy: bool = False) -> Dict[str, Any]:
+        self.refresh()
+        return {
+            "state": self.STATE_LAZY if lazy and self.state == self.STATE_PENDING else self.state,
+            "error": self.error,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+        }
+
+
+class WarmupManager:
+    """知识库组件预热管理器
+
+    组件（知识库后端、嵌入模型、词法索引、重排序模型）默认在首次使用时初始化。
+    settings.kb_warmup_on_startup 为 True 时，应用启动后在后台线程中依次预热，
+    服务可以立即处理与知识库无关的请求。知识库调用方通过 wait / wait_async
+    等待组件就绪（必要时触发初始化），或通过 is_ready 判断后降级处理。
+    """
+
+    def __init__(self):
+        self.components: Dict[str, WarmupComponent] = {}
+        self._lock = threading.Lock()
+        # 是否已启动全量预热；未启动时尚未使用的组件按需初始化，不阻塞就绪检查
+        self.started = False
+
+    def register(self, name: str, warm: Callable[[], None], probe: Callable[[], bool], enabled: bool = True):
+        self.components[name] = WarmupComponent(name, warm, probe, enabled)
+
+    # ---------------- 预热 ----------------
+    def _run(self, component: WarmupComponent):
+        started_at = time.perf_counter()
+        try:
+            component.warm()
+            component.state = WarmupComponent.STATE_READY
+            component.error = None
+        except Exception as e:
+            component.state = WarmupComponent.STATE_FAILED
+            component.error = str(e)
+            print(f"组件预热失败 {component.name}: {e}")
+        component.duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        component.done.set()
+        if component.state == WarmupComponent.STATE_READY:
+            print(f"组件已就绪 {component.name}，耗时 {component.duration_ms:.0f}ms")
+
+    def _claim(self, component: WarmupComponent) -> bool:
+        """将组件标记为预热中，已在预热或已就绪时返回 False"""
+        with self._lock:
+            component.refresh()
+            if component.state not in (WarmupComponent.STATE_PENDING, WarmupComponent.STATE_FAILED):
+                return False
+            component.state = WarmupComponent.STATE_WARMING
+            component.started_at = datetime.now().isoformat()
+            component.done.clear()
+            return True
+
+    def start(self):
+        """在后台线程中依次预热所有启用的组件"""
+        def run_all():
+            for component in self.components.values():
+                if component.enabled and self._claim(component):
+                    self._run(component)
+
+        self.started = True
+        threading.Thread(target=run_all, name="kb-warmup", daemon=True).start()
+
+    def ensure(self, name: str):
+        """组件未初始化时在后台线程中开始初始化"""
+        component = self.components[name]
+        if component.enabled and self._claim(component):
+            threading.Thread(target=self._run, args=(component,), name=f"kb-warmup-{name}", daemon=True).start()
+
+    # ---------------- 就绪状态 ----------------
+    def is_ready(self, *names: str) -> bool:
+        """指定组件是否均已就绪（未启用的组件视为就绪）"""
+        for name in names:
+            component = self.components[name]
+            component.refresh()
+            if component.state not in (WarmupComponent.STATE_READY, WarmupComponent.STATE_DISABLED):
+                return False
+        return True
+
+    def ready_or_warm(self, *names: str) -> bool:
+        """组件均已就绪返回 True；否则触发未初始化组件的预热并返回 False，供调用方降级"""
+        if self.is_ready(*names):
+            return True
+        for name in names:
+            self.ensure(name)
+        return False
+
+    def wait(self, name: str, timeout: float = None) -> bool:
+        """等待组件就绪（必要时触发初始化），超时或失败返回 False"""
+        component = self.components[name]
+        if not component.enabled:
+            return True
+        self.ensure(name)
+        component.done.wait(timeout)
+        return self.is_ready(name)
+
+    async def wait_async(self, name: str, timeout: float = None) -> bool:
+        """异步等待组件就绪，等待期间不阻塞事件循环"""
+        if self.is_ready(name):
+            return True
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.wait, name, timeout)
+
+    def status(self) -> Dict[str, Any]:
+        components = {name: component.status(lazy=not self.started) for name, component in self.components.items()}
+        return {
+            "ready": all(item["state"] in (WarmupComponent.STATE_READY, WarmupComponent.STATE_DISABLED,
+                                           WarmupComponent.STATE_LAZY)
+                         for item in components.values()),
+            "warmup_on_startup": self.started,
+            "components": components,
+        }
+
+
+def _warm_embedding_model():
+    embedding_service.encode(["预热"])
+
+
+def _warm_lexical_index():
+    knowledge_base.ensure_lexical_index(wait=True)
+    if not knowledge_base.lexical_index.is_ready:
+        raise RuntimeError(knowledge_base.lexical_index.last_error or "词法索引构建失败")
+
+
+# 创建全局预热管理器，按依赖顺序注册组件
+warmup_manager = WarmupManager()
+warmup_manager.register(
+    "knowledge_base",
+    warm=knowledge_base.get,
+    probe=lambda: knowledge_base.is_initialized
+)
+warmup_manager.register(
+    "embedding_model",
+    warm=_warm_embedding_model,
+    probe=lambda: embedding_service.is_loaded
+)
+warmup_manager.register(
+    "lexical_index",
+    warm=_warm_lexical_index,
+    probe=lambda: knowledge_base.is_initialized and knowledge_base.lexical_index.is_ready
+)
+warmup_manager.register(
+    "reranker",
+    warm=lambda: reranker_service.model,
+    probe=lambda: reranker_service.is_loaded,
+    enabled=reranker_service.enabled
+)
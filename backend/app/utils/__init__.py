@@ -5,6 +5,7 @@ from .json_util import check_json
 from .outline_util import get_random_indexes, calculate_nodes_distribution, generate_one_outline_json_by_level1
 from .prompt_manager import read_expand_outline_prompt, generate_outline_prompt, generate_outline_with_old_prompt
 from .sse import sse_response
+from .chunk_util import chunk_document, split_into_sections, estimate_tokens
 
 __all__ = [
     # Config
@@ -24,5 +25,9 @@ __all__ = [
     'generate_outline_prompt',
     'generate_outline_with_old_prompt',
     # SSE
-    'sse_response'
+    'sse_response',
+    # Chunk Util
+    'chunk_document',
+    'split_into_sections',
+    'estimate_tokens'
 ]
\ No newline at end of file
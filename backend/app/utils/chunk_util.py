@@ -0,0 +1,214 @@
+"""文档分块工具 - 按标题层级切分章节并按 token 窗口分块"""
+import re
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple
+
+# Milvus 字段长度限制
+MAX_SECTION_TITLE_LENGTH = 512
+MAX_SUMMARY_LENGTH = 8192
+MAX_TITLE_PATH_LENGTH = 1024
+
+# 标题路径分隔符
+TITLE_PATH_SEPARATOR = " > "
+
+_CN_NUM = "一二三四五六七八九十百千零〇两"
+
+# (模式, 层级)。层级只用于比较先后，数值越小层级越高
+_HEADING_PATTERNS: List[Tuple[re.Pattern, Optional[int]]] = [
+    # Word 标题样式标记（由 FileService 以 "#" 前缀输出）
+    (re.compile(r"^(#{1,6})\s+(?P<title>.+)$"), None),
+    # 第一章 / 第1篇 / 第二部分
+    (re.compile(rf"^(?P<title>第[{_CN_NUM}\d]+(?:章|篇|部分)(?:[\s:：、.．]*\S.*)?)$"), 1),
+    # 第一节
+    (re.compile(rf"^(?P<title>第[{_CN_NUM}\d]+节(?:[\s:：、.．]*\S.*)?)$"), 2),
+    # 一、总体方案
+    (re.compile(rf"^(?P<title>[{_CN_NUM}]+[、.．]\s*\S.*)$"), 3),
+    # （一）施工准备
+    (re.compile(rf"^(?P<title>[（(][{_CN_NUM}]+[)）]\s*\S.*)$"), 4),
+]
+
+# 1.2.3 多级编号，层级 = 4 + 编号段数
+_NUMBERED_HEADING = re.compile(r"^(?P<number>\d{1,3}(?:\.\d{1,3}){0,5})(?:[.．、]|\s)\s*(?P<title>\S.*)$")
+
+# 标题行不会以这些标点结尾
+_SENTENCE_ENDINGS = "。；;，,：:！!？?"
+# 标题行中不会出现这些句内标点
+_SENTENCE_PUNCTUATION = "。；，"
+
+# 章节标题最大长度，超过则视为正文
+MAX_HEADING_LENGTH = 60
+
+# PDF 提取时插入的页码标记
+_PAGE_MARKER = re.compile(r"^-+\s*第\s*\d+\s*页\s*-+$")
+
+_CJK_CHAR = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+_SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?；;\n])")
+
+
+def compute_chunk_id(summary: str, title_path: str) -> str:
+    """内容寻址的分块ID：由规范化的分块正文和标题路径计算
+
+    标题路径去掉根节点（源文件名），修订后的文件改名重新上传时未修改的分块ID不变；
+    正文只合并空白，标点和文字的任何修改都会产生新的ID。
+    """
+    path = str(title_path or "").split(TITLE_PATH_SEPARATOR, 1)
+    relative_path = path[1] if len(path) > 1 else ""
+    text = re.sub(r"\s+", " ", str(summary or "")).strip()
+    return hashlib.sha1(f"{relative_path}\x1f{text}".encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本 token 数：中日韩字符按 1 个 token，其余按约 4 个字符 1 个 token"""
+    cjk_count = len(_CJK_CHAR.findall(text))
+    other_count = len(text) - cjk_count - text.count(" ") - text.count("\n")
+    return cjk_count + max(other_count, 0) // 4 + 1
+
+
+def detect_heading(line: str) -> Optional[Tuple[int, str]]:
+    """识别标题行，返回 (层级, 标题)；不是标题返回 None"""
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_LENGTH * 2:
+        return None
+
+    match = _HEADING_PATTERNS[0][0].match(line)
+    if match:
+        return len(match.group(1)), match.group("title").strip()
+
+    if len(line) > MAX_HEADING_LENGTH or line[-1] in _SENTENCE_ENDINGS:
+        return None
+    if any(mark in line for mark in _SENTENCE_PUNCTUATION):
+        return None
+
+    for pattern, level in _HEADING_PATTERNS[1:]:
+        match = pattern.match(line)
+        if match:
+            return level, match.group("title").strip()
+
+    match = _NUMBERED_HEADING.match(line)
+    if match:
+        number = match.group("number")
+        # 单独的 "1 " 容易误判（如表格数字），要求带分隔符或多级编号
+        if "." not in number and not re.match(r"^\d{1,3}[.．、]", line):
+            return None
+        return 4 + len(number.split(".")), line
+
+    return None
+
+
+def split_into_sections(text: str, root_title: str = "") -> List[Dict[str, Any]]:
+    """按标题层级切分文本
+
+    Args:
+        text: 提取出的文档文本
+        root_title: 根标题（通常为文件名），作为标题路径的起点
+
+    Returns:
+        章节列表，每个章节包含 section_title, title_path, content 字段
+    """
+    sections = []
+    stack: List[Tuple[int, str]] = []
+    current_title = root_title
+    current_lines: List[str] = []
+
+    def flush():
+        content = "\n".join(current_lines).strip()
+        if content:
+            path = [root_title] if root_title else []
+            path += [title for _, title in stack]
+            sections.append({
+                "section_title": current_title,
+                "title_path": TITLE_PATH_SEPARATOR.join(path),
+                "content": content,
+            })
+
+    for line in text.splitlines():
+        if _PAGE_MARKER.match(line.strip()):
+            continue
+        heading = detect_heading(line)
+        if heading is None:
+            current_lines.append(line)
+            continue
+
+        flush()
+        current_lines = []
+        level, title = heading
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, title))
+        current_title = title
+
+    flush()
+    return sections
+
+
+def split_into_windows(content: str, max_tokens: int, overlap_tokens: int) -> List[str]:
+    """按 token 窗口切分正文，优先在句子边界断开，相邻窗口保留重叠"""
+    if estimate_tokens(content) <= max_tokens:
+        return [content]
+
+    # 切分为句子，过长的句子再按字符硬切
+    sentences = []
+    for sentence in _SENTENCE_SPLIT.split(content):
+        if not sentence:
+            continue
+        while estimate_tokens(sentence) > max_tokens:
+            cut = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:]
+        sentences.append(sentence)
+
+    windows = []
+    current: List[str] = []
+    current_tokens = 0
+    for sentence in sentences:
+        sentence_tokens = estimate_tokens(sentence)
+        if current and current_tokens + sentence_tokens > max_tokens:
+            windows.append("".join(current).strip())
+            # 从窗口尾部保留重叠部分
+            overlap: List[str] = []
+            overlap_size = 0
+            for previous in reversed(current):
+                previous_tokens = estimate_tokens(previous)
+                if overlap_size + previous_tokens > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous_tokens
+            current = overlap
+            current_tokens = overlap_size
+        current.append(sentence)
+        current_tokens += sentence_tokens
+
+    if current:
+        tail = "".join(current).strip()
+        if tail and (not windows or tail not in windows[-1]):
+            windows.append(tail)
+    return [window for window in windows if window]
+
+
+def chunk_document(text: str, doc_id: str, source_name: str,
+                   max_tokens: int = 240, overlap_tokens: int = 40) -> List[Dict[str, Any]]:
+    """将文档切分为知识库条目
+
+    Args:
+        text: 提取出的文档文本
+        doc_id: 文档ID，所有分块共用，便于按文档删除
+        source_name: 源文件名，作为标题路径的根
+        max_tokens: 每个分块的最大 token 数
+        overlap_tokens: 相邻分块的重叠 token 数
+
+    Returns:
+        知识库文档列表，每个文档包含 doc_id, section_title, summary, title_path, chunk_id 字段
+    """
+    documents = []
+    for section in split_into_sections(text, root_title=source_name):
+        for window in split_into_windows(section["content"], max_tokens, overlap_tokens):
+            summary = window[:MAX_SUMMARY_LENGTH]
+            title_path = section["title_path"][:MAX_TITLE_PATH_LENGTH]
+            documents.append({
+                "doc_id": doc_id,
+                "section_title": section["section_title"][:MAX_SECTION_TITLE_LENGTH],
+                "summary": summary,
+                "title_path": title_path,
+                "chunk_id": compute_chunk_id(summary, title_path),
+            })
+    return documents
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""对比嵌入模型运行时的吞吐、内存占用以及与全精度模型的余弦一致性
+
+用法（在 backend 目录下运行）：
+    # 导出 ONNX 模型及 int8 量化版本
+    python -m benchmarks.bench_embedding_runtime --export-dir data/embedding_models/all-MiniLM-L6-v2-onnx
+
+    # 对比 torch / int8 / onnx 运行时
+    python -m benchmarks.bench_embedding_runtime --model-path data/embedding_models/all-MiniLM-L6-v2-onnx \\
+        --onnx-file model_quantized.onnx --texts 2000
+"""
+
+import os
+import time
+import argparse
+from typing import List
+
+import numpy as np
+
+from app.config import settings
+from app.services.embedding_runtime import (
+    load_embedding_model, export_onnx_model, OnnxEmbeddingModel, RUNTIME_TORCH, RUNTIME_INT8, RUNTIME_ONNX
+)
+from app.utils.chunk_util import chunk_document
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），读取 /proc/self/statm"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def sample_texts(count: int) -> List[str]:
+    """优先使用知识库中的分块，知识库为空时使用构造的中文段落"""
+    texts: List[str] = []
+    try:
+        from app.services.knowledge_base import knowledge_base
+        for batch in knowledge_base.iter_documents(["summary"]):
+            texts.extend(row["summary"] for row in batch if row.get("summary"))
+            if len(texts) >= count:
+                break
+    except Exception as e:
+        print(f"读取知识库失败，使用构造文本: {e}")
+
+    if len(texts) < count:
+        paragraph = ("本工程施工组织设计依据招标文件和现行规范编制，明确质量、安全、进度目标。"
+                     "项目部建立质量管理体系，落实三检制度，对关键工序实行旁站监理。")
+        text = "\n".join(f"第{i}节 施工措施\n{paragraph * (1 + i % 4)}" for i in range(count))
+        texts.extend(doc["summary"] for doc in chunk_document(text, "bench", "bench.docx"))
+    return texts[:count]
+
+
+def run(name: str, model, texts: List[str], batch_size: int, rss_before: float, reference: np.ndarray = None):
+    model.encode(texts[:batch_size], batch_size=batch_size)  # 预热
+    started_at = time.perf_counter()
+    embeddings = np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    elapsed = time.perf_counter() - started_at
+
+    line = (f"{name:<8} throughput={len(texts) / elapsed:9.1f} texts/s  "
+            f"memory={rss_mb() - rss_before:8.1f}MB")
+    if reference is not None:
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+        cosines = (normalized * reference).sum(axis=1)
+        line += f"  cosine mean={cosines.mean():.4f} min={cosines.min():.4f}"
+    print(line)
+    return embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入模型运行时基准测试")
+    parser.add_argument("--model-name", default=settings.embedding_model_name, help="参考模型名称")
+    parser.add_argument("--model-path", default=settings.embedding_model_path, help="导出的 ONNX 模型目录")
+    parser.add_argument("--onnx-file", default=settings.embedding_onnx_file, help="模型目录中的 ONNX 文件")
+    parser.add_argument("--export-dir", help="只导出 ONNX 模型（含 int8 量化版本）到该目录")
+    parser.add_argument("--texts", type=int, default=1000, help="编码文本数量")
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_max_batch_size, help="批大小")
+    args = parser.parse_args()
+
+    if args.export_dir:
+        export_onnx_model(args.model_name, args.export_dir, quantize=True)
+        return
+
+    texts = sample_texts(args.texts)
+    print(f"文本数: {len(texts)}，批大小: {args.batch_size}")
+
+    rss_before = rss_mb()
+    reference_model = load_embedding_model(RUNTIME_TORCH, args.model_name, args.model_name)
+    reference = run(RUNTIME_TORCH, reference_model, texts, args.batch_size, rss_before)
+    del reference_model
+
+    rss_before = rss_mb()
+    int8_model = load_embedding_model(RUNTIME_INT8, args.model_name, args.model_name)
+    run(RUNTIME_INT8, int8_model, texts, args.batch_size, rss_before, reference)
+    del int8_model
+
+    if args.model_path:
+        rss_before = rss_mb()
+        onnx_model = OnnxEmbeddingModel(args.model_path, onnx_file=args.onnx_file)
+        run(RUNTIME_ONNX, onnx_model, texts, args.batch_size, rss_before, reference)
+    else:
+        print("未指定 --model-path，跳过 ONNX 运行时")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""对比标题过滤向量检索、纯向量检索与混合检索的召回率和延迟
+
+从知识库中随机抽取分块，用 "章节标题 + 正文片段" 作为查询，
+以该分块出现在前 top_k 个结果中计为命中。标题过滤路径即原
+get_reference_sections 的行为（整个章节标题作为 LIKE 关键词）。
+
+用法（在 backend 目录下运行）：
+    python -m benchmarks.bench_hybrid_search --queries 200 --top-k 5
+"""
+
+import time
+import random
+import argparse
+import statistics
+from typing import Callable, Dict, Any, List
+
+from app.services.knowledge_base import knowledge_base
+from app.services.lexical_index import entry_key
+from benchmarks.bench_milvus_search import percentile
+
+
+def sample_queries(count: int, seed: int) -> List[Dict[str, Any]]:
+    """从知识库抽取分块并构造查询"""
+    rows = [row for batch in knowledge_base.iter_documents() for row in batch if row.get("summary")]
+    rng = random.Random(seed)
+    samples = rng.sample(rows, min(count, len(rows)))
+    queries = []
+    for row in samples:
+        summary = row["summary"]
+        start = rng.randrange(0, max(len(summary) - 40, 1))
+        queries.append({
+            "target": entry_key(row),
+            "title": row["section_title"],
+            "query": f"{row['section_title']} {summary[start:start + 40]}",
+        })
+    return queries
+
+
+def evaluate(name: str, run_query: Callable[[Dict[str, Any]], List[Dict[str, Any]]], queries: List[Dict[str, Any]]):
+    latencies = []
+    hits = 0
+    empty = 0
+    for query in queries:
+        started_at = time.perf_counter()
+        results = run_query(query)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        if not results:
+            empty += 1
+        if any(entry_key(result) == query["target"] for result in results):
+            hits += 1
+    print(f"{name:<14} recall={hits / len(queries):6.1%}  empty={empty:4d}  "
+          f"p50={percentile(latencies, 50):8.2f}ms  p99={percentile(latencies, 99):8.2f}ms  "
+          f"mean={statistics.mean(latencies):8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="混合检索基准测试")
+    parser.add_argument("--queries", type=int, default=200, help="查询次数")
+    parser.add_argument("--top-k", type=int, default=5, help="每次返回结果数")
+    parser.add_argument("--seed", type=int, default=0, help="抽样随机种子")
+    args = parser.parse_args()
+
+    queries = sample_queries(args.queries, args.seed)
+    if not queries:
+        print("知识库为空，跳过基准测试")
+        return
+    knowledge_base.ensure_lexical_index(wait=True)
+    print(f"后端: {knowledge_base.backend_name}，查询数: {len(queries)}，"
+          f"词法索引条目: {len(knowledge_base.lexical_index)}")
+
+    # 预热嵌入模型
+    knowledge_base.search("预热", top_k=1)
+
+    evaluate("title-filter", lambda q: knowledge_base.search(q["query"], args.top_k, keyword=q["title"]), queries)
+    evaluate("vector", lambda q: knowledge_base.search(q["query"], args.top_k), queries)
+    evaluate("lexical", lambda q: knowledge_base.lexical_search(f"{q['query']} {q['title']}", args.top_k), queries)
+    evaluate("hybrid", lambda q: knowledge_base.hybrid_search(q["query"], args.top_k, keyword=q["title"]), queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""向量索引参数调优：对比多组索引配置的召回率、延迟和内存
+
+以暴力检索（精确余弦 top-k）为基准，对每组配置构建索引后计算 recall@k、
+单查询 p50/p99 延迟和索引内存，写出 JSON / Markdown 报告，并在召回率
+达到 --min-recall 的配置中推荐 p99 最低的一组（相同时取内存较小者）。
+
+目标：
+    milvus  为每组索引在 Milvus 中创建临时集合 bench_index_tuning_*，测完即删除；
+            内存取查询节点上报的段内存，取不到时按索引类型估算
+    local   进程内评估：FLAT、IVF_FLAT（本地存储的 IVFIndex）、IVF_SQ8（int8 标量
+            量化模拟），安装 hnswlib 时另外评估 HNSW；内存为索引数组大小
+
+语料：
+    kb         对知识库中的分块重新嵌入（默认），知识库为空时退回 synthetic
+    synthetic  按聚类分布构造的随机单位向量
+查询向量从语料中随机留出，不参与建索引。
+
+用法（在 backend 目录下运行）：
+    python -m benchmarks.bench_index_tuning --target local --source synthetic --corpus 50000
+    python -m benchmarks.bench_index_tuning --target milvus --top-k 5 --min-recall 0.95
+"""
+
+import os
+import json
+import math
+import time
+import argparse
+from typing import Callable, Dict, Any, List, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.local_vector_store import IVFIndex
+
+
+# (索引类型, 建索引参数, 待评估的检索参数列表)
+IndexConfig = Tuple[str, Dict[str, Any], List[Dict[str, Any]]]
+
+BENCH_COLLECTION_PREFIX = "bench_index_tuning"
+BENCH_ALIAS = "index_tuning"
+
+
+# ---------------- 语料与基准 ----------------
+def synthetic_corpus(count: int, dimension: int, seed: int, clusters: int = 64) -> np.ndarray:
+    """构造聚类分布的单位向量，比均匀随机向量更接近真实嵌入的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def knowledge_base_corpus(count: int) -> np.ndarray:
+    """读取知识库分块并用当前嵌入模型重新嵌入"""
+    from app.services.knowledge_base import knowledge_base
+
+    texts: List[str] = []
+    for batch in knowledge_base.iter_documents(["summary"]):
+        texts.extend(row["summary"] for row in batch if row.get("summary"))
+        if len(texts) >= count:
+            break
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    texts = texts[:count]
+    print(f"重新嵌入 {len(texts)} 条分块...")
+    embedding_service = knowledge_base.embedding_service
+    vectors = np.concatenate([
+        embedding_service.encode(texts[start:start + 256]) for start in range(0, len(texts), 256)
+    ]).astype(np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def split_queries(vectors: np.ndarray, query_count: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """随机留出查询向量，其余作为建索引的语料"""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    query_count = min(query_count, len(vectors) // 10 or 1)
+    return vectors[order[query_count:]], vectors[order[:query_count]]
+
+
+def brute_force_topk(corpus: np.ndarray, queries: np.ndarray, top_k: int, chunk: int = 256) -> np.ndarray:
+    """精确余弦 top-k（向量已归一化），作为召回率的基准"""
+    results = []
+    for start in range(0, len(queries), chunk):
+        scores = queries[start:start + chunk] @ corpus.T
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        results.append(np.take_along_axis(top, order, axis=1))
+    return np.concatenate(results)
+
+
+def recall_at_k(results: List[List[int]], truth: np.ndarray) -> float:
+    """结果与精确 top-k 的平均重合比例"""
+    top_k = truth.shape[1]
+    return float(np.mean([
+        len(set(result[:top_k]) & set(expected.tolist())) / top_k
+        for result, expected in zip(results, truth)
+    ]))
+
+
+# ---------------- 索引配置 ----------------
+def index_grid(rows: int, top_k: int) -> List[IndexConfig]:
+    """待评估的索引配置，nlist 同时包含当前默认值与 4*sqrt(行数)"""
+    nlists = sorted({settings.milvus_index_params.get("nlist", 128), max(16, int(4 * math.sqrt(rows)))})
+    grid: List[IndexConfig] = [("FLAT", {}, [{}])]
+    for index_type in ("IVF_FLAT", "IVF_SQ8"):
+        for nlist in nlists:
+            probes = sorted({probe for probe in (8, 10, 16, 32, 64) if probe <= nlist})
+            grid.append((index_type, {"nlist": nlist}, [{"nprobe": probe} for probe in probes]))
+    for m in (8, 16, 32):
+        grid.append(("HNSW", {"M": m, "efConstruction": 200},
+                     [{"ef": ef} for ef in (32, 64, 128, 256) if ef >= top_k]))
+    return grid
+
+
+def config_label(index_type: str, index_params: Dict[str, Any], search_params: Dict[str, Any]) -> str:
+    params = ",".join(f"{key}={value}" for key, value in {**index_params, **search_params}.items())
+    return f"{index_type}({params})" if params else index_type
+
+
+def estimate_memory_mb(index_type: str, index_params: Dict[str, Any], rows: int, dimension: int) -> float:
+    """按索引结构估算内存（向量/编码 + 聚类中心或图的邻接表）"""
+    vectors = rows * dimension * 4
+    if index_type == "IVF_SQ8":
+        size = rows * dimension + index_params["nlist"] * dimension * 4 + rows * 8
+    elif index_type == "IVF_FLAT":
+        size = vectors + index_params["nlist"] * dimension * 4 + rows * 8
+    elif index_type == "HNSW":
+        size = vectors + rows * index_params["M"] * 2 * 4
+    else:
+        size = vectors
+    return size / 1024 / 1024
+
+
+def is_current(index_type: str, index_params: Dict[str, Any], search_params: Dict[str, Any]) -> bool:
+    return (index_type == settings.milvus_index_type
+            and index_params == settings.milvus_index_params
+            and search_params == settings.milvus_search_params)
+
+
+def evaluate(index_type: str, index_params: Dict[str, Any], search_params: Dict[str, Any],
+             search: Callable[[np.ndarray], List[int]], queries: np.ndarray, truth: np.ndarray,
+             memory_mb: float, build_seconds: float) -> Dict[str, Any]:
+    """逐条查询计算召回率和延迟"""
+    search(queries[0])  # 预热
+    results, latencies = [], []
+    for query in queries:
+        started_at = time.perf_counter()
+        results.append(list(search(query)))
+        latencies.append((time.perf_counter() - started_at) * 1000)
+
+    row = {
+        "label": config_label(index_type, index_params, search_params),
+        "index_type": index_type,
+        "index_params": index_params,
+        "search_params": search_params,
+        "current": is_current(index_type, index_params, search_params),
+        "recall": round(recall_at_k(results, truth), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "memory_mb": round(memory_mb, 1),
+        "build_seconds": round(build_seconds, 2),
+    }
+    print(f"{row['label']:<36} recall@{truth.shape[1]}={row['recall']:6.3f}  "
+          f"p50={row['p50_ms']:8.2f}ms  p99={row['p99_ms']:8.2f}ms  "
+          f"mem={row['memory_mb']:8.1f}MB  build={row['build_seconds']:6.2f}s")
+    return row
+
+
+# ---------------- 本地评估 ----------------
+def _top_ids(scores: np.ndarray, ids: np.ndarray, top_k: int) -> List[int]:
+    if len(scores) > top_k:
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        top = np.arange(len(scores))
+    return ids[top[np.argsort(-scores[top])]].tolist()
+
+
+def run_local(corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+              grid: List[IndexConfig], top_k: int) -> List[Dict[str, Any]]:
+    rows, dimension = corpus.shape
+    all_ids = np.arange(rows)
+    results = []
+    for index_type, index_params, search_list in grid:
+        started_at = time.perf_counter()
+        if index_type == "FLAT":
+            results.append(evaluate(
+                index_type, index_params, {}, lambda q: _top_ids(corpus @ q, all_ids, top_k),
+                queries, truth, corpus.nbytes / 1024 / 1024, 0.0
+            ))
+            continue
+
+        if index_type == "HNSW":
+            try:
+                import hnswlib
+            except ImportError:
+                print(f"未安装 hnswlib，跳过 {config_label(index_type, index_params, {})}")
+                continue
+            index = hnswlib.Index(space="cosine", dim=dimension)
+            index.init_index(max_elements=rows, M=index_params["M"], ef_construction=index_params["efConstruction"])
+            index.add_items(corpus, all_ids)
+            build_seconds = time.perf_counter() - started_at
+            memory_mb = estimate_memory_mb(index_type, index_params, rows, dimension)
+            for search_params in search_list:
+                index.set_ef(search_params["ef"])
+                results.append(evaluate(
+                    index_type, index_params, search_params,
+                    lambda q: index.knn_query(q, k=top_k)[0][0].tolist(),
+                    queries, truth, memory_mb, build_seconds
+                ))
+            continue
+
+        index = IVFIndex(index_params["nlist"], nprobe=1)
+        index.build(corpus, all_ids)
+        scored = corpus
+        memory = corpus.nbytes
+        if index_type == "IVF_SQ8":
+            # 按维度做 int8 标量量化，检索时在反量化的向量上打分
+            low, high = corpus.min(axis=0), corpus.max(axis=0)
+            scale = np.maximum(high - low, 1e-12) / 255
+            codes = np.round((corpus - low) / scale).astype(np.uint8)
+            scored = codes.astype(np.float32) * scale + low
+            memory = codes.nbytes + low.nbytes + scale.nbytes
+        memory += index.centroids.nbytes + rows * 8
+        build_seconds = time.perf_counter() - started_at
+
+        for search_params in search_list:
+            index.nprobe = search_params["nprobe"]
+
+            def search(query, index=index, scored=scored):
+                candidates = index.candidates(query)
+                return _top_ids(scored[candidates] @ query, candidates, top_k)
+
+            results.append(evaluate(
+                index_type, index_params, search_params, search,
+                queries, truth, memory / 1024 / 1024, build_seconds
+            ))
+    return results
+
+
+# ---------------- Milvus 评估 ----------------
+def run_milvus(corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+               grid: List[IndexConfig], top_k: int, uri: str) -> List[Dict[str, Any]]:
+    from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+
+    rows, dimension = corpus.shape
+    connections.connect(alias=BENCH_ALIAS, uri=uri)
+    schema = CollectionSchema([
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dimension),
+    ], description="索引参数调优临时集合")
+
+    results = []
+    for position, (index_type, index_params, search_list) in enumerate(grid):
+        name = f"{BENCH_COLLECTION_PREFIX}_{position}"
+        if utility.has_collection(name, using=BENCH_ALIAS):
+            utility.drop_collection(name, using=BENCH_ALIAS)
+        collection = Collection(name=name, schema=schema, using=BENCH_ALIAS)
+        try:
+            for start in range(0, rows, 5000):
+                collection.insert([list(range(start, min(start + 5000, rows))),
+                                   corpus[start:start + 5000].tolist()])
+            collection.flush()
+
+            started_at = time.perf_counter()
+            collection.create_index(field_name="embedding", index_params={
+                "index_type": index_type, "metric_type": "COSINE", "params": index_params
+            })
+            utility.wait_for_index_building_complete(name, using=BENCH_ALIAS)
+            collection.load()
+            build_seconds = time.perf_counter() - started_at
+
+            try:
+                segments = utility.get_query_segment_info(name, using=BENCH_ALIAS)
+                memory_mb = sum(segment.mem_size for segment in segments) / 1024 / 1024
+            except Exception as e:
+                print(f"读取段内存失败，改用估算值: {e}")
+                memory_mb = 0
+            memory_mb = memory_mb or estimate_memory_mb(index_type, index_params, rows, dimension)
+
+            for search_params in search_list:
+                param = {"metric_type": "COSINE", "params": search_params}
+
+                def search(query, param=param):
+                    hits = collection.search(data=[query.tolist()], anns_field="embedding", param=param, limit=top_k)
+                    return [hit.id for hit in hits[0]]
+
+                results.append(evaluate(
+                    index_type, index_params, search_params, search,
+                    queries, truth, memory_mb, build_seconds
+                ))
+        finally:
+            collection.release()
+            utility.drop_collection(name, using=BENCH_ALIAS)
+    connections.disconnect(BENCH_ALIAS)
+    return results
+
+
+# ---------------- 推荐与报告 ----------------
+def recommend(results: List[Dict[str, Any]], min_recall: float) -> Dict[str, Any]:
+    """召回率达标的配置中取 p99 最低者（相同时内存较小），都不达标时取召回率最高者"""
+    eligible = [row for row in results if row["recall"] >= min_recall]
+    if eligible:
+        return min(eligible, key=lambda row: (row["p99_ms"], row["memory_mb"]))
+    return max(results, key=lambda row: (row["recall"], -row["p99_ms"]))
+
+
+def recommended_settings(row: Dict[str, Any]) -> Dict[str, str]:
+    """推荐配置对应的 .env 设置"""
+    # 本地存储只支持精确检索和 IVF_FLAT 形式的倒排索引
+    if row["index_type"] == "IVF_FLAT":
+        local = {"LOCAL_STORE_INDEX": "ivf", "LOCAL_STORE_NLIST": str(row["index_params"]["nlist"]),
+                 "LOCAL_STORE_NPROBE": str(row["search_params"]["nprobe"])}
+    elif row["index_type"] == "FLAT":
+        local = {"LOCAL_STORE_INDEX": "flat"}
+    else:
+        local = {}
+    return {
+        "MILVUS_INDEX_TYPE": row["index_type"],
+        "MILVUS_INDEX_PARAMS": json.dumps(row["index_params"]),
+        "MILVUS_SEARCH_PARAMS": json.dumps(row["search_params"]),
+        **local,
+    }
+
+
+def write_report(output_dir: str, meta: Dict[str, Any], results: List[Dict[str, Any]],
+                 best: Dict[str, Any], env: Dict[str, str]) -> Tuple[str, str]:
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, "index_tuning.json")
+    markdown_path = os.path.join(output_dir, "index_tuning.md")
+
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({**meta, "results": results, "recommended": best, "env": env}, f, ensure_ascii=False, indent=2)
+
+    top_k = meta["top_k"]
+    lines = [
+        "# 向量索引参数调优报告",
+        "",
+        f"- 目标: {meta['target']}，语料: {meta['source']}，{meta['rows']} 条 × {meta['dimension']} 维",
+        f"- 查询数: {meta['queries']}，top_k: {top_k}，召回率要求: {meta['min_recall']}",
+        "",
+        f"| 配置 | recall@{top_k} | p50 (ms) | p99 (ms) | 内存 (MB) | 建索引 (s) |",
+        "| --- | --- | --- | --- | --- | --- |",
+    ]
+    for row in results:
+        marks = "".join([" **推荐**" if row is best else "", " (当前)" if row["current"] else ""])
+        lines.append(f"| {row['label']}{marks} | {row['recall']:.3f} | {row['p50_ms']:.2f} | "
+                     f"{row['p99_ms']:.2f} | {row['memory_mb']:.1f} | {row['build_seconds']:.2f} |")
+    lines += ["", "## 推荐配置（.env）", "", "```"] + [f"{key}={value}" for key, value in env.items()] + ["```", ""]
+    if best["recall"] < meta["min_recall"]:
+        lines.append(f"> 没有配置达到召回率要求 {meta['min_recall']}，推荐的是召回率最高的配置。")
+    with open(markdown_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return json_path, markdown_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引参数调优基准测试")
+    parser.add_argument("--target", choices=["milvus", "local"], default="local", help="评估目标")
+    parser.add_argument("--source", choices=["kb", "synthetic"], default="kb", help="语料来源")
+    parser.add_argument("--corpus", type=int, default=20000, help="语料条数上限（synthetic 为构造条数）")
+    parser.add_argument("--dimension", type=int, default=384, help="synthetic 语料的向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="留出的查询数")
+    parser.add_argument("--top-k", type=int, default=5, help="recall@k 的 k")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="推荐配置需达到的召回率")
+    parser.add_argument("--uri", default=settings.milvus_uri, help="Milvus 服务地址")
+    parser.add_argument("--output", default=os.path.join(settings.data_dir, "index_tuning"), help="报告输出目录")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    source = args.source
+    vectors = knowledge_base_corpus(args.corpus) if source == "kb" else np.zeros((0, 0), dtype=np.float32)
+    if len(vectors) < 100:
+        if source == "kb":
+            print(f"知识库分块不足（{len(vectors)} 条），改用构造语料")
+        source = "synthetic"
+        vectors = synthetic_corpus(args.corpus, args.dimension, args.seed)
+
+    corpus, queries = split_queries(vectors, args.queries, args.seed)
+    truth = brute_force_topk(corpus, queries, args.top_k)
+    grid = index_grid(len(corpus), args.top_k)
+    print(f"目标: {args.target}，语料: {source}，{corpus.shape[0]} 条 × {corpus.shape[1]} 维，查询数: {len(queries)}")
+
+    if args.target == "milvus":
+        results = run_milvus(corpus, queries, truth, grid, args.top_k, args.uri)
+    else:
+        results = run_local(corpus, queries, truth, grid, args.top_k)
+
+    best = recommend(results, args.min_recall)
+    env = recommended_settings(best)
+    meta = {
+        "target": args.target, "source": source, "rows": int(corpus.shape[0]), "dimension": int(corpus.shape[1]),
+        "queries": int(len(queries)), "top_k": args.top_k, "min_recall": args.min_recall,
+    }
+    json_path, markdown_path = write_report(args.output, meta, results, best, env)
+
+    print(f"\n推荐配置: {best['label']}  recall@{args.top_k}={best['recall']:.3f}  p99={best['p99_ms']:.2f}ms")
+    for key, value in env.items():
+        print(f"    {key}={value}")
+    print(f"报告已写入: {markdown_path}，{json_path}")
+
+
+if __name__ == "__main__":
+    main()
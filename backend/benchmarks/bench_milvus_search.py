@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""对比每次查询重建集合句柄与使用长连接句柄的检索延迟
+
+用法（在 backend 目录下运行，需要可访问的 Milvus 服务）：
+    python -m benchmarks.bench_milvus_search --queries 200 --top-k 5
+"""
+
+import time
+import argparse
+import statistics
+from typing import Callable, List
+
+import numpy as np
+from pymilvus import Collection
+
+from app.services.knowledge_base import knowledge_base
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name: str, run_query: Callable[[List[float]], None], vectors: np.ndarray) -> List[float]:
+    latencies = []
+    for vector in vectors:
+        started_at = time.perf_counter()
+        run_query(vector.tolist())
+        latencies.append((time.perf_counter() - started_at) * 1000)
+    print(f"{name:<12} p50={percentile(latencies, 50):8.2f}ms  "
+          f"p99={percentile(latencies, 99):8.2f}ms  mean={statistics.mean(latencies):8.2f}ms")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus 检索句柄基准测试")
+    parser.add_argument("--queries", type=int, default=200, help="查询次数")
+    parser.add_argument("--top-k", type=int, default=5, help="每次返回结果数")
+    args = parser.parse_args()
+
+    if knowledge_base.backend_name != "milvus":
+        print("当前知识库后端不是 Milvus，跳过基准测试")
+        return
+
+    embedding_field = next(f for f in knowledge_base.collection.schema.fields if f.name == "embedding")
+    dimension = embedding_field.params["dim"]
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.queries, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    search_kwargs = dict(
+        anns_field="embedding",
+        param=knowledge_base.search_params,
+        limit=args.top_k,
+        output_fields=['doc_id', 'section_title', 'summary', 'title_path'],
+    )
+
+    def per_query_handle(vector):
+        # 旧实现：每次查询新建句柄、检查索引并加载集合
+        collection = Collection(name=knowledge_base.collection_name)
+        _ = collection.indexes
+        collection.load()
+        collection.search(data=[vector], **search_kwargs)
+
+    def cached_handle(vector):
+        knowledge_base.collection.search(data=[vector], **search_kwargs)
+
+    # 预热
+    cached_handle(vectors[0].tolist())
+
+    print(f"集合: {knowledge_base.collection_name}，查询次数: {args.queries}")
+    before = measure("per-query", per_query_handle, vectors)
+    after = measure("cached", cached_handle, vectors)
+    print(f"p50 降低 {percentile(before, 50) - percentile(after, 50):.2f}ms，"
+          f"p99 降低 {percentile(before, 99) - percentile(after, 99):.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试知识库导入的章节切分与分块"""
+
+from app.utils.chunk_util import (
+    chunk_document, split_into_sections, split_into_windows, estimate_tokens, compute_chunk_id
+)
+
+SAMPLE_TEXT = """投标文件说明
+--- 第 1 页 ---
+第一章 总体方案
+本项目采用分阶段实施的方式。
+1.1 项目概况
+项目位于某市高新区，总建筑面积约五万平方米。
+1.1.1 建设内容
+包括主体结构、机电安装和室外工程。
+1.2 实施计划
+计划工期为365日历天。
+第二章 质量保证措施
+一、质量管理体系
+建立三级质量管理网络。
+# 附录
+附件清单如下。
+"""
+
+
+def test_split_by_heading_hierarchy():
+    """按 第X章 / 1.2.3 编号 / 一、 / Word 标题样式切分，并生成标题路径"""
+    sections = split_into_sections(SAMPLE_TEXT, root_title="样例标书.docx")
+    titles = [section["section_title"] for section in sections]
+    assert titles == ["样例标书.docx", "第一章 总体方案", "1.1 项目概况", "1.1.1 建设内容",
+                      "1.2 实施计划", "一、质量管理体系", "附录"]
+
+    paths = {section["section_title"]: section["title_path"] for section in sections}
+    assert paths["1.1.1 建设内容"] == "样例标书.docx > 第一章 总体方案 > 1.1 项目概况 > 1.1.1 建设内容"
+    assert paths["1.2 实施计划"] == "样例标书.docx > 第一章 总体方案 > 1.2 实施计划"
+    assert paths["一、质量管理体系"] == "样例标书.docx > 第二章 质量保证措施 > 一、质量管理体系"
+
+    # 页码标记不进入正文
+    assert all("第 1 页" not in section["content"] for section in sections)
+
+
+def test_sentences_are_not_headings():
+    """以句号结尾或过长的编号行视为正文"""
+    text = "第一章 概述\n1. 本章介绍项目背景。\n2、施工单位应当按照合同约定完成全部工作内容，并接受监理单位和建设单位的监督检查"
+    sections = split_into_sections(text, "a.pdf")
+    assert [section["section_title"] for section in sections] == ["第一章 概述"]
+    assert "2、施工单位" in sections[0]["content"]
+
+
+def test_windows_respect_token_budget_with_overlap():
+    """长章节按 token 窗口切分，相邻窗口有重叠"""
+    content = "".join(f"第{i}句内容用于测试分块窗口。" for i in range(60))
+    windows = split_into_windows(content, max_tokens=50, overlap_tokens=15)
+    assert len(windows) > 1
+    assert all(estimate_tokens(window) <= 50 for window in windows)
+    # 重叠：下一个窗口以上一个窗口的结尾句开头
+    assert windows[1].split("。")[0] in windows[0]
+
+
+def test_chunk_document_fields():
+    """分块共用 doc_id，并填充真实的章节标题和路径"""
+    documents = chunk_document(SAMPLE_TEXT, doc_id="doc_1", source_name="样例标书.docx")
+    assert {doc["doc_id"] for doc in documents} == {"doc_1"}
+    assert documents[1]["section_title"] == "第一章 总体方案"
+    assert documents[1]["summary"] == "本项目采用分阶段实施的方式。"
+
+
+def test_chunk_id_is_content_addressed():
+    """分块ID只取决于正文和去掉文件名的标题路径"""
+    documents = chunk_document(SAMPLE_TEXT, doc_id="doc_1", source_name="样例标书.docx")
+    renamed = chunk_document(SAMPLE_TEXT, doc_id="doc_2", source_name="样例标书-修订.docx")
+    assert [doc["chunk_id"] for doc in documents] == [doc["chunk_id"] for doc in renamed]
+    assert len({doc["chunk_id"] for doc in documents}) == len(documents)
+    path = "a.docx > 第一章 > 1.1 概况"
+    assert compute_chunk_id("本项目  采用\n分阶段", path) == compute_chunk_id("本项目 采用 分阶段", path)
+    assert compute_chunk_id("本项目采用分阶段。", path) != compute_chunk_id("本项目采用分阶段；", path)
+
+
+if __name__ == "__main__":
+    test_split_by_heading_hierarchy()
+    test_sentences_are_not_headings()
+    test_windows_respect_token_budget_with_overlap()
+    test_chunk_document_fields()
+    test_chunk_id_is_content_addressed()
+    print("✅ 分块测试通过")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试导入去重：精确重复、近重复、分组作用域与链接持久化"""
+
+import os
+import tempfile
+
+from app.services.dedup_index import DedupIndex, DUPLICATE_EXACT, DUPLICATE_NEAR
+
+PARAGRAPH = ("本工程施工组织设计依据招标文件和现行规范编制，明确质量、安全、进度目标。"
+             "项目部建立质量管理体系，落实三检制度，对关键工序实行旁站监理，"
+             "隐蔽工程经监理验收合格后方可进入下道工序。")
+
+
+def _chunk(doc_id, summary, group="投标文件", title="施工方案"):
+    return {"doc_id": doc_id, "section_title": title, "summary": summary,
+            "title_path": f"{doc_id}.docx/{title}", "group": group}
+
+
+def _scope(document):
+    return document.get("group") or ""
+
+
+def _index(links_file, scope="group"):
+    index = DedupIndex(links_file, enabled=True, scope=scope, threshold=0.8, num_perm=64, bands=16, shingle_size=5)
+    index.ensure_built(lambda: [], _scope)
+    return index
+
+
+def test_exact_and_near_duplicates():
+    with tempfile.TemporaryDirectory() as data_dir:
+        index = _index(os.path.join(data_dir, "links.jsonl"))
+        kept, duplicates = index.check([_chunk("doc_a", PARAGRAPH), _chunk("doc_a", "工期计划", title="进度")], _scope)
+        assert len(kept) == 2 and not duplicates
+
+        edited = PARAGRAPH + "严格执行。"  # 轻微修改
+        kept, duplicates = index.check([
+            _chunk("doc_b", "  " + PARAGRAPH.replace("，", ",") + "\n"),  # 只有空白和标点不同
+            _chunk("doc_b", edited),
+            _chunk("doc_b", "安全文明施工措施与应急预案"),
+        ], _scope)
+        assert [kind for _, _, kind in duplicates] == [DUPLICATE_EXACT, DUPLICATE_NEAR]
+        assert [document["summary"] for document in kept] == ["安全文明施工措施与应急预案"]
+
+        # 其他分组中的相同内容不去重
+        kept, duplicates = index.check([_chunk("doc_c", PARAGRAPH, group="技术标")], _scope)
+        assert len(kept) == 1 and not duplicates
+
+
+def test_global_scope_deduplicates_across_groups():
+    with tempfile.TemporaryDirectory() as data_dir:
+        index = _index(os.path.join(data_dir, "links.jsonl"), scope="global")
+        index.check([_chunk("doc_a", PARAGRAPH)], _scope)
+        kept, duplicates = index.check([_chunk("doc_b", PARAGRAPH, group="技术标")], _scope)
+        assert not kept and len(duplicates) == 1
+
+
+def test_links_persist_and_orphans_returned():
+    with tempfile.TemporaryDirectory() as data_dir:
+        links_file = os.path.join(data_dir, "links.jsonl")
+        index = _index(links_file)
+        index.check([_chunk("doc_a", PARAGRAPH)], _scope)
+        index.check([_chunk("doc_b", PARAGRAPH)], _scope)
+        index.check([_chunk("doc_c", PARAGRAPH)], _scope)
+
+        # 重新加载后链接仍在，全部被去重的文档可以取到分块信息
+        reloaded = _index(links_file)
+        assert set(reloaded.linked_documents(["doc_b", "doc_c", "doc_x"])) == {"doc_b", "doc_c"}
+
+        # 链接方文档删除只移除链接；被链接文档删除时返回剩余的重复分块
+        assert reloaded.remove_documents(["doc_b"]) == []
+        orphans = reloaded.remove_documents(["doc_a"])
+        assert [[document["doc_id"] for document, _ in links] for links in orphans] == [["doc_c"]]
+        assert _index(links_file).linked_documents(["doc_b", "doc_c"]) == {}
+
+
+if __name__ == "__main__":
+    test_exact_and_near_duplicates()
+    test_global_scope_deduplicates_across_groups()
+    test_links_persist_and_orphans_returned()
+    print("✅ 导入去重测试通过")
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """测试删除单个文档"""
 
-from app.services.milvus_service import knowledge_base
+from app.services.knowledge_base import knowledge_base
 
 def test_delete_single_document():
     """测试删除单个文档"""
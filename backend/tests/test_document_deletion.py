@@ -2,10 +2,11 @@
 # -*- coding: utf-8 -*-
 """测试文档删除功能的协调性"""
 
-import json
 import requests
 import time
 
+from app.services.knowledge_group_manager import KnowledgeGroupManager
+
 BASE_URL = "http://localhost:8000/api/knowledge-base"
 
 def test_document_deletion_coordination():
@@ -22,12 +23,10 @@ def test_document_deletion_coordination():
     initial_count = response.json().get("stats", {}).get("document_count", 0)
     print(f"初始文档数量: {initial_count}")
     
-    # 2. 检查knowledge_groups.json中的文档引用
-    print("\n2. 检查knowledge_groups.json中的文档引用...")
-    groups_file_path = "data/knowledge_groups.json"
+    # 2. 检查分组数据库中的文档引用
+    print("\n2. 检查分组数据库中的文档引用...")
     try:
-        with open(groups_file_path, "r", encoding="utf-8") as f:
-            groups_data = json.load(f)
+        groups_data = KnowledgeGroupManager().export_data()
         
         print("当前分组和文档:")
         for group_name, doc_ids in groups_data.get("group_documents", {}).items():
@@ -49,7 +48,7 @@ def test_document_deletion_coordination():
         print(f"\n选择测试文档ID: {test_doc_id}")
         
     except Exception as e:
-        print(f"读取groups文件失败: {str(e)}")
+        print(f"读取分组数据失败: {str(e)}")
         return False
     
     # 3. 调用删除文档的API
@@ -74,11 +73,10 @@ def test_document_deletion_coordination():
     final_count = response.json().get("stats", {}).get("document_count", 0)
     print(f"删除后的文档数量: {final_count}")
     
-    # 5. 再次检查knowledge_groups.json中的文档引用
-    print("\n5. 再次检查knowledge_groups.json中的文档引用...")
+    # 5. 再次检查分组数据库中的文档引用
+    print("\n5. 再次检查分组数据库中的文档引用...")
     try:
-        with open(groups_file_path, "r", encoding="utf-8") as f:
-            groups_data = json.load(f)
+        groups_data = KnowledgeGroupManager().export_data()
         
         print("删除后的分组和文档:")
         doc_still_exists = False
@@ -90,13 +88,13 @@ def test_document_deletion_coordination():
                     doc_still_exists = True
         
         if doc_still_exists:
-            print("错误: 文档仍然存在于knowledge_groups.json中")
+            print("错误: 文档仍然存在于分组数据库中")
             return False
         else:
-            print("文档已从knowledge_groups.json中移除")
+            print("文档已从分组数据库中移除")
             
     except Exception as e:
-        print(f"读取groups文件失败: {str(e)}")
+        print(f"读取分组数据失败: {str(e)}")
         return False
     
     # 6. 验证文档数量是否减少
@@ -107,7 +105,7 @@ def test_document_deletion_coordination():
         return False
     
     print("\n🎉 文档删除的协调性测试通过!")
-    print("结论: 删除文档时，Milvus中的数据和knowledge_groups.json中的引用都被正确删除")
+    print("结论: 删除文档时，Milvus中的数据和分组数据库中的引用都被正确删除")
     return True
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试嵌入缓存的命中、持久化、淘汰和失效"""
+
+import tempfile
+
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_service import EmbeddingService
+
+
+def _vectors(count: int, dim: int = 4) -> np.ndarray:
+    return np.arange(count * dim, dtype=np.float32).reshape(count, dim)
+
+
+def test_hit_and_persistence():
+    """写入后可命中，重新打开后仍可从磁盘命中"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=10, disk_entries=10)
+        cache.put_many(["技术方案", "施工组织"], _vectors(2))
+
+        # 规范化后相同的文本命中同一条目
+        hits = cache.get_many(["技术方案", "  施工组织 ", "质量保证"])
+        assert np.array_equal(hits[0], _vectors(2)[0])
+        assert np.array_equal(hits[1], _vectors(2)[1])
+        assert hits[2] is None
+
+        reopened = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=10, disk_entries=10)
+        assert np.array_equal(reopened.get_many(["施工组织"])[0], _vectors(2)[1])
+        assert reopened.stats()["disk_hits"] == 1
+
+
+def test_disk_eviction():
+    """超出磁盘容量时淘汰最早写入的条目"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=1, disk_entries=3)
+        cache.put_many([f"文本{i}" for i in range(4)], _vectors(4))
+
+        assert cache.stats()["disk_entries"] == 3
+        assert cache.stats()["disk_evictions"] == 1
+        assert cache.get_many(["文本0"])[0] is None
+        assert np.array_equal(cache.get_many(["文本3"])[0], _vectors(4)[3])
+
+
+def test_invalidation_on_model_or_dimension_change():
+    """模型名称或维度变化时缓存失效"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=10, disk_entries=10)
+        cache.put_many(["技术方案"], _vectors(1))
+
+        other_model = EmbeddingCache("model-b", cache_dir=cache_dir, memory_entries=10, disk_entries=10)
+        assert other_model.dimension is None
+        assert other_model.get_many(["技术方案"])[0] is None
+        # 每个模型使用独立的子目录，其他模型的缓存不受影响
+        reopened = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=10, disk_entries=10)
+        assert reopened.get_many(["技术方案"])[0] is not None
+
+        cache = EmbeddingCache("model-b", cache_dir=cache_dir, memory_entries=10, disk_entries=10)
+        cache.put_many(["技术方案"], _vectors(1))
+        cache.bind_dimension(8)
+        assert cache.get_many(["技术方案"])[0] is None
+
+
+def test_slot_overwritten_by_other_process():
+    """其他进程覆盖了本进程索引中的槽位时按未命中处理，写入位置从元数据同步"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=1, disk_entries=2)
+        first.put_many(["文本0", "文本1"], _vectors(2))
+        second = EmbeddingCache("model-a", cache_dir=cache_dir, memory_entries=1, disk_entries=2)
+        second.put_many(["文本2"], _vectors(3)[2:])
+
+        first.get_many(["文本1"])  # 把文本0挤出内存LRU
+        assert first.get_many(["文本0"])[0] is None
+        assert np.array_equal(first.get_many(["文本1"])[0], _vectors(2)[1])
+
+        # 第一个进程继续写入时从第二个进程之后的槽位开始
+        first.put_many(["文本3"], _vectors(4)[3:])
+        assert np.array_equal(second.get_many(["文本2"])[0], _vectors(3)[2])
+
+
+def test_onnx_files_use_separate_model_ids():
+    """不同 ONNX 模型文件（全精度 / 量化）的模型标识不同，缓存分开存放"""
+    fp32 = EmbeddingService(runtime="onnx", use_cache=False, onnx_file="model.onnx")
+    int8 = EmbeddingService(runtime="onnx", use_cache=False, onnx_file="onnx/model_quantized.onnx")
+    torch = EmbeddingService(runtime="torch", use_cache=False, onnx_file="onnx/model_quantized.onnx")
+    assert fp32.model_id != int8.model_id
+    assert "model_quantized" in int8.model_id
+    assert torch.model_id == torch.model_name
+
+
+if __name__ == "__main__":
+    test_hit_and_persistence()
+    test_disk_eviction()
+    test_invalidation_on_model_or_dimension_change()
+    test_slot_overwritten_by_other_process()
+    test_onnx_files_use_separate_model_ids()
+    print("✅ 嵌入缓存测试通过")
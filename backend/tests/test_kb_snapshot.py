@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试知识库快照：导出、校验与不重新嵌入的恢复"""
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+from app.services.kb_snapshot import KnowledgeBaseSnapshots, VECTORS_FILE
+from app.services.knowledge_group_manager import KnowledgeGroupManager
+from app.services.local_vector_store import LocalKnowledgeBase
+
+
+class CountingEncoder:
+    """按关键词生成确定性向量并记录编码次数，恢复快照时不应调用"""
+
+    model_name = "keyword-encoder"
+    KEYWORDS = ["施工", "质量", "安全", "进度"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        vectors = np.full((len(texts), len(self.KEYWORDS)), 0.01, dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, keyword in enumerate(self.KEYWORDS):
+                if keyword in text:
+                    vectors[row, column] = 1.0
+        return vectors
+
+    def encode_one(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def _setup(data_dir):
+    store = LocalKnowledgeBase(store_dir=os.path.join(data_dir, "store"), embedding_service=CountingEncoder())
+    groups_file = os.path.join(data_dir, "knowledge_groups.json")
+    with open(groups_file, 'w', encoding='utf-8') as f:
+        json.dump({"groups": [{"name": "投标文件", "description": ""}],
+                   "group_documents": {"投标文件": ["doc_a", "doc_b"]}}, f, ensure_ascii=False)
+    group_manager = KnowledgeGroupManager(os.path.join(data_dir, "knowledge_groups.db"), groups_file)
+    snapshots = KnowledgeBaseSnapshots(store, os.path.join(data_dir, "snapshots"), group_manager)
+    return store, snapshots, group_manager
+
+
+def _documents():
+    return [
+        {"doc_id": "doc_a", "section_title": "施工方案", "summary": "施工组织设计与施工部署", "title_path": "a.docx/施工方案", "group": "投标文件"},
+        {"doc_id": "doc_a", "section_title": "质量保证", "summary": "质量管理体系与三检制度", "title_path": "a.docx/质量", "group": "投标文件"},
+        {"doc_id": "doc_b", "section_title": "安全文明施工", "summary": "安全生产管理与应急预案", "title_path": "b.docx/安全", "group": "投标文件"},
+        {"doc_id": "doc_b", "section_title": "质量保证", "summary": "质量管理体系与三检制度", "title_path": "b.docx/质量", "group": "投标文件"},
+    ]
+
+
+def test_export_and_restore_round_trip():
+    """恢复后条目、检索结果、分组映射与去重链接一致，且不调用嵌入模型"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        store, snapshots, group_manager = _setup(data_dir)
+        store.add_documents(_documents())
+        before = [(hit["doc_id"], hit["section_title"]) for hit in store.search("安全施工", top_k=3)]
+
+        for dtype in ("float32", "float16"):
+            manifest = snapshots.export(f"snap-{dtype}", dtype=dtype)
+            assert manifest["rows"] == 3 and manifest["dimension"] == 4 and manifest["linked_chunks"] == 1
+        assert {manifest["name"] for manifest in snapshots.list_snapshots()} == {"snap-float32", "snap-float16"}
+
+        store.clear_all_documents()
+        group_manager.remove_documents_from_groups(["doc_a", "doc_b"])
+        group_manager.add_group("临时分组")
+        calls = store.embedding_service.calls
+        result = snapshots.restore("snap-float16")
+
+        assert result["rows"] == 3 and store.embedding_service.calls == calls
+        assert store.get_document_count() == 3
+        assert [(hit["doc_id"], hit["section_title"]) for hit in store.search("安全施工", top_k=3)] == before
+        assert set(store.linked_documents(["doc_b"])) == {"doc_b"}
+        assert group_manager.export_data()["group_documents"] == {"投标文件": ["doc_a", "doc_b"]}
+        assert store.iter_embeddings().__next__()[0][0]["group"] == "投标文件"
+
+
+def test_group_scoped_lexical_search_after_restore():
+    """恢复后的词法索引条目保留分组范围，按分组的词法检索与混合检索结果与恢复前一致"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        store, snapshots, _ = _setup(data_dir)
+        store.add_documents(_documents())
+        store.ensure_lexical_index(wait=True)
+        before = store.lexical_search("质量管理", top_k=5, wait=True, groups=["投标文件"])
+        assert len(before) == 2
+        snapshots.export("snap")
+
+        store.clear_all_documents()
+        snapshots.restore("snap")
+
+        after = store.lexical_search("质量管理", top_k=5, wait=True, groups=["投标文件"])
+        assert [(hit["doc_id"], hit["section_title"]) for hit in after] == \
+            [(hit["doc_id"], hit["section_title"]) for hit in before]
+        assert store.lexical_search("质量管理", top_k=5, wait=True, groups=["其他分组"]) == []
+        hybrid = store.hybrid_search("质量管理", top_k=3, groups=["投标文件"])
+        assert any("lexical_score" in hit for hit in hybrid)
+
+
+def test_corrupted_snapshot_rejected_before_clearing():
+    """校验失败时不清空知识库"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        store, snapshots, _ = _setup(data_dir)
+        store.add_documents(_documents())
+        snapshots.export("snap")
+        with open(os.path.join(snapshots.snapshot_dir, "snap", VECTORS_FILE), 'r+b') as f:
+            f.write(b"\x00\x00\x00\x00")
+
+        try:
+            snapshots.restore("snap")
+            assert False, "损坏的快照应被拒绝"
+        except ValueError:
+            pass
+        assert store.get_document_count() == 3
+
+        try:
+            snapshots.export("../snap")
+            assert False, "非法的快照名称应被拒绝"
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_export_and_restore_round_trip()
+    test_group_scoped_lexical_search_after_restore()
+    test_corrupted_snapshot_rejected_before_clearing()
+    print("✅ 知识库快照测试通过")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试分组存储：旧分组文件导入、正向/反向索引、批量归属操作与多进程（多连接）写入"""
+
+import os
+import json
+import tempfile
+import threading
+
+from app.services import knowledge_group_manager as group_manager_module
+from app.services.knowledge_group_manager import KnowledgeGroupManager
+
+
+def _write_groups_file(data_dir: str) -> str:
+    groups_file = os.path.join(data_dir, "knowledge_groups.json")
+    with open(groups_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            "groups": [{"name": "未分类", "description": "默认分组"}, {"name": "投标文件", "description": "历史标书"}],
+            "group_documents": {"投标文件": ["doc_c", "doc_a", "doc_b"], "未分类": []},
+        }, f, ensure_ascii=False)
+    return groups_file
+
+
+def test_import_legacy_file_once():
+    """首次启动导入旧分组文件并保持顺序，之后不再重复导入"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        groups_file = _write_groups_file(data_dir)
+        db_file = os.path.join(data_dir, "knowledge_groups.db")
+        manager = KnowledgeGroupManager(db_file, groups_file)
+
+        assert manager.get_groups() == ["未分类", "投标文件"]
+        assert manager.get_documents_by_group("投标文件") == ["doc_c", "doc_a", "doc_b"]
+        assert manager.get_all_groups()[1] == {"name": "投标文件", "description": "历史标书", "document_count": 3}
+
+        manager.remove_document_from_group("doc_a")
+        reopened = KnowledgeGroupManager(db_file, groups_file)
+        assert reopened.get_documents_by_group("投标文件") == ["doc_c", "doc_b"]
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = KnowledgeGroupManager(os.path.join(data_dir, "knowledge_groups.db"),
+                                        os.path.join(data_dir, "missing.json"))
+        assert manager.get_groups() == ["未分类"]
+
+
+def test_membership_operations():
+    """归属增删在事务中批量执行，重复添加被忽略，成员判断走索引"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        manager = KnowledgeGroupManager(os.path.join(data_dir, "knowledge_groups.db"), _write_groups_file(data_dir))
+
+        assert manager.add_group("投标文件") is False
+        assert manager.add_documents_to_group("新分组", ["doc_x", "doc_y", "doc_x"]) == 2
+        assert manager.add_documents_to_group("新分组", ["doc_y", "doc_z"]) == 1
+        assert manager.get_groups()[-1] == "新分组"
+        assert manager.has_document("新分组", "doc_z") and not manager.has_document("投标文件", "doc_z")
+
+        manager.add_document_to_group("投标文件", "doc_x")
+        assert manager.get_document_groups("doc_x") == ["投标文件", "新分组"]
+        assert manager.remove_documents_from_groups(["doc_x", "doc_a", "doc_missing"]) == 3
+        assert manager.get_document_groups("doc_x") == []
+        assert manager.get_documents_by_group("新分组") == ["doc_y", "doc_z"]
+
+        exported = manager.export_data()
+        assert exported["group_documents"]["投标文件"] == ["doc_c", "doc_b"]
+        assert manager.delete_group("未分类") and not manager.delete_group("未分类")
+        manager.import_data(exported)
+        assert manager.export_data() == exported
+
+
+def test_concurrent_writers():
+    """多个管理器实例（模拟多个 worker）并发写入同一个数据库不丢失数据"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        db_file = os.path.join(data_dir, "knowledge_groups.db")
+        groups_file = os.path.join(data_dir, "missing.json")
+        managers = [KnowledgeGroupManager(db_file, groups_file) for _ in range(4)]
+
+        def upload(worker: int):
+            for index in range(50):
+                managers[worker].add_document_to_group("投标文件", f"doc_{worker}_{index}")
+
+        threads = [threading.Thread(target=upload, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 每个实例都看到其他实例提交的写入
+        assert all(len(manager.get_documents_by_group("投标文件")) == 200 for manager in managers)
+        # 其他实例的写入按变更日志增量应用，不全量重新加载
+        reloads = []
+        reload = managers[3]._reload
+        managers[3]._reload = lambda: reloads.append(1) or reload()
+        managers[0].remove_document_from_group("doc_3_0")
+        managers[1].add_documents_to_group("新分组", ["doc_new"])
+        assert not managers[3].has_document("投标文件", "doc_3_0")
+        assert managers[3].get_all_groups()[-2]["document_count"] == 199
+        assert managers[3].get_document_groups("doc_new") == ["新分组"]
+        assert reloads == []
+
+        # 整体替换后全量重新加载
+        managers[2].import_data({"groups": [{"name": "投标文件"}], "group_documents": {"投标文件": ["doc_x"]}})
+        assert managers[3].get_documents_by_group("投标文件") == ["doc_x"] and reloads == [1]
+
+
+def test_delete_group_blocks_concurrent_adds():
+    """分组先标记为正在删除：删除期间其他实例不能再向该分组添加文档，删除后不留下归属"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        db_file = os.path.join(data_dir, "knowledge_groups.db")
+        manager = KnowledgeGroupManager(db_file, _write_groups_file(data_dir))
+        other = KnowledgeGroupManager(db_file, _write_groups_file(data_dir))
+        deleted = []
+
+        class FakeKnowledgeBase:
+            def delete_documents(self, doc_ids):
+                deleted.extend(doc_ids)
+                try:
+                    other.add_document_to_group("投标文件", "doc_late")
+                except ValueError:
+                    deleted.append("rejected")
+
+            def drop_group(self, group_name):
+                deleted.append(f"drop:{group_name}")
+
+        original = group_manager_module.knowledge_base
+        group_manager_module.knowledge_base = FakeKnowledgeBase()
+        try:
+            assert manager.delete_group("投标文件")
+        finally:
+            group_manager_module.knowledge_base = original
+
+        assert deleted == ["doc_c", "doc_a", "doc_b", "rejected", "drop:投标文件"]
+        assert other.get_groups() == ["未分类"] and other.get_document_groups("doc_a") == []
+        assert other.add_documents_to_group("投标文件", ["doc_new"]) == 1
+
+
+if __name__ == "__main__":
+    test_import_legacy_file_once()
+    test_membership_operations()
+    test_concurrent_writers()
+    test_delete_group_blocks_concurrent_adds()
+    print("✅ 分组存储测试通过")
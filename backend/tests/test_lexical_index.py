@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试 BM25 词法索引与倒数排名融合"""
+
+from app.services.lexical_index import LexicalIndex, tokenize, reciprocal_rank_fusion
+
+
+def _ready_index(documents):
+    index = LexicalIndex()
+    index.begin_build()
+    index.load(documents)
+    index.finish_build()
+    return index
+
+
+def _documents():
+    return [
+        {"doc_id": "doc_a", "section_title": "施工组织设计", "summary": "总体施工部署和施工进度计划", "title_path": "a.docx"},
+        {"doc_id": "doc_b", "section_title": "质量保证措施", "summary": "建立质量管理体系，落实三检制度", "title_path": "b.docx"},
+        {"doc_id": "doc_c", "section_title": "安全文明施工", "summary": "安全生产责任制与文明施工措施", "title_path": "c.docx"},
+    ]
+
+
+def test_tokenize():
+    """中文切分为二元组，英文数字按词切分"""
+    assert tokenize("质量体系 BIM-3.0") == ["质量", "量体", "体系", "bim-3.0"]
+    assert tokenize("量") == ["量"]
+
+
+def test_bm25_search_and_incremental_updates():
+    """正文与标题均可召回，增量删除后不再返回"""
+    index = _ready_index(_documents())
+
+    results = index.search("质量管理", top_k=3)
+    assert results[0]["doc_id"] == "doc_b"
+    assert index.search("三检制度", top_k=1)[0]["doc_id"] == "doc_b"
+
+    index.delete_documents(["doc_b"])
+    assert all(result["doc_id"] != "doc_b" for result in index.search("质量管理", top_k=3))
+
+    index.add_documents([{"doc_id": "doc_d", "section_title": "进度计划", "summary": "关键线路与工期保证", "title_path": "d.docx"}])
+    assert index.search("工期", top_k=1)[0]["doc_id"] == "doc_d"
+
+
+def test_updates_during_build_are_replayed():
+    """构建期间的删除在构建完成后重放，不会留下已删除的条目"""
+    index = LexicalIndex()
+    index.begin_build()
+    index.delete_documents(["doc_a"])
+    index.load(_documents())
+    index.finish_build()
+    assert len(index) == 2
+    assert all(result["doc_id"] != "doc_a" for result in index.search("施工", top_k=3))
+
+
+def test_reciprocal_rank_fusion():
+    """两路都命中的条目排在只被一路命中的条目之前"""
+    documents = _documents()
+    vector_hits = [{**documents[0], "score": 0.9}, {**documents[1], "score": 0.8}]
+    lexical_hits = [{**documents[1], "score": 5.0}, {**documents[2], "score": 3.0}]
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits], top_k=3)
+    assert [result["doc_id"] for result in fused] == ["doc_b", "doc_a", "doc_c"]
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_bm25_search_and_incremental_updates()
+    test_updates_during_build_are_replayed()
+    test_reciprocal_rank_fusion()
+    print("✅ 词法索引测试通过")
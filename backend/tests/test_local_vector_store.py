@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试本地向量存储的增删查与持久化"""
+
+import tempfile
+
+import numpy as np
+
+from app.services.local_vector_store import LocalKnowledgeBase
+from app.utils.chunk_util import compute_chunk_id
+
+
+class KeywordEncoder:
+    """按关键词生成确定性向量的测试编码器"""
+
+    model_name = "keyword-encoder"
+    KEYWORDS = ["施工", "质量", "安全", "进度"]
+
+    def encode(self, texts):
+        vectors = np.full((len(texts), len(self.KEYWORDS)), 0.01, dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, keyword in enumerate(self.KEYWORDS):
+                if keyword in text:
+                    vectors[row, column] = 1.0
+        return vectors
+
+    def encode_one(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def _open_store(store_dir: str) -> LocalKnowledgeBase:
+    return LocalKnowledgeBase(store_dir=store_dir, embedding_service=KeywordEncoder())
+
+
+def _documents():
+    return [
+        {"doc_id": "doc_a", "section_title": "施工方案", "summary": "施工组织设计", "title_path": "a.docx/施工方案"},
+        {"doc_id": "doc_b", "section_title": "质量保证措施", "summary": "质量管理体系", "title_path": "b.docx/质量"},
+        {"doc_id": "doc_c", "section_title": "安全文明施工", "summary": "安全生产管理", "title_path": "c.docx/安全"},
+    ]
+
+
+def test_search_and_keyword_filter():
+    """余弦检索返回最相似的文档，关键词过滤章节标题"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+
+        results = store.search("质量", top_k=2)
+        assert results[0]["doc_id"] == "doc_b"
+        assert len(results) == 2
+
+        results = store.search("安全", top_k=5, keyword="施工")
+        assert {result["doc_id"] for result in results} == {"doc_a", "doc_c"}
+        assert results[0]["doc_id"] == "doc_c"
+
+
+def test_delete_and_persistence():
+    """删除后不再返回，重新打开后数据保持一致"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+        store.delete_document("doc_b")
+        assert store.get_document_count() == 2
+        assert store.get_document_by_id("doc_b") is None
+
+        reopened = _open_store(store_dir)
+        assert reopened.get_document_count() == 2
+        assert reopened.get_document_by_id("doc_a", fields=["doc_id", "section_title"]) == {
+            "doc_id": "doc_a", "section_title": "施工方案"
+        }
+        assert all(result["doc_id"] != "doc_b" for result in reopened.search("质量", top_k=3))
+
+
+
+def test_batch_fetch_and_delete():
+    """按 doc_id 列表批量查询和删除"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+
+        documents = store.get_documents_by_ids(["doc_a", "doc_c", "missing"], fields=["doc_id", "section_title"])
+        assert documents == {
+            "doc_a": {"doc_id": "doc_a", "section_title": "施工方案"},
+            "doc_c": {"doc_id": "doc_c", "section_title": "安全文明施工"},
+        }
+
+        store.delete_documents(["doc_a", "doc_c", "missing"])
+        assert store.get_document_count() == 1
+        assert list(_open_store(store_dir).get_documents_by_ids(["doc_a", "doc_b", "doc_c"])) == ["doc_b"]
+
+
+
+def test_hybrid_search():
+    """混合检索融合向量与词法结果，入库后词法索引增量更新"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+        store.ensure_lexical_index(wait=True)
+
+        # 关键词不再作为过滤条件，"管理体系" 只能由词法检索命中
+        results = store.hybrid_search("管理体系", top_k=3, keyword="质量保证措施")
+        assert results[0]["doc_id"] == "doc_b"
+        assert "lexical_score" in results[0]
+
+        store.add_documents([{"doc_id": "doc_d", "section_title": "进度计划", "summary": "工期保证措施", "title_path": "d.docx"}])
+        assert store.lexical_search("工期", top_k=1)[0]["doc_id"] == "doc_d"
+        store.delete_document("doc_d")
+        assert store.lexical_search("工期", top_k=1) == []
+
+
+def test_hybrid_search_scoped_by_groups_and_level():
+    """混合检索的词法结果同样按分组和粒度过滤，词法检索出错时只使用向量结果"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        documents = _documents()
+        store.add_documents([{**documents[0], "group": "客户甲"}, {**documents[1], "group": "客户乙"}, documents[2]])
+        store.ensure_lexical_index(wait=True)
+
+        assert {r["doc_id"] for r in store.hybrid_search("管理体系", top_k=5, groups=["客户甲"])} == {"doc_a"}
+        assert store.lexical_search("管理体系", top_k=5, groups=["客户甲"]) == []
+        store.assign_groups({"客户甲": ["doc_b"]})
+        assert [r["doc_id"] for r in store.lexical_search("管理体系", top_k=5, groups=["客户甲"])] == ["doc_b"]
+
+        long_summary = "施工组织设计。" * 40 + "质量控制流程。" * 40
+        store.add_documents([{"doc_id": "doc_long", "section_title": "技术标", "summary": long_summary, "title_path": "long.docx"}])
+        assert any(r["doc_id"] == "doc_long" for r in store.lexical_search("质量控制流程", top_k=10))
+        assert all(r["doc_id"] != "doc_long" for r in store.lexical_search("质量控制流程", top_k=10, level="coarse"))
+
+        def failing_search(*args, **kwargs):
+            raise RuntimeError("索引损坏")
+
+        store.lexical_index.search = failing_search
+        results = store.hybrid_search("质量", top_k=2)
+        assert results[0]["doc_id"] == "doc_b" and "lexical_score" not in results[0]
+
+
+def test_search_cache_invalidated_by_writes():
+    """重复检索命中缓存，写入后不返回旧结果"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+
+        first = store.search("进度", top_k=5)
+        assert store.search("进度", top_k=5) == first
+        assert store.search_cache.hits == 1
+
+        store.add_documents([{"doc_id": "doc_d", "section_title": "进度计划", "summary": "进度保证措施", "title_path": "d.docx"}])
+        assert store.search("进度", top_k=1)[0]["doc_id"] == "doc_d"
+        store.delete_document("doc_d")
+        assert all(result["doc_id"] != "doc_d" for result in store.search("进度", top_k=5))
+        store.clear_all_documents()
+        assert store.search("进度", top_k=5) == []
+        assert store.search_cache.hits == 1
+
+
+def test_batch_search_matches_single_queries():
+    """批量检索与逐条检索结果一致，重复的查询命中缓存"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+
+        queries = ["质量", "安全", "施工", "质量"]
+        batch_results = store.batch_search(queries, top_k=2)
+        assert len(batch_results) == len(queries)
+        assert [results[0]["doc_id"] for results in batch_results] == ["doc_b", "doc_c", "doc_a", "doc_b"]
+        assert batch_results[1] == store.search("安全", top_k=2)
+        assert store.batch_search([], top_k=2) == []
+
+
+def test_group_scoped_search():
+    """按分组检索只返回这些分组的文档，旧数据同步分组后持久化"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        documents = _documents()
+        store.add_documents([{**documents[0], "group": "客户甲"}, {**documents[1], "group": "客户乙"}])
+        store.add_documents([documents[2]])
+
+        assert [r["doc_id"] for r in store.search("施工", top_k=5, groups=["客户甲"])] == ["doc_a"]
+        assert store.search("安全", top_k=5, groups=["客户丙"]) == []
+        assert len(store.search("施工", top_k=5)) == 3
+
+        assert store.assign_groups({"客户甲": ["doc_c", "doc_x"]}) == 1
+        assert {r["doc_id"] for r in store.search("安全", top_k=5, groups=["客户甲"])} == {"doc_a", "doc_c"}
+
+        reopened = _open_store(store_dir)
+        assert {r["doc_id"] for r in reopened.search("安全", top_k=5, groups=["客户甲"])} == {"doc_a", "doc_c"}
+        assert "group" not in reopened.get_document_by_id("doc_c")
+
+
+
+def test_duplicate_chunks_linked_and_promoted():
+    """重复分块不插入；被链接的文档删除后重复分块重新插入"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        documents = _documents()
+        store.add_documents([{**document, "group": "客户甲"} for document in documents])
+
+        copies = [{**document, "doc_id": "doc_copy", "group": "客户甲"} for document in documents[:2]]
+        result = store.add_documents(copies)
+        assert result["deduplicated"] == 2 and result["exact_duplicates"] == 2
+        assert store.get_document_count() == 3
+        assert store.linked_documents(["doc_copy"])["doc_copy"]["doc_id"] == "doc_copy"
+
+        store.delete_document("doc_a")
+        reopened = _open_store(store_dir)
+        assert reopened.get_document_by_id("doc_copy")["summary"] == "施工组织设计"
+        assert reopened.add_documents([{**documents[1], "doc_id": "doc_other", "group": "客户甲"}])["deduplicated"] == 1
+
+
+
+def test_upsert_embeds_only_changed_chunks():
+    """增量更新只嵌入新增分块，删除消失的分块，重复执行无变化"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        encoded = []
+        encode = store.embedding_service.encode
+        store.embedding_service.encode = lambda texts: encoded.extend(texts) or encode(texts)
+
+        original = [{**document, "doc_id": "doc_bid", "title_path": f"v1.docx > {document['section_title']}"}
+                    for document in _documents()]
+        store.add_documents(original)
+        encoded.clear()
+
+        # 修订版改了文件名、修改一个分块、删除一个分块
+        revised = [{**document, "title_path": document["title_path"].replace("v1.docx", "v2.docx")}
+                   for document in original[:2]]
+        revised[1] = {**revised[1], "summary": "质量管理体系及质量控制流程"}
+        result = store.upsert_document("doc_bid", revised)
+        assert (result["added"], result["deleted"], result["unchanged"]) == (1, 2, 1)
+        assert encoded == ["质量管理体系及质量控制流程"]
+        assert sorted(r["summary"] for r in store._document_chunks("doc_bid")) == ["施工组织设计", "质量管理体系及质量控制流程"]
+        assert {r["doc_id"] for r in store.search("安全", top_k=5)} == {"doc_bid"}
+        assert all(r["summary"] != "安全生产管理" for r in store.search("安全", top_k=5))
+
+        encoded.clear()
+        assert store.upsert_document("doc_bid", revised)["added"] == 0
+        assert encoded == []
+        reopened = _open_store(store_dir)
+        assert reopened.get_document_count() == 2
+
+
+class FailingEncoder(KeywordEncoder):
+    def encode(self, texts):
+        raise AssertionError("相似章节检索不应重新编码")
+
+
+def test_similar_documents_use_stored_vectors():
+    """以已存储向量检索相似章节：不调用嵌入模型，排除自身，支持分组与分块，向量按代数缓存"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents([
+            *_documents(),
+            {"doc_id": "doc_d", "section_title": "施工安全", "summary": "施工安全措施", "title_path": "d.docx/安全",
+             "group": "客户甲"},
+            {"doc_id": "doc_a", "section_title": "进度计划", "summary": "进度安排", "title_path": "a.docx/进度"},
+        ])
+        store.embedding_service = FailingEncoder()
+
+        results = store.similar_documents("doc_c", top_k=2)
+        assert [r["doc_id"] for r in results][0] == "doc_d" and all(r["doc_id"] != "doc_c" for r in results)
+        assert [r["doc_id"] for r in store.similar_documents("doc_c", top_k=5, groups=["客户甲"])] == ["doc_d"]
+
+        schedule = compute_chunk_id("进度安排", "a.docx/进度")
+        assert store.similar_documents("doc_a", top_k=1, chunk_id=schedule)[0]["doc_id"] != "doc_a"
+        assert store.similar_documents("doc_a", chunk_id="missing") is None
+        assert store.similar_documents("doc_x") is None
+
+        fetched = []
+        fetch = store._fetch_embeddings
+        store._fetch_embeddings = lambda doc_id: fetched.append(doc_id) or fetch(doc_id)
+        store.similar_documents("doc_c")
+        assert fetched == []  # 命中缓存
+        store.delete_document("doc_b")
+        store.similar_documents("doc_c")
+        assert fetched == ["doc_c"]  # 写入后缓存失效
+
+
+def test_reference_embeddings_use_stored_vectors():
+    """参考资料打包使用已存储的候选向量，只编码查询和找不到的候选"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+        encoded = []
+        encode = store.embedding_service.encode
+        store.embedding_service.encode = lambda texts: encoded.extend(texts) or encode(texts)
+
+        candidates = store.search("质量", top_k=2) + [{"doc_id": "doc_x", "summary": "进度安排"}]
+        encoded.clear()
+        query, vectors = store.reference_embeddings("质量", candidates)
+        assert encoded == ["质量", "进度安排"]
+        assert vectors.shape == (3, 4) and np.argmax(vectors[0]) == 1
+
+
+def test_long_entries_split_into_windows_and_pooled_vector():
+    """超长条目拆成窗口条目和池化文档条目：一次编码，fine 检索窗口，coarse 检索整体"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        calls = []
+        encode = store.embedding_service.encode
+        store.embedding_service.encode = lambda texts: calls.append(list(texts)) or encode(texts)
+
+        # 质量内容位于模型输入长度之后，整体编码时会被截断
+        long_summary = "施工组织设计。" * 40 + "质量控制流程。" * 40
+        result = store.add_documents([
+            {"doc_id": "doc_long", "section_title": "技术标", "summary": long_summary, "title_path": "long.docx"},
+            {"doc_id": "doc_b", "section_title": "质量保证措施", "summary": "质量管理体系", "title_path": "b.docx"},
+        ])
+        assert len(calls) == 1 and long_summary not in calls[0]
+        assert result["deduplicated"] == 0 and store.get_document_count() > 3
+
+        fine = store.search("质量", top_k=10)
+        assert all(r["summary"] != long_summary for r in fine)
+        assert any(r["doc_id"] == "doc_long" and "质量" in r["summary"] for r in fine)
+        coarse = store.search("质量", top_k=10, level="coarse")
+        assert [r["doc_id"] for r in coarse] == ["doc_b", "doc_long"]
+        assert coarse[1]["summary"] == long_summary
+        assert all(r["summary"] != long_summary for r in store.lexical_search("质量控制", top_k=10))
+
+        # 重新上传相同内容不产生变化
+        calls.clear()
+        upserted = store.upsert_document("doc_long", [{"section_title": "技术标", "summary": long_summary,
+                                                       "title_path": "long.docx"}])
+        assert upserted["added"] == 0 and calls == []
+
+
+def test_ivf_built_outside_lock_and_model_checked():
+    """IVF 索引在后台构建后换入，结果与精确检索一致；换用其他嵌入模型时拒绝加载已有存储"""
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = _open_store(store_dir)
+        store.add_documents(_documents())
+        exact = store._search_by_embedding(store.embedding_service.encode_one("质量"), top_k=1)
+
+        store.index_type, store.ivf_min_rows = "ivf", 1
+        store._search_by_embedding(store.embedding_service.encode_one("质量"), top_k=3)
+        store._ivf_thread.join()
+        assert store.status()["index_type"] == "ivf"
+        store.add_documents([{"doc_id": "doc_d", "section_title": "进度计划", "summary": "进度安排", "title_path": "d.docx"}])
+        assert store._search_by_embedding(store.embedding_service.encode_one("质量"), top_k=1) == exact
+        assert store.search("进度", top_k=1)[0]["doc_id"] == "doc_d"
+
+        class OtherEncoder(KeywordEncoder):
+            model_name = "other-encoder"
+
+        try:
+            LocalKnowledgeBase(store_dir=store_dir, embedding_service=OtherEncoder())
+        except ValueError as e:
+            assert "other-encoder" in str(e)
+        else:
+            raise AssertionError("嵌入模型不一致时应拒绝加载")
+
+
+if __name__ == "__main__":
+    test_search_and_keyword_filter()
+    test_delete_and_persistence()
+    test_batch_fetch_and_delete()
+    test_hybrid_search()
+    test_hybrid_search_scoped_by_groups_and_level()
+    test_search_cache_invalidated_by_writes()
+    test_batch_search_matches_single_queries()
+    test_group_scoped_search()
+    test_duplicate_chunks_linked_and_promoted()
+    test_upsert_embeds_only_changed_chunks()
+    test_similar_documents_use_stored_vectors()
+    test_reference_embeddings_use_stored_vectors()
+    test_long_entries_split_into_windows_and_pooled_vector()
+    test_ivf_built_outside_lock_and_model_checked()
+    print("✅ 本地向量存储测试通过")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试参考资料打包：MMR 去冗余与 token 预算"""
+
+import numpy as np
+
+from app.services.reference_packer import ReferencePacker, REFERENCE_HEADER
+from app.utils.chunk_util import estimate_tokens
+
+QUERY = [1.0, 1.0, 0.0]
+
+
+def _candidates():
+    return [
+        {"doc_id": "doc_a", "section_title": "质量保证", "summary": "质量管理体系与三检制度" * 3, "title_path": "a.docx/质量"},
+        {"doc_id": "doc_b", "section_title": "质量保证", "summary": "质量管理体系和三检制度" * 3, "title_path": "b.docx/质量"},
+        {"doc_id": "doc_c", "section_title": "安全文明", "summary": "安全生产责任制与应急预案" * 3, "title_path": "c.docx/安全"},
+        {"doc_id": "doc_d", "section_title": "进度计划", "summary": "", "title_path": "d.docx/进度"},
+    ]
+
+
+def _embeddings():
+    # doc_a 与 doc_b 几乎相同，doc_c 相关性略低但提供不同内容
+    return np.array([[1.0, 0.9, 0.0], [1.0, 0.91, 0.0], [1.0, 0.0, 0.6], [0.0, 0.0, 1.0]], dtype=np.float32)
+
+
+def test_mmr_drops_redundant_candidates():
+    """近重复候选被丢弃，多样的候选被选入"""
+    packer = ReferencePacker(token_budget=1000, mmr_lambda=0.7, redundancy_threshold=0.95, max_references=3)
+    packed = packer.pack(QUERY, _candidates(), _embeddings())
+
+    assert [reference["doc_id"] for reference in packed["references"]] == ["doc_b", "doc_c"]
+    assert packed["redundant"] == 1 and packed["candidates"] == 4
+    assert packed["text"].startswith(REFERENCE_HEADER) and "参考2" in packed["text"]
+    assert 0 < packed["tokens"] <= packed["budget"]
+
+
+def test_token_budget_limits_packed_references():
+    """放不进预算的候选被跳过，用量不超过预算"""
+    budget = 70
+    packer = ReferencePacker(token_budget=budget, mmr_lambda=0.7, redundancy_threshold=0.95, max_references=3)
+    packed = packer.pack(QUERY, _candidates(), _embeddings())
+
+    assert len(packed["references"]) == 1
+    assert 0 < packed["tokens"] <= budget
+    assert estimate_tokens(packed["text"]) <= budget
+
+    empty = packer.pack(QUERY, _candidates()[3:], _embeddings()[3:])
+    assert empty["references"] == [] and empty["text"] == "" and empty["tokens"] == 0
+    # 没有可选内容的打包同样计入统计
+    assert packer.stats()["packed"] == 2 and packer.stats()["references_avg"] == 0.5
+
+
+if __name__ == "__main__":
+    test_mmr_drops_redundant_candidates()
+    test_token_budget_limits_packed_references()
+    print("✅ 参考资料打包测试通过")
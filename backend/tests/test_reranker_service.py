@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试重排序服务的排序与时间预算回退"""
+
+import time
+
+from app.services.reranker_service import RerankerService
+
+
+class OverlapCrossEncoder:
+    """按查询与候选的字符重合数打分的测试模型"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def predict(self, pairs, batch_size=8):
+        time.sleep(self.delay)
+        return [len(set(query) & set(text)) for query, text in pairs]
+
+
+def _candidates():
+    return [
+        {"doc_id": "doc_a", "section_title": "施工组织", "summary": "总体部署", "score": 0.9},
+        {"doc_id": "doc_b", "section_title": "质量保证", "summary": "质量管理体系", "score": 0.8},
+        {"doc_id": "doc_c", "section_title": "安全文明", "summary": "安全生产", "score": 0.7},
+    ]
+
+
+def _service(delay: float = 0.0, budget_ms: float = 500) -> RerankerService:
+    service = RerankerService(enabled=True, batch_size=1, budget_ms=budget_ms)
+    service._model = OverlapCrossEncoder(delay)
+    return service
+
+
+def test_rerank_orders_by_cross_encoder_score():
+    """按交叉编码器分数重新排序并截取 top_k"""
+    results = _service().rerank("质量管理体系", _candidates(), top_k=2)
+    assert [result["doc_id"] for result in results] == ["doc_b", "doc_a"]
+    assert "rerank_score" in results[0]
+
+
+def test_rerank_falls_back_when_budget_exceeded():
+    """超出时间预算时按原检索顺序返回"""
+    service = _service(delay=0.05, budget_ms=60)
+    results = service.rerank("质量管理体系", _candidates(), top_k=2)
+    assert [result["doc_id"] for result in results] == ["doc_a", "doc_b"]
+    assert "rerank_score" not in results[0]
+    assert service.stats()["fallbacks"] == 1
+
+
+def test_rerank_disabled_keeps_order():
+    """未启用时直接截取前 top_k 个候选"""
+    service = RerankerService(enabled=False)
+    assert [result["doc_id"] for result in service.rerank("质量", _candidates(), top_k=1)] == ["doc_a"]
+
+
+class FailingCrossEncoder:
+    def predict(self, pairs, batch_size=8):
+        raise RuntimeError("临时错误")
+
+
+class SlowLoadingService(RerankerService):
+    """后台加载测试模型的重排序服务"""
+
+    def __init__(self, model):
+        super().__init__(enabled=True, batch_size=1, budget_ms=500)
+        self.loaded_model = model
+
+    def _load_model(self):
+        time.sleep(0.05)
+        if isinstance(self.loaded_model, Exception):
+            raise self.loaded_model
+        return self.loaded_model
+
+
+def test_model_loaded_outside_budget_and_errors_not_sticky():
+    """模型在后台加载，加载前使用检索顺序；打分出错不停用，加载失败才停用"""
+    service = SlowLoadingService(OverlapCrossEncoder())
+    assert [r["doc_id"] for r in service.rerank("质量管理体系", _candidates(), top_k=2)] == ["doc_a", "doc_b"]
+    service._loading.join()
+    assert service.rerank("质量管理体系", _candidates(), top_k=2)[0]["doc_id"] == "doc_b"
+
+    service._model = FailingCrossEncoder()
+    assert service.rerank("质量管理体系", _candidates(), top_k=2)[0]["doc_id"] == "doc_a"
+    assert service.available and service.load_error is None
+
+    broken = SlowLoadingService(OSError("模型不存在"))
+    broken.rerank("质量", _candidates())
+    broken._loading.join()
+    assert not broken.available and "模型不存在" in broken.load_error
+
+
+if __name__ == "__main__":
+    test_rerank_orders_by_cross_encoder_score()
+    test_rerank_falls_back_when_budget_exceeded()
+    test_rerank_disabled_keeps_order()
+    test_model_loaded_outside_budget_and_errors_not_sticky()
+    print("✅ 重排序服务测试通过")
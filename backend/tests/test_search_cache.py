@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试检索结果缓存的代数失效、TTL 与 LRU 淘汰"""
+
+import os
+import time
+import tempfile
+
+from app.services.search_cache import SearchCache
+
+
+def test_generation_invalidates_entries():
+    """检索期间发生写入时结果不缓存，写入后旧条目失效"""
+    cache = SearchCache(max_entries=8, ttl_seconds=60, enabled=True)
+    key = cache.make_key([0.1, 0.2], top_k=5, filter_expr="施工")
+    assert key != cache.make_key([0.1, 0.2], top_k=5)
+
+    generation = cache.generation
+    cache.put(key, [{"doc_id": "a", "score": 0.9}], generation, latency_ms=12.0)
+    assert cache.get(key) == [{"doc_id": "a", "score": 0.9}]
+    assert cache.stats()["saved_ms"] == 12.0
+
+    cache.bump()
+    assert cache.get(key) is None
+
+    # 检索开始后发生写入，旧代数的结果不会被缓存
+    generation = cache.generation
+    cache.bump()
+    cache.put(key, [{"doc_id": "a", "score": 0.9}], generation, latency_ms=12.0)
+    assert cache.get(key) is None
+
+
+def test_ttl_and_lru_eviction():
+    cache = SearchCache(max_entries=2, ttl_seconds=0.05, enabled=True)
+    keys = [cache.make_key([float(i)], top_k=3) for i in range(3)]
+    for key in keys:
+        cache.put(key, [], cache.generation, latency_ms=1.0)
+    assert cache.get(keys[0]) is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(keys[2]) == []
+
+    time.sleep(0.06)
+    assert cache.get(keys[2]) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_generation_shared_across_processes():
+    """代数文件共享时，另一个进程（实例）的写入使本实例缓存的结果失效"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        generation_file = os.path.join(data_dir, "search_generation")
+        worker_a = SearchCache(max_entries=8, ttl_seconds=60, enabled=True, generation_file=generation_file)
+        worker_b = SearchCache(max_entries=8, ttl_seconds=60, enabled=True, generation_file=generation_file)
+        key = worker_a.make_key([0.1, 0.2], top_k=5)
+
+        worker_a.put(key, [{"doc_id": "a"}], worker_a.generation, latency_ms=5.0)
+        assert worker_a.get(key) == [{"doc_id": "a"}]
+        worker_b.bump()
+        assert worker_a.get(key) is None and worker_a.stats()["stale"] == 1
+        assert worker_a.generation == worker_b.generation == 1
+        assert worker_a.seconds_since_bump() < 5
+
+
+if __name__ == "__main__":
+    test_generation_invalidates_entries()
+    test_ttl_and_lru_eviction()
+    test_generation_shared_across_processes()
+    print("✅ 检索结果缓存测试通过")
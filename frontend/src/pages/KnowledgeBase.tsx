@@ -233,22 +233,30 @@ const KnowledgeBase: React.FC = () => {
         return;
       }
       
-      // 调用API上传文件
-      await knowledgeBaseApi.uploadDocumentToGroup(selectedGroup, uploadedFile);
+      // 调用API上传文件，后端返回导入任务ID
+      const response = await knowledgeBaseApi.uploadDocumentToGroup(selectedGroup, uploadedFile);
+      const jobId: string = response.data.job_id;
       
-      // 延迟更长时间后重新加载，确保后端已完成文件处理和索引
-      setTimeout(async () => {
-        // 重新加载分组列表以更新文档计数
-        await loadGroups();
-        
-        // 重新加载文档
-        await loadDocuments(selectedGroup);
-      }, 2000); // 2000毫秒延迟，增加到足够时间确保后端处理完成
+      // 轮询导入任务，直到分块嵌入和分组登记完成
+      let job = response.data.job;
+      while (job.status !== 'completed' && job.status !== 'failed') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        job = (await knowledgeBaseApi.getIngestionJob(jobId)).data.job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || '文件导入失败');
+      }
+      
+      // 重新加载分组列表以更新文档计数
+      await loadGroups();
+      
+      // 重新加载文档
+      await loadDocuments(selectedGroup);
       
       // 重置文件输入
       event.target.value = '';
       
-      setSuccess('文件上传成功');
+      setSuccess(`文件上传成功，共 ${job.chunk_count} 个章节分块`);
     } catch (err) {
       const errorMsg = err instanceof Error ? err.message : '文件上传失败';
       setError(`文件上传失败: ${errorMsg}`);
@@ -230,6 +230,10 @@ export const knowledgeBaseApi = {
       }
     });
   },
+
+  // 查询文件导入任务状态
+  getIngestionJob: (jobId: string) =>
+    api.get(`/api/knowledge-base/jobs/${jobId}`),
 };
 
 export default api;
\ No newline at end of file